@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for scripts/validate_catalog.py.
+
+Commands:
+    loaders     Time each available YAML loader (libyaml C loader and the
+                pure-Python loader) on a synthetic catalog and check that both
+                produce the same documents and validate_document diagnostics.
+    throughput  Generate a synthetic catalog on disk and measure validation
+                throughput: files/s, entities/s, peak RSS and the time split
+                across YAML parsing, validate_document, validate_relations and
+                graph analysis. Results can be written as JSON (--output) and
+                compared against an earlier run (--compare) to catch
+                regressions between commits.
+    rules       Time check_document with the policy it used to hardcode,
+                compiled from rules, against the same policy hardcoded, and
+                check both report identical diagnostics. Fails if the rules
+                are slower. The full catalog-rules.yaml is timed too.
+    generate    Only write a synthetic catalog to a directory.
+
+Synthetic catalogs are deterministic for a given --seed. They can mix kinds,
+spread files over directories, put several documents in each file, and seed
+a fraction of broken references and duplicate entities.
+
+Usage:
+    python scripts/bench_catalog.py loaders [--entities 10000] [--repeat 3]
+    python scripts/bench_catalog.py throughput --entities 50000 --output bench.json
+    python scripts/bench_catalog.py throughput --entities 50000 --compare bench.json
+    python scripts/bench_catalog.py rules --entities 100000
+"""
+from __future__ import annotations
+import gc
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+from pathlib import Path
+from typing import List, Dict, Any
+
+import yaml
+
+import catalog_rules
+import validate_catalog as vc
+
+DEFAULT_KIND_MIX = "Component=60,API=15,System=10,Group=8,Domain=4,User=3"
+# Metrics compared by --compare; lower is better for all of them
+COMPARED_METRICS = ("total_s", "parse_s", "validate_document_s", "validate_relations_s", "graph_s", "peak_rss_mb")
+
+
+def parse_kind_mix(text: str) -> Dict[str, float]:
+    """Parse ``Kind=weight,...`` into normalised weights."""
+    mix: Dict[str, float] = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        mix[kind.strip()] = float(weight or 1)
+    total = sum(mix.values())
+    return {kind: weight / total for kind, weight in mix.items()}
+
+
+def generate_documents(entities: int, kind_mix: Dict[str, float] | None = None, broken: float = 0.0,
+                       duplicates: float = 0.0, seed: int = 0) -> List[str]:
+    """Return ``entities`` YAML documents (as text) forming a connected catalog.
+
+    Groups form a hierarchy, Systems belong to Domains, Components and APIs to
+    Systems, and Components provide APIs and depend on earlier Components (so
+    there are no dependsOn cycles). A ``broken`` fraction of references point
+    at entities that do not exist and a ``duplicates`` fraction of documents
+    repeat an existing (kind, name).
+    """
+    rng = random.Random(seed)
+    mix = kind_mix or parse_kind_mix(DEFAULT_KIND_MIX)
+    counts = {kind: max(1, round(entities * weight)) for kind, weight in mix.items()}
+    for kind in ("Group", "Domain", "System"):
+        counts.setdefault(kind, 1)
+
+    def ref(kind: str, prefix: str = "") -> str:
+        if rng.random() < broken:
+            return f"{prefix}missing-{kind.lower()}-{rng.randrange(1_000_000)}"
+        return f"{prefix}{kind.lower()}-{rng.randrange(counts[kind])}"
+
+    docs: List[str] = []
+    for kind in ("Group", "User", "Domain", "System", "API", "Component"):
+        for i in range(counts.get(kind, 0)):
+            name = f"{kind.lower()}-{i}"
+            if docs and rng.random() < duplicates:
+                name = f"{kind.lower()}-{rng.randrange(i)}" if i else name
+            annotations = ""
+            spec = [f"  owner: {ref('Group', 'group:')}"]
+            if kind in ("Component", "System", "API"):
+                annotations = ("  annotations:\n"
+                               "    github.com/project-slug: example/repo\n"
+                               "    backstage.io/techdocs-ref: dir:.\n")
+            if kind == "Group":
+                spec = ["  type: team"]
+                if i:
+                    spec.append(f"  parent: group-{rng.randrange(i)}")
+                spec.append("  children: []")
+            elif kind == "User":
+                spec = ["  memberOf: []"]
+            elif kind == "System":
+                spec.append(f"  domain: {ref('Domain')}")
+            elif kind == "API":
+                spec += ["  type: openapi", "  lifecycle: production", f"  system: {ref('System')}"]
+            elif kind == "Component":
+                spec += ["  type: service", "  lifecycle: production", f"  system: {ref('System')}"]
+                if "API" in counts:
+                    spec += ["  providesApis:", f"    - {ref('API')}"]
+                if i:
+                    spec += ["  dependsOn:", f"    - component:component-{rng.randrange(i)}"]
+            docs.append(
+                "apiVersion: backstage.io/v1alpha1\n"
+                f"kind: {kind}\n"
+                f"metadata:\n  name: {name}\n  description: Synthetic {kind} {i}\n"
+                f"{annotations}"
+                "spec:\n" + "\n".join(spec) + "\n"
+            )
+            if len(docs) >= entities:
+                return docs
+    return docs
+
+
+def synthesize_catalog(entities: int) -> str:
+    """Return a single multi-document YAML catalog with ``entities`` entities."""
+    return "---\n".join(generate_documents(entities))
+
+
+def write_catalog(out_dir: Path, docs: List[str], files_per_dir: int = 100, docs_per_file: int = 1) -> List[Path]:
+    """Write ``docs`` under ``out_dir`` as ``dir-NNNN/entities-NNNN.yaml`` files."""
+    files: List[Path] = []
+    for n, start in enumerate(range(0, len(docs), docs_per_file)):
+        directory = out_dir / f"dir-{n // files_per_dir:04d}"
+        if n % files_per_dir == 0:
+            directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"entities-{n:06d}.yaml"
+        path.write_text("---\n".join(docs[start:start + docs_per_file]), encoding="utf-8")
+        files.append(path)
+    return files
+
+
+def measure(files: List[Path], loader: str) -> Dict[str, Any]:
+    """Validate ``files`` serially, timing each phase separately.
+
+    Runs in a fresh worker process so peak RSS reflects validation only.
+    """
+    state = vc.ValidationState()
+    parse_s = check_s = 0.0
+    docs = 0
+    clock = time.perf_counter
+    start = clock()
+    for file in files:
+        stream = vc.iter_yaml_documents(file, loader)
+        index = 0
+        while True:
+            t0 = clock()
+            doc = next(stream, None)
+            t1 = clock()
+            parse_s += t1 - t0
+            if doc is None:
+                break
+            state.register_document(vc.check_document(doc, file, index), file)
+            index += 1
+            check_s += clock() - t1
+        docs += index
+    t0 = clock()
+    state.validate_relations()
+    t1 = clock()
+    state.analyze_graph()
+    t2 = clock()
+    total = t2 - start
+    return {
+        "files": len(files),
+        "entities": docs,
+        "errors": len(state.errors),
+        "warnings": len(state.warnings),
+        "total_s": round(total, 4),
+        "parse_s": round(parse_s, 4),
+        "validate_document_s": round(check_s, 4),
+        "validate_relations_s": round(t1 - t0, 4),
+        "graph_s": round(t2 - t1, 4),
+        "files_per_s": round(len(files) / total, 1),
+        "entities_per_s": round(docs / total, 1),
+        "peak_rss_mb": (vc.peak_memory() or {}).get("peak_rss_mb"),
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=vc.REPO_ROOT, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> int:
+    """Print metric deltas against ``baseline``; return 1 if any metric
+    regressed by more than ``threshold`` (a fraction)."""
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'}:")
+    regressed = False
+    for metric in COMPARED_METRICS:
+        old, new = baseline["results"].get(metric), results["results"].get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressed = True
+        print(f"  {metric:>22}: {old:>10} -> {new:>10} ({change:+.1%}){flag}")
+    return 1 if regressed else 0
+
+
+def bench_throughput(args: argparse.Namespace) -> int:
+    params = {
+        "entities": args.entities,
+        "kind_mix": args.kinds,
+        "files_per_dir": args.files_per_dir,
+        "docs_per_file": args.docs_per_file,
+        "broken": args.broken,
+        "duplicates": args.duplicates,
+        "seed": args.seed,
+        "loader": vc.resolve_loader(args.loader),
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        docs = generate_documents(args.entities, parse_kind_mix(args.kinds), args.broken, args.duplicates, args.seed)
+        files = write_catalog(Path(tmp), docs, args.files_per_dir, args.docs_per_file)
+        del docs
+        print(f"Synthetic catalog: {args.entities} entities in {len(files)} files")
+        runs = []
+        ctx = multiprocessing.get_context("spawn")
+        for _ in range(args.repeat):
+            with ctx.Pool(1) as pool:
+                runs.append(pool.apply(measure, (files, params["loader"])))
+    best = min(runs, key=lambda r: r["total_s"])
+
+    print(f"  total:              {best['total_s']:.3f}s")
+    print(f"  parse:              {best['parse_s']:.3f}s")
+    print(f"  validate_document:  {best['validate_document_s']:.3f}s")
+    print(f"  validate_relations: {best['validate_relations_s']:.3f}s")
+    print(f"  graph:              {best['graph_s']:.3f}s")
+    print(f"  throughput:         {best['files_per_s']:,.0f} files/s, {best['entities_per_s']:,.0f} entities/s")
+    print(f"  peak RSS:           {best['peak_rss_mb']} MB")
+    print(f"  diagnostics:        {best['errors']} error(s), {best['warnings']} warning(s)")
+
+    results = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "pyyaml": yaml.__version__,
+        "cpus": os.cpu_count(),
+        "params": params,
+        "results": best,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+        print(f"Results written to {args.output}")
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        if baseline.get("params") != params:
+            print("WARNING: baseline was produced with different parameters")
+        return compare(results, baseline, args.max_regression)
+    return 0
+
+
+# The policy check_document hardcoded before catalog-rules.yaml, as rules
+BASELINE_RULES = {"rules": [
+    {"kinds": ["Component", "System", "API"], "annotation": "github.com/project-slug", "required": True},
+    {"kinds": ["Component", "System"], "annotation": "backstage.io/techdocs-ref", "required": True},
+    {"kinds": ["Component", "System", "Domain", "API", "Group"], "field": "spec.owner", "required": True,
+     "message": "Kind {kind} missing spec.owner"},
+]}
+
+
+class HardcodedPolicy:
+    """The policy checks as check_document hardcoded them before
+    catalog-rules.yaml, behind the same ``apply`` as a RuleSet."""
+
+    def apply(self, doc: Dict[str, Any], kind: Any, name: Any, err: Any, warn: Any) -> None:
+        metadata = doc.get("metadata") if isinstance(doc.get("metadata"), dict) else {}
+        annotations = metadata.get("annotations", {}) if isinstance(metadata.get("annotations"), dict) else {}
+        if kind in {"Component", "System", "API"}:
+            if "github.com/project-slug" not in annotations:
+                warn(f"{kind} '{name}' missing annotation github.com/project-slug")
+        if kind in {"Component", "System"}:
+            if "backstage.io/techdocs-ref" not in annotations:
+                warn(f"{kind} '{name}' missing annotation backstage.io/techdocs-ref")
+        if kind in {"Component", "System", "Domain", "API", "Group"}:
+            spec = doc.get("spec", {})
+            owner = spec.get("owner")
+            if not owner:
+                warn(f"Kind {kind} missing spec.owner")
+
+
+def bench_rules(entities: int, repeat: int) -> int:
+    """Time check_document with the baseline policy as compiled rules
+    against the same policy hardcoded (HardcodedPolicy). The variants are
+    timed on the same documents, taking turns on every repeat. Returns 1
+    if the diagnostics differ or the rules are slower than the hardcoded
+    checks."""
+    docs = [yaml.load(text, Loader=vc.LOADERS[vc.DEFAULT_LOADER]) for text in generate_documents(entities)]
+    for i, doc in enumerate(docs):
+        if i % 5 == 0:
+            doc["metadata"].pop("annotations", None)
+        if i % 7 == 0:
+            doc["spec"].pop("owner", None)
+        if i % 3 == 0:
+            doc["metadata"]["tags"] = ["java", "Bad Tag"] if i % 9 == 0 else ["java", "backend"]
+        if i % 11 == 0:
+            doc["spec"]["lifecycle"] = "beta"
+    source = Path("synthetic.yaml")
+    hardcoded = HardcodedPolicy()
+    baseline_rules = catalog_rules.compile_rules(BASELINE_RULES, "baseline rules")
+    full_rules = catalog_rules.load_rules()
+    variants = {
+        "hardcoded": lambda doc, i: vc.check_document(doc, source, i, hardcoded),
+        "rules": lambda doc, i: vc.check_document(doc, source, i, baseline_rules),
+        "all rules": lambda doc, i: vc.check_document(doc, source, i, full_rules),
+    }
+    timings = {name: float("inf") for name in variants}
+    outputs: Dict[str, List[Any]] = {}
+    gc.disable()  # as timeit does: collections triggered by the other variant's garbage skew the timings
+    try:
+        names = list(variants)
+        for run in range(repeat):
+            for name in names[run % len(names):] + names[:run % len(names)]:  # rotate which variant goes first
+                check = variants[name]
+                start = time.perf_counter()
+                results = [check(doc, i) for i, doc in enumerate(docs)]
+                timings[name] = min(timings[name], time.perf_counter() - start)
+                outputs[name] = [(r["errors"], r["warnings"]) for r in results]
+                del results
+                gc.collect()
+    finally:
+        gc.enable()
+    print(f"Synthetic catalog: {len(docs)} entities, best of {repeat}")
+    print("  hardcoded: the policy check_document hardcoded before catalog-rules.yaml")
+    print("  rules:     the same policy compiled from rules")
+    print("  all rules: scripts/catalog-rules.yaml (more checks)")
+    for name, best in timings.items():
+        print(f"  {name:>9}: {best:.3f}s ({len(docs) / best:,.0f} docs/s)")
+    ratio = timings["hardcoded"] / timings["rules"]
+    print(f"  rules / hardcoded throughput: {ratio:.2f}x")
+    if outputs["rules"] != outputs["hardcoded"]:
+        print("ERROR: rules and hardcoded checks produced different diagnostics")
+        return 1
+    print(f"  diagnostics identical ({sum(len(w) for _, w in outputs['rules'])} warning(s))")
+    if ratio < 1.0:
+        print("ERROR: rules are slower than the hardcoded checks")
+        return 1
+    return 0
+
+
+def diagnostics(docs: List[Any], source: Path) -> List[Dict[str, Any]]:
+    return [
+        {k: v for k, v in vc.check_document(doc, source, idx).items() if k != "doc"}
+        for idx, doc in enumerate(docs)
+    ]
+
+
+def bench_loaders(entities: int, repeat: int) -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "synthetic.yaml"
+        path.write_text(synthesize_catalog(entities), encoding="utf-8")
+        size_mb = path.stat().st_size / 1e6
+        print(f"Synthetic catalog: {entities} entities, {size_mb:.1f} MB")
+
+        timings: Dict[str, float] = {}
+        parsed: Dict[str, List[Any]] = {}
+        for name in sorted(vc.LOADERS):
+            best = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                parsed[name] = vc.load_yaml_documents(path, name)
+                best = min(best, time.perf_counter() - start)
+            timings[name] = best
+            print(f"  {name:>6}: {best:.3f}s ({len(parsed[name]) / best:,.0f} docs/s)")
+
+        if "c" not in timings:
+            print("libyaml is not available; only the pure-Python loader was timed.")
+            return 0
+        print(f"  speedup: {timings['python'] / timings['c']:.1f}x")
+        if parsed["c"] != parsed["python"] or diagnostics(parsed["c"], path) != diagnostics(parsed["python"], path):
+            print("ERROR: loaders produced different results")
+            return 1
+        print("  results identical across loaders")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the catalog validator")
+    sub = parser.add_subparsers(dest="command")
+
+    loaders = sub.add_parser("loaders", help="Compare YAML loader speed and results (default)")
+    loaders.add_argument("--entities", type=int, default=10000, help="Entities in the synthetic catalog (default 10000)")
+    loaders.add_argument("--repeat", type=int, default=3, help="Runs per loader; the best time is reported (default 3)")
+
+    def add_catalog_args(p: argparse.ArgumentParser) -> None:
+        p.add_argument("--entities", type=int, default=20000, help="Entities to generate (default 20000)")
+        p.add_argument("--kinds", default=DEFAULT_KIND_MIX, help=f"Kind mix as Kind=weight,... (default {DEFAULT_KIND_MIX})")
+        p.add_argument("--files-per-dir", type=int, default=100, help="Files per directory (default 100)")
+        p.add_argument("--docs-per-file", type=int, default=1, help="Documents per file (default 1)")
+        p.add_argument("--broken", type=float, default=0.01, help="Fraction of references to missing entities (default 0.01)")
+        p.add_argument("--duplicates", type=float, default=0.005, help="Fraction of duplicate entities (default 0.005)")
+        p.add_argument("--seed", type=int, default=0, help="Random seed (default 0)")
+
+    throughput = sub.add_parser("throughput", help="Measure validation throughput on a generated catalog")
+    add_catalog_args(throughput)
+    throughput.add_argument("--loader", choices=["auto", "c", "python"], default="auto", help="YAML loader (default auto)")
+    throughput.add_argument("--repeat", type=int, default=3, help="Runs; the fastest is reported (default 3)")
+    throughput.add_argument("--output", type=Path, help="Write machine-readable results to this JSON file")
+    throughput.add_argument("--compare", type=Path, help="Compare against a JSON file from an earlier --output")
+    throughput.add_argument("--max-regression", type=float, default=0.10,
+                            help="Fail --compare if a metric is worse by more than this fraction (default 0.10)")
+
+    rules = sub.add_parser("rules", help="Compare compiled rules with the hardcoded checks they replaced")
+    rules.add_argument("--entities", type=int, default=100000, help="Entities to check (default 100000)")
+    rules.add_argument("--repeat", type=int, default=7, help="Runs per variant; the best time is reported (default 7)")
+
+    generate = sub.add_parser("generate", help="Write a synthetic catalog to a directory")
+    add_catalog_args(generate)
+    generate.add_argument("out_dir", type=Path, help="Directory to write into")
+
+    args = parser.parse_args()
+    if args.command == "throughput":
+        return bench_throughput(args)
+    if args.command == "generate":
+        docs = generate_documents(args.entities, parse_kind_mix(args.kinds), args.broken, args.duplicates, args.seed)
+        files = write_catalog(args.out_dir, docs, args.files_per_dir, args.docs_per_file)
+        print(f"Wrote {len(docs)} entities to {len(files)} files under {args.out_dir}")
+        return 0
+    if args.command == "rules":
+        return bench_rules(args.entities, args.repeat)
+    if args.command == "loaders":
+        return bench_loaders(args.entities, args.repeat)
+    return bench_loaders(10000, 3)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+"""
+Catalog file discovery for validate_catalog.py.
+
+Files are selected by include/exclude glob patterns relative to the repo root:
+    - ``*`` and ``?`` match within one path segment, ``**`` across segments
+      and ``{yaml,yml}`` lists alternatives
+    - Exclude patterns without a ``/`` match a file or directory name at any
+      depth (``node_modules``); others match the repo-relative path
+      (``scaffolder-templates/skeleton/**``)
+    - Patterns without wildcards name files that are always included, so a
+      missing file is reported by the validator instead of silently skipped
+    - Location entities' ``spec.target``/``spec.targets`` (file targets,
+      possibly globs) can be followed transitively
+
+The tree is walked with ``os.scandir`` from a thread pool: each directory is
+one task, and only directories that some include pattern can still match
+below are entered, so the default patterns never leave ``catalog/``.
+"""
+from __future__ import annotations
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+import yaml
+
+DEFAULT_INCLUDE = ("catalog/*.yaml", "catalog-info.yaml")
+DEFAULT_EXCLUDE = (".git", "node_modules", ".catalog-cache")
+GLOB_CHARS = set("*?[{")
+
+
+@lru_cache(maxsize=None)
+def glob_regex(pattern: str) -> re.Pattern:
+    """Compile a glob with ``**`` and ``{a,b}`` support to an anchored regex."""
+    out = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+            continue
+        if c == "*":
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "{" and "}" in pattern[i:]:
+            end = pattern.index("}", i)
+            out.append("(?:" + "|".join(re.escape(alt) for alt in pattern[i + 1:end].split(",")) + ")")
+            i = end
+        elif c == "[" and "]" in pattern[i + 1:]:
+            end = pattern.index("]", i + 1)
+            body = pattern[i + 1:end]
+            out.append("[" + ("^" + body[1:] if body.startswith("!") else body).replace("\\", "\\\\") + "]")
+            i = end
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return re.compile("".join(out) + r"\Z")
+
+
+def is_glob(pattern: str) -> bool:
+    return any(c in GLOB_CHARS for c in pattern)
+
+
+class CatalogDiscovery:
+    """Find catalog files under ``root`` (see module docstring)."""
+
+    def __init__(self, root: Path, include: Iterable[str] = DEFAULT_INCLUDE,
+                 exclude: Iterable[str] = DEFAULT_EXCLUDE, follow_locations: bool = False,
+                 threads: int = 8, loader: Any = yaml.SafeLoader):
+        self.root = root
+        self.include = [p[2:] if p.startswith("./") else p for p in include]
+        self.exclude = list(exclude)
+        self.follow_locations = follow_locations
+        self.threads = max(1, threads)
+        self.loader = loader
+        self._exclude_names = [glob_regex(p) for p in self.exclude if "/" not in p.rstrip("/")]
+        self._exclude_paths = [glob_regex(p.rstrip("/")) for p in self.exclude if "/" in p.rstrip("/")]
+
+    def excluded(self, rel: str) -> bool:
+        name = rel.rsplit("/", 1)[-1]
+        return (any(r.match(name) for r in self._exclude_names)
+                or any(r.match(rel) or r.match(rel + "/") for r in self._exclude_paths))
+
+    def matches(self, rel: str) -> bool:
+        """True if the repo-relative posix path ``rel`` is selected by the include
+        and exclude patterns (Location targets are not considered)."""
+        return not self._excluded_path(rel) and any(glob_regex(p).match(rel) for p in self.include)
+
+    def _excluded_path(self, rel: str) -> bool:
+        parts = rel.split("/")
+        return any(self.excluded("/".join(parts[:i])) for i in range(1, len(parts) + 1))
+
+    @staticmethod
+    def _may_contain(patterns: List[List[str]], parts: List[str]) -> bool:
+        """Could a file below directory ``parts`` match one of the split ``patterns``?"""
+        for segments in patterns:
+            for k, part in enumerate(parts):
+                if "**" in segments[min(k, len(segments) - 1)]:
+                    return True
+                if k >= len(segments) - 1 or not glob_regex(segments[k]).match(part):
+                    break
+            else:
+                return True
+        return False
+
+    def _scan_dir(self, rel: str, patterns: List[str], split: List[List[str]]) -> Tuple[List[str], List[str]]:
+        files: List[str] = []
+        dirs: List[str] = []
+        try:
+            with os.scandir(self.root / rel if rel else self.root) as entries:
+                for entry in entries:
+                    path = f"{rel}/{entry.name}" if rel else entry.name
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not self.excluded(path) and self._may_contain(split, path.split("/")):
+                                dirs.append(path)
+                        elif entry.is_file() and not self.excluded(path):
+                            if any(glob_regex(p).match(path) for p in patterns):
+                                files.append(path)
+                    except OSError:
+                        continue
+        except OSError:
+            pass  # unreadable or vanished directory
+        return files, dirs
+
+    def scan(self, patterns: List[str]) -> List[str]:
+        """Repo-relative paths matching ``patterns``, in pattern order and
+        sorted within each pattern. Literal patterns are returned even if the
+        file does not exist."""
+        literal = [p for p in patterns if not is_glob(p)]
+        globs = [p for p in patterns if is_glob(p)]
+        found: List[str] = []
+        if globs:
+            split = [p.split("/") for p in globs]
+            with ThreadPoolExecutor(self.threads) as pool:
+                pending = {pool.submit(self._scan_dir, "", globs, split)}
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        files, dirs = future.result()
+                        found.extend(files)
+                        pending.update(pool.submit(self._scan_dir, d, globs, split) for d in dirs)
+        order: Dict[str, int] = {}
+        for path in found:
+            order[path] = next(i for i, p in enumerate(patterns) if p in globs and glob_regex(p).match(path))
+        for path in literal:
+            if not self._excluded_path(path):
+                order.setdefault(path, patterns.index(path))
+        return sorted(order, key=lambda path: (order[path], path))
+
+    def location_targets(self, rel: str) -> List[str]:
+        """File targets of Location entities in ``rel``, as repo-relative
+        patterns; URL targets and targets outside the root are skipped."""
+        path = self.root / rel
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return []
+        if b"Location" not in data:
+            return []
+        try:
+            docs = list(yaml.load_all(data, Loader=self.loader))
+        except yaml.YAMLError:
+            return []  # reported when the file is validated
+        targets: List[str] = []
+        root = str(self.root.resolve())
+        for doc in docs:
+            if not (isinstance(doc, dict) and doc.get("kind") == "Location" and isinstance(doc.get("spec"), dict)):
+                continue
+            spec = doc["spec"]
+            if spec.get("type", "file") != "file":
+                continue
+            raw = spec.get("targets") or []
+            raw = (raw if isinstance(raw, list) else []) + ([spec["target"]] if spec.get("target") else [])
+            for target in raw:
+                if not isinstance(target, str) or "://" in target:
+                    continue
+                resolved = os.path.normpath(os.path.join(root, os.path.dirname(rel), target))
+                if resolved == root or not resolved.startswith(root + os.sep):
+                    continue
+                targets.append(os.path.relpath(resolved, root).replace(os.sep, "/"))
+        return targets
+
+    def files(self) -> List[Path]:
+        """Discovered catalog files: include matches, then (with
+        ``follow_locations``) Location targets in the order they are found."""
+        rels = self.scan(self.include)
+        seen: Set[str] = set(rels)
+        if self.follow_locations:
+            todo = list(rels)
+            while todo:
+                for target in self.location_targets(todo.pop(0)):
+                    for rel in (self.scan([target]) if is_glob(target) else [target]):
+                        if rel not in seen and not self._excluded_path(rel):
+                            seen.add(rel)
+                            rels.append(rel)
+                            todo.append(rel)
+        return [self.root / rel for rel in rels]
@@ -0,0 +1,199 @@
+"""
+Graph analysis over the entity index built by validate_catalog.py.
+
+Given the validator's Entity records and a function yielding their resolved
+references, ``analyze`` reports:
+    - dependsOn cycles (strongly connected components, iterative Tarjan)
+    - Group hierarchy cycles (spec.parent / spec.children)
+    - Orphans: Components and APIs not part of any System, directly or through
+      a subcomponentOf chain
+    - Unreachable Systems (no existing Domain) and Domains (no System in them)
+    - Owning-team closure: every entity owned by a Group or its descendants
+
+Everything is linear in entities + references, apart from the closure, which
+is bounded by entities x hierarchy depth.
+"""
+from __future__ import annotations
+from typing import Any, Callable, Dict, Iterable, List, Set, Tuple
+
+Key = Tuple[str, str]
+
+
+def entity_ref(key: Key) -> str:
+    return f"{key[0].lower()}:{key[1]}"
+
+
+def strongly_connected(adjacency: List[List[int]]) -> List[List[int]]:
+    """Tarjan's SCC algorithm, iterative so deep chains cannot hit the recursion limit."""
+    n = len(adjacency)
+    index = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    stack: List[int] = []
+    components: List[List[int]] = []
+    counter = 0
+    for root in range(n):
+        if index[root] != -1:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [(root, 0)]
+        while work:
+            v, i = work[-1]
+            if i < len(adjacency[v]):
+                work[-1] = (v, i + 1)
+                w = adjacency[v][i]
+                if index[w] == -1:
+                    index[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack[w] = True
+                    work.append((w, 0))
+                elif on_stack[w]:
+                    low[v] = min(low[v], index[w])
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[v])
+            if low[v] == index[v]:
+                component = []
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = False
+                    component.append(w)
+                    if w == v:
+                        break
+                components.append(component)
+    return components
+
+
+def _cycles(keys: List[Key], edges: List[Tuple[int, int]]) -> List[List[Key]]:
+    # Only nodes with edges can be on a cycle; most entities have none
+    nodes = sorted({n for edge in edges for n in edge})
+    local = {n: i for i, n in enumerate(nodes)}
+    adjacency: List[List[int]] = [[] for _ in nodes]
+    for src, dst in edges:
+        adjacency[local[src]].append(local[dst])
+    cycles = []
+    for component in strongly_connected(adjacency):
+        if len(component) > 1 or component[0] in adjacency[component[0]]:
+            cycles.append(sorted(keys[nodes[i]] for i in component))
+    return sorted(cycles)
+
+
+def analyze(entities: Iterable[Any],
+            refs: Callable[[Any], Iterable[Tuple[str, Any, Key | None]]]) -> Dict[str, Any]:
+    """Analyse ``entities`` (validate_catalog.Entity) using ``refs`` (iter_refs).
+
+    Unresolved references are ignored here; validate_relations reports them.
+    The first definition of a duplicated (kind, name) wins.
+    """
+    keys: List[Key] = []
+    ids: Dict[Key, int] = {}
+    records = []
+    for entity in entities:
+        if not (entity.kind and entity.name):
+            continue
+        key = (entity.kind, entity.name)
+        if key in ids:
+            continue
+        ids[key] = len(keys)
+        keys.append(key)
+        records.append(entity)
+
+    depends: List[Tuple[int, int]] = []
+    child_of: List[Tuple[int, int]] = []  # (child group, parent group)
+    owner_of: List[int] = [-1] * len(keys)
+    system_of: List[int] = [-1] * len(keys)
+    parent_component: List[int] = [-1] * len(keys)
+    domain_members: Set[int] = set()  # Domains some System belongs to
+    in_domain: Set[int] = set()  # Systems that belong to an existing Domain
+    for i, entity in enumerate(records):
+        for field, _, key in refs(entity):
+            j = ids.get(key) if key else None
+            if j is None:
+                continue
+            if field == "dependsOn":
+                depends.append((i, j))
+            elif field == "parent":
+                child_of.append((i, j))
+            elif field == "children":
+                child_of.append((j, i))
+            elif field == "owner":
+                owner_of[i] = j
+            elif field == "system":
+                system_of[i] = j
+            elif field == "subcomponentOf":
+                parent_component[i] = j
+            elif field == "domain":
+                domain_members.add(j)
+                in_domain.add(i)
+
+    # Orphans: follow subcomponentOf until something belongs to a System
+    def in_system(i: int) -> bool:
+        visited = set()
+        while i != -1 and i not in visited:
+            if system_of[i] != -1:
+                return True
+            visited.add(i)
+            i = parent_component[i]
+        return False
+
+    orphans = sorted(keys[i] for i, (kind, _) in enumerate(keys)
+                     if kind in ("Component", "API") and not in_system(i))
+    unreachable_systems = sorted(key for i, key in enumerate(keys)
+                                 if key[0] == "System" and i not in in_domain)
+    unreachable_domains = sorted(key for i, key in enumerate(keys)
+                                 if key[0] == "Domain" and i not in domain_members)
+
+    # Owning-team closure: each owned entity counts for its owner and all ancestors
+    parents: Dict[int, List[int]] = {}
+    for child, parent in child_of:
+        parents.setdefault(child, []).append(parent)
+    ancestors: Dict[int, List[int]] = {}
+
+    def ancestors_of(group: int) -> List[int]:
+        if group not in ancestors:
+            seen = {group}
+            todo = [group]
+            while todo:
+                for parent in parents.get(todo.pop(), ()):
+                    if parent not in seen:
+                        seen.add(parent)
+                        todo.append(parent)
+            ancestors[group] = sorted(seen)
+        return ancestors[group]
+
+    closure: Dict[Key, List[Key]] = {key: [] for key in keys if key[0] == "Group"}
+    for i, owner in enumerate(owner_of):
+        if owner != -1 and keys[owner][0] == "Group":
+            for group in ancestors_of(owner):
+                closure[keys[group]].append(keys[i])
+
+    return {
+        "dependency_cycles": _cycles(keys, depends),
+        "group_cycles": _cycles(keys, child_of),
+        "orphans": orphans,
+        "unreachable_systems": unreachable_systems,
+        "unreachable_domains": unreachable_domains,
+        "ownership": {key: sorted(owned) for key, owned in sorted(closure.items())},
+    }
+
+
+def to_json(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Render ``analyze`` output with entity refs as ``kind:name`` strings."""
+    def refs(keys: Iterable[Key]) -> List[str]:
+        return [entity_ref(k) for k in keys]
+    return {
+        "dependency_cycles": [refs(c) for c in result["dependency_cycles"]],
+        "group_cycles": [refs(c) for c in result["group_cycles"]],
+        "orphans": refs(result["orphans"]),
+        "unreachable": {
+            "systems": refs(result["unreachable_systems"]),
+            "domains": refs(result["unreachable_domains"]),
+        },
+        "ownership": {entity_ref(g): refs(owned) for g, owned in result["ownership"].items()},
+    }
@@ -0,0 +1,281 @@
+"""
+Structural validation of API entities' ``spec.definition`` for validate_catalog.py.
+
+Definitions may be inline YAML/JSON text or a ``$text``/``$openapi``/``$yaml``
+/``$json`` substitution naming a file relative to the entity's catalog file;
+URL targets are not fetched. Specs are checked for:
+    - ``openapi: 3.x`` (or ``swagger: "2.0"``), ``info.title``, ``info.version``
+    - ``paths`` keys starting with ``/``, operations with ``responses``,
+      response codes (``200``, ``4XX``, ``default``) with descriptions
+    - Parameters with ``name`` and a valid ``in``; path parameters required
+      and declared for every ``{template}`` segment
+    - Unique ``operationId`` values
+    - Every ``$ref`` resolving, in the same document or in another file
+
+``DefinitionResolver`` caches per run: each file is read and parsed once,
+checked once however many APIs share it, and every (file, JSON pointer) is
+resolved once. Documents are walked iteratively and each node is visited
+once, so deep or cyclic ``$ref`` graphs cost time linear in the spec size.
+"""
+from __future__ import annotations
+import json
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Set, Tuple
+from urllib.parse import unquote
+
+import yaml
+
+SUBSTITUTIONS = ("$text", "$openapi", "$yaml", "$json")
+OPERATIONS = ("get", "put", "post", "delete", "options", "head", "patch", "trace")
+PARAMETER_LOCATIONS = {"query", "header", "path", "cookie"}
+SWAGGER_LOCATIONS = {"query", "header", "path", "formData", "body"}
+RE_STATUS = re.compile(r"^(default|[1-5](\d\d|XX))$")
+RE_TEMPLATE = re.compile(r"\{([^}/]+)\}")
+
+
+class DefinitionError(Exception):
+    """A definition file could not be read or parsed."""
+
+
+class DefinitionResolver:
+    """Per-run cache of definition files, their diagnostics and resolved refs."""
+
+    def __init__(self, loader: Any = yaml.SafeLoader):
+        self.loader = loader
+        self._docs: Dict[Path, Any] = {}
+        self._diagnostics: Dict[Tuple[Path, bool], List[str]] = {}
+        self._pointers: Dict[Tuple[Path, str], bool] = {}
+        self._targets: Dict[Tuple[Path, str], Path] = {}
+        self.files_loaded = 0
+
+    def load(self, path: Path) -> Any:
+        """Parsed content of ``path``; failures are cached as DefinitionError."""
+        path = path.resolve()
+        if path not in self._docs:
+            try:
+                text = path.read_text(encoding="utf-8")
+                self._docs[path] = self.parse(text, path.suffix == ".json")
+            except OSError as e:
+                self._docs[path] = DefinitionError(f"cannot read {path}: {e.strerror or e}")
+            except (ValueError, yaml.YAMLError) as e:
+                self._docs[path] = DefinitionError(f"cannot parse {path}: {e}")
+            self.files_loaded += 1
+        doc = self._docs[path]
+        if isinstance(doc, DefinitionError):
+            raise doc
+        return doc
+
+    def parse(self, text: str, is_json: bool = False) -> Any:
+        return json.loads(text) if is_json else yaml.load(text, Loader=self.loader)
+
+    def check_file(self, path: Path, structural: bool = True) -> List[str]:
+        """Diagnostics for the spec in ``path``, computed once per run. Files
+        only reached through ``$ref`` are usually fragments, so they are
+        checked with ``structural=False``: their own refs only."""
+        return self._check_resolved(path.resolve(), structural)
+
+    def _check_resolved(self, path: Path, structural: bool) -> List[str]:
+        key = (path, structural)
+        if key not in self._diagnostics:
+            self._diagnostics[key] = []  # re-entrant refs to this file see no new problems
+            try:
+                spec = self.load(key[0])
+            except DefinitionError as e:
+                self._diagnostics[key] = [str(e)]
+            else:
+                self._diagnostics[key] = check_spec(spec, key[0], self, structural)
+        return self._diagnostics[key]
+
+    def resolves(self, base: Path, ref: str, root: Any, local: Dict[str, bool]) -> str | None:
+        """Resolve ``ref`` found in ``base``, whose parsed content is ``root``
+        (``local`` caches pointers into ``root``); return a problem
+        description, or None if it resolves."""
+        target, _, pointer = ref.partition("#")
+        if "://" in target:
+            return None  # remote refs are not fetched
+        if not target:
+            if pointer not in local:
+                local[pointer] = _follow(root, pointer)
+            return None if local[pointer] else f"$ref '{ref}' does not resolve"
+        file = self._targets.get((base, target))
+        if file is None:
+            file = self._targets[(base, target)] = (base.parent / target).resolve()
+        key = (file, pointer)
+        if key not in self._pointers:
+            try:
+                self._pointers[key] = _follow(self.load(file), pointer)
+            except DefinitionError as e:
+                return str(e)
+        if not self._pointers[key]:
+            return f"$ref '{ref}' does not resolve"
+        problems = self._check_resolved(file, structural=False)
+        if problems:
+            return f"$ref '{ref}' points into an invalid file ({len(problems)} problem(s))"
+        return None
+
+
+def _follow(doc: Any, pointer: str) -> bool:
+    if not pointer:
+        return True
+    if not pointer.startswith("/"):
+        return False
+    node = doc
+    for token in pointer[1:].split("/"):
+        if "%" in token:
+            token = unquote(token)
+        token = token.replace("~1", "/").replace("~0", "~")
+        if isinstance(node, dict) and token in node:
+            node = node[token]
+        elif isinstance(node, list) and token.isdigit() and int(token) < len(node):
+            node = node[int(token)]
+        else:
+            return False
+    return True
+
+
+def _check_parameters(params: Any, where: str, swagger: bool, problems: List[str]) -> Set[str]:
+    """Check a parameters list; return the names of path parameters."""
+    names: Set[str] = set()
+    if params is None:
+        return names
+    if not isinstance(params, list):
+        problems.append(f"{where}.parameters: not a list")
+        return names
+    locations = SWAGGER_LOCATIONS if swagger else PARAMETER_LOCATIONS
+    for i, param in enumerate(params):
+        at = f"{where}.parameters[{i}]"
+        if not isinstance(param, dict):
+            problems.append(f"{at}: not a mapping")
+        elif "$ref" in param:
+            continue
+        elif not isinstance(param.get("name"), str):
+            problems.append(f"{at}: missing name")
+        elif param.get("in") not in locations:
+            problems.append(f"{at}: 'in' must be one of {sorted(locations)}")
+        elif param["in"] == "path":
+            if param.get("required") is not True:
+                problems.append(f"{at}: path parameter '{param['name']}' must be required")
+            names.add(param["name"])
+    return names
+
+
+def check_spec(spec: Any, path: Path | str, resolver: DefinitionResolver, structural: bool = True) -> List[str]:
+    """Structural problems (unless ``structural`` is False) and unresolved
+    refs in ``spec``, parsed from ``path``."""
+    problems: List[str] = []
+    if structural:
+        if not isinstance(spec, dict):
+            return ["definition is not a mapping"]
+        _check_structure(spec, problems)
+    _check_refs(spec, Path(path), resolver, problems)
+    return problems
+
+
+def _check_structure(spec: Dict[str, Any], problems: List[str]) -> None:
+    swagger = "swagger" in spec
+    version = spec.get("swagger" if swagger else "openapi")
+    if swagger and str(version) != "2.0":
+        problems.append(f"unsupported swagger version '{version}'")
+    elif not swagger and not re.match(r"^3\.\d+", str(version)):
+        problems.append(f"unsupported openapi version '{version}'")
+    info = spec.get("info")
+    if not isinstance(info, dict):
+        problems.append("missing info")
+    else:
+        for field in ("title", "version"):
+            if not isinstance(info.get(field), (str, int, float)) or info.get(field) == "":
+                problems.append(f"missing info.{field}")
+
+    paths = spec.get("paths")
+    if paths is None and (swagger or str(version).startswith("3.0")):
+        problems.append("missing paths")
+    elif paths is not None and not isinstance(paths, dict):
+        problems.append("paths is not a mapping")
+    operation_ids: Dict[str, str] = {}
+    for route, item in (paths or {}).items() if isinstance(paths, dict) else ():
+        where = f"paths.{route}"
+        if not isinstance(route, str) or not route.startswith("/"):
+            problems.append(f"{where}: path must start with '/'")
+        if not isinstance(item, dict):
+            problems.append(f"{where}: not a mapping")
+            continue
+        shared = _check_parameters(item.get("parameters"), where, swagger, problems)
+        templated = set(RE_TEMPLATE.findall(route)) if isinstance(route, str) else set()
+        for method in OPERATIONS:
+            op = item.get(method)
+            if op is None:
+                continue
+            at = f"{where}.{method}"
+            if not isinstance(op, dict):
+                problems.append(f"{at}: not a mapping")
+                continue
+            declared = shared | _check_parameters(op.get("parameters"), at, swagger, problems)
+            params = [p for group in (item.get("parameters"), op.get("parameters"))
+                      if isinstance(group, list) for p in group]
+            # Referenced parameters are not resolved here, so only check fully inline lists
+            if not any(isinstance(p, dict) and "$ref" in p for p in params):
+                for name in sorted(templated - declared):
+                    problems.append(f"{at}: path parameter '{name}' is not declared")
+            op_id = op.get("operationId")
+            if isinstance(op_id, str):
+                if op_id in operation_ids:
+                    problems.append(f"{at}: duplicate operationId '{op_id}' (also {operation_ids[op_id]})")
+                else:
+                    operation_ids[op_id] = at
+            responses = op.get("responses")
+            if not isinstance(responses, dict) or not responses:
+                problems.append(f"{at}: missing responses")
+                continue
+            for code, response in responses.items():
+                if not RE_STATUS.match(str(code)):
+                    problems.append(f"{at}.responses.{code}: invalid status code")
+                if isinstance(response, dict) and "$ref" not in response and "description" not in response:
+                    problems.append(f"{at}.responses.{code}: missing description")
+
+
+def _check_refs(spec: Any, base: Path, resolver: DefinitionResolver, problems: List[str]) -> None:
+    # Walk every node once (YAML anchors can share nodes)
+    seen: Set[int] = set()
+    local: Dict[str, bool] = {}
+    stack: List[Any] = [spec]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        if isinstance(node, dict):
+            ref = node.get("$ref")
+            if isinstance(ref, str):
+                problem = resolver.resolves(base, ref, spec, local)
+                if problem:
+                    problems.append(problem)
+            stack.extend(v for v in node.values() if isinstance(v, (dict, list)))
+        elif isinstance(node, list):
+            stack.extend(v for v in node if isinstance(v, (dict, list)))
+
+
+def check_definition(definition: Any, source: Path, resolver: DefinitionResolver) -> List[str]:
+    """Problems with an API entity's ``spec.definition`` declared in ``source``."""
+    if definition is None:
+        return []  # a missing definition is reported by the policy rules
+    key = next(iter(definition), None) if isinstance(definition, dict) and len(definition) == 1 else None
+    if isinstance(key, str) and key.startswith("$"):
+        target = definition[key]
+        if key not in SUBSTITUTIONS:
+            return [f"unsupported substitution {key}"]
+        if not isinstance(target, str):
+            return [f"{key} target is not a string"]
+        if "://" in target:
+            return []  # URL targets are not fetched
+        file = source.parent / target
+        problems = resolver.check_file(file)
+        return [f"{target}: {p}" for p in problems]
+    if isinstance(definition, str):
+        try:
+            spec = resolver.parse(definition)
+        except yaml.YAMLError as e:
+            return [f"cannot parse inline definition: {e}"]
+    else:
+        spec = definition
+    return check_spec(spec, source, resolver)
@@ -0,0 +1,228 @@
+"""
+Declarative policy rules for validate_catalog.py.
+
+Rules live in a YAML file (scripts/catalog-rules.yaml by default, or
+``--rules FILE``). ``load_rules`` compiles it once per process into a table of
+checks per kind: each rule becomes a flat tuple with its lookup key, enum set,
+bound regex ``match`` and messages already formatted for the kind, so
+checking a document is one loop over the rules for its kind. See
+catalog-rules.yaml for the rule syntax; ``bench_catalog.py rules`` compares
+this with the hardcoded checks validate_catalog.py had before the rules file.
+"""
+from __future__ import annotations
+import re
+import string
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+import yaml
+
+DEFAULT_RULES_FILE = Path(__file__).resolve().parent / "catalog-rules.yaml"
+SEVERITIES = ("warning", "error")
+
+# Where a check reads its value from: the annotations, metadata or spec
+# mapping of the document (looked up once per document), or the document
+# itself for other paths
+ANNOTATIONS, METADATA, SPEC, DOCUMENT = range(4)
+SECTIONS = {"metadata": METADATA, "spec": SPEC}
+CONVERSIONS = {"s": str, "r": repr, "a": ascii}
+
+# A compiled check: (section, key or path, required, enum set, regex match,
+# is_error, message template with only {kind}, {name} and {value} left)
+Check = Tuple[int, Any, bool, "frozenset | None", Any, bool, Tuple[str, str, str]]
+
+
+class RuleError(ValueError):
+    """Raised for an invalid rules file."""
+
+
+class RuleSet:
+    """Checks by kind, compiled from a rules file.
+
+    For each kind in the file the checks are also bound to that kind
+    (``_bind``): messages have {kind} filled in, and become plain strings
+    when nothing else is left to format, so a document is checked by one
+    loop over flat tuples with no per-document message or regex setup.
+    """
+
+    def __init__(self, by_kind: Dict[str, List[Check]], any_kind: List[Check]):
+        self._by_kind = {kind: tuple(checks) for kind, checks in by_kind.items()}
+        self._any_kind = tuple(any_kind)
+        self._bound = {kind: _bind(checks, kind) for kind, checks in self._by_kind.items()}
+        self._any_bound = _bind(self._any_kind, None)
+
+    def for_kind(self, kind: Any) -> Tuple[Check, ...]:
+        """Compiled checks for ``kind``, in file order."""
+        return self._by_kind.get(kind, self._any_kind) if isinstance(kind, str) else self._any_kind
+
+    def apply(self, doc: Dict[str, Any], kind: Any, name: Any,
+              err: Callable[[str], None], warn: Callable[[str], None]) -> None:
+        """Check ``doc`` (of ``kind``, named ``name``), reporting through
+        ``err`` and ``warn``. A ``required`` annotation is missing when its
+        key is absent; a ``required`` field when its value is missing or
+        empty. Present values are then checked against ``enum`` and
+        ``pattern``."""
+        try:
+            checks = self._bound.get(kind, self._any_bound)
+        except TypeError:  # unhashable kind (a list or mapping in the YAML)
+            checks = self._any_bound
+        if not checks:
+            return
+        metadata = doc.get("metadata")
+        if not isinstance(metadata, dict):
+            metadata = {}
+        annotations = metadata.get("annotations")
+        if not isinstance(annotations, dict):
+            annotations = {}
+        spec = doc.get("spec")
+        if not isinstance(spec, dict):
+            spec = {}
+        for section, key, required, allowed, match, is_error, missing, not_allowed, mismatch in checks:
+            if section == ANNOTATIONS:
+                if key not in annotations:
+                    if required:
+                        (err if is_error else warn)(missing if missing.__class__ is str else missing(name, None, kind))
+                    continue
+                value = annotations[key]
+            else:
+                if section == DOCUMENT:
+                    value = doc
+                    for part in key:
+                        value = value.get(part) if isinstance(value, dict) else None
+                else:
+                    value = (spec if section == SPEC else metadata).get(key)
+                if not value:
+                    if required:
+                        (err if is_error else warn)(missing if missing.__class__ is str else missing(name, value, kind))
+                    continue
+            if allowed is not None and (not isinstance(value, (str, int, float, bool)) or value not in allowed):
+                (err if is_error else warn)(not_allowed if not_allowed.__class__ is str else not_allowed(name, value, kind))
+                continue
+            if match is not None:
+                for item in value if isinstance(value, list) else (value,):
+                    if not isinstance(item, str) or not match(item):
+                        (err if is_error else warn)(mismatch if mismatch.__class__ is str else mismatch(name, item, kind))
+                        break
+
+
+def _bind(checks: Tuple[Check, ...], kind: Any) -> Tuple[tuple, ...]:
+    """``checks`` as applied to documents of ``kind`` (None: any kind):
+    (section, key, required, enum set, match, is_error, then the missing,
+    not-allowed and mismatch messages). A message is a string when it is
+    fixed for ``kind``, else a callable of (name, value, kind)."""
+    return tuple((section, key, required, allowed, match, is_error)
+                 + tuple(_message(text, kind) for text in messages)
+                 for section, key, required, allowed, match, is_error, messages in checks)
+
+
+def _message(template: str, kind: Any) -> Any:
+    """``template`` with {kind} filled in (unless ``kind`` is None): the
+    message itself when no placeholder is left, else the ``str.format`` of
+    it with {name}, {value} and {kind} made positional (0, 1, 2), which is
+    cheaper to call than with keywords."""
+    parts, fields = [], False
+    for literal, field, spec, conversion in string.Formatter().parse(template):
+        parts.append(literal.replace("{", "{{").replace("}", "}}"))
+        if field is None:
+            continue
+        if spec and "{" in spec:  # nested placeholder: leave it to str.format
+            return lambda name, value, kind: template.format(name=name, value=value, kind=kind)
+        first, rest = re.match(r"(\w*)(.*)", field).groups()
+        if first == "kind" and not rest and kind is not None:
+            text = format(CONVERSIONS[conversion](kind) if conversion else kind, spec)
+            parts.append(text.replace("{", "{{").replace("}", "}}"))
+            continue
+        parts.append("{%d%s%s%s}" % (("name", "value", "kind").index(first), rest,
+                                     "!" + conversion if conversion else "", ":" + spec if spec else ""))
+        fields = True
+    text = "".join(parts)
+    if not fields:
+        return text.format()
+    head, field, rest = text.partition("{0}")
+    if field and "{" not in head + rest and "}" not in head + rest:  # the usual "... '{name}' ..."
+        return lambda name, value, kind: f"{head}{name}{rest}"
+    return text.format
+
+
+def _compile_rule(rule: Any, where: str) -> Check:
+    if not isinstance(rule, dict):
+        raise RuleError(f"{where}: rule must be a mapping")
+    unknown = set(rule) - {"kinds", "field", "annotation", "required", "enum", "pattern", "severity", "message"}
+    if unknown:
+        raise RuleError(f"{where}: unknown key(s) {sorted(unknown)}")
+    if ("field" in rule) == ("annotation" in rule):
+        raise RuleError(f"{where}: exactly one of 'field' or 'annotation' is required")
+    if "annotation" in rule:
+        section, key = ANNOTATIONS, str(rule["annotation"])
+        label = f"annotation {key}"
+    else:
+        label = str(rule["field"])
+        path = tuple(label.split("."))
+        if len(path) == 2 and path[0] in SECTIONS:
+            section, key = SECTIONS[path[0]], path[1]
+        else:
+            section, key = DOCUMENT, path
+
+    enum = rule.get("enum")
+    if enum is not None and not isinstance(enum, list):
+        raise RuleError(f"{where}: 'enum' must be a list")
+    try:
+        pattern = re.compile(rule["pattern"]) if "pattern" in rule else None
+    except (re.error, TypeError) as e:
+        raise RuleError(f"{where}: invalid pattern: {e}") from None
+    severity = rule.get("severity", "warning")
+    if severity not in SEVERITIES:
+        raise RuleError(f"{where}: severity must be one of {list(SEVERITIES)}")
+
+    # Substitute the placeholders that are fixed for this rule now
+    static = {"field": label, "enum": enum, "pattern": pattern.pattern if pattern else None}
+
+    def template(default: str) -> str:
+        text = rule.get("message") or default
+        for placeholder, value in static.items():
+            text = text.replace("{" + placeholder + "}", str(value).replace("{", "{{").replace("}", "}}"))
+        return text
+
+    messages = (template("{kind} '{name}' missing {field}"),
+                template("{kind} '{name}' {field} '{value}' not one of {enum}"),
+                template("{kind} '{name}' {field} '{value}' does not match {pattern}"))
+    try:
+        for text in messages:
+            text.format(kind="", name="", value="")
+    except (KeyError, IndexError, ValueError) as e:
+        raise RuleError(f"{where}: invalid message: {e}") from None
+    return (section, key, bool(rule.get("required", False)), frozenset(enum) if enum is not None else None,
+            pattern.match if pattern else None, severity == "error", messages)
+
+
+def compile_rules(data: Any, source: str = "rules") -> RuleSet:
+    """Compile parsed rules file ``data`` into a RuleSet."""
+    if not isinstance(data, dict) or not isinstance(data.get("rules"), list):
+        raise RuleError(f"{source}: expected a mapping with a 'rules' list")
+    by_kind: Dict[str, List[Check]] = {}
+    any_kind: List[Check] = []
+    for i, rule in enumerate(data["rules"]):
+        where = f"{source}: rule {i + 1}"
+        check = _compile_rule(rule, where)
+        kinds = rule.get("kinds")
+        if kinds is None:
+            any_kind.append(check)
+            for table in by_kind.values():
+                table.append(check)
+        else:
+            if not isinstance(kinds, list):
+                raise RuleError(f"{where}: 'kinds' must be a list")
+            for kind in kinds:
+                by_kind.setdefault(kind, list(any_kind)).append(check)
+    return RuleSet(by_kind, any_kind)
+
+
+@lru_cache(maxsize=None)
+def load_rules(path: Path = DEFAULT_RULES_FILE) -> RuleSet:
+    """Load and compile a rules file; cached, so each process compiles it once."""
+    try:
+        data = yaml.safe_load(Path(path).read_text(encoding="utf-8"))
+    except (OSError, yaml.YAMLError) as e:
+        raise RuleError(f"{path}: {e}") from None
+    return compile_rules(data, str(path))
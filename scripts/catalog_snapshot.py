@@ -0,0 +1,205 @@
+"""
+Compact binary snapshot of the entity index built by validate_catalog.py.
+
+Written with ``validate_catalog.py --emit-snapshot FILE`` so downstream tools
+can read entities and their resolved relations without re-parsing YAML.
+``Snapshot`` memory-maps the file; opening it reads only the header, and
+``get("component:foo")`` is a hash lookup touching a handful of pages.
+
+Layout (little-endian, all offsets from the start of the file):
+    header      MAGIC, version, entity/relation/string/slot counts and the
+                offsets of the sections below
+    strings     u32 offsets[string_count + 1] followed by the UTF-8 blob;
+                every kind, name, file and field is stored once
+    entities    24-byte records: kind, name, file (string ids), document
+                index, first relation, relation count
+    relations   16-byte records: field, target kind, target name (string
+                ids), target entity or -1 if it does not exist
+    index       u32 hash slots (entity + 1, 0 = empty), open addressing with
+                linear probing on crc32("kind:name") with the kind lowercased
+
+Duplicate (kind, name) entities keep the first definition, as in the graph
+analysis. Malformed references (non-strings) are not stored.
+"""
+from __future__ import annotations
+import os
+import mmap
+import struct
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Tuple
+
+MAGIC = b"CATSNAP\0"
+VERSION = 1
+HEADER = struct.Struct("<8sIIIII5Q")
+ENTITY = struct.Struct("<IIIIII")
+RELATION = struct.Struct("<IIIi")
+U32 = struct.Struct("<I")
+
+
+class SnapshotEntity(NamedTuple):
+    id: int
+    kind: str
+    name: str
+    file: str
+    index: int
+
+
+class SnapshotRelation(NamedTuple):
+    field: str
+    kind: str
+    name: str
+    target: int | None  # entity id, or None if the target does not exist
+
+
+def _ref_key(kind: str, name: str) -> bytes:
+    return f"{kind.lower()}:{name}".encode()
+
+
+def write_snapshot(path: Path, entities: Iterable[Any],
+                   refs: Callable[[Any], Iterable[Tuple[str, Any, Tuple[str, str] | None]]]) -> int:
+    """Write ``entities`` (validate_catalog.Entity) and their references
+    (``refs`` is iter_refs) to ``path`` atomically; return the entity count."""
+    strings: Dict[str, int] = {}
+
+    def intern(value: str) -> int:
+        return strings.setdefault(value, len(strings))
+
+    records = []
+    ids: Dict[Tuple[str, str], int] = {}
+    for entity in entities:
+        if not (isinstance(entity.kind, str) and isinstance(entity.name, str)):
+            continue
+        key = (entity.kind, entity.name)
+        if key not in ids:
+            ids[key] = len(records)
+            records.append(entity)
+
+    entity_blob = bytearray()
+    relation_blob = bytearray()
+    n_relations = 0
+    for entity in records:
+        start = n_relations
+        for field, _, key in refs(entity):
+            if key is None:
+                continue
+            target = ids.get(key, -1)
+            relation_blob += RELATION.pack(intern(field), intern(key[0]), intern(key[1]), target)
+            n_relations += 1
+        entity_blob += ENTITY.pack(intern(entity.kind), intern(entity.name), intern(str(entity.file)),
+                                   entity.index, start, n_relations - start)
+
+    slots = 1
+    while slots < 2 * len(records):
+        slots *= 2
+    table = [0] * slots
+    for i, entity in enumerate(records):
+        slot = zlib.crc32(_ref_key(entity.kind, entity.name)) & (slots - 1)
+        while table[slot]:
+            slot = (slot + 1) & (slots - 1)
+        table[slot] = i + 1
+
+    encoded = [s.encode() for s in strings]
+    offsets = [0]
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+    string_offsets = struct.pack(f"<{len(offsets)}I", *offsets)
+    string_data = b"".join(encoded)
+
+    off_strings = HEADER.size
+    off_data = off_strings + len(string_offsets)
+    off_entities = off_data + len(string_data)
+    off_entities += -off_entities % 8
+    off_relations = off_entities + len(entity_blob)
+    off_index = off_relations + len(relation_blob)
+    header = HEADER.pack(MAGIC, VERSION, len(records), n_relations, len(strings), slots,
+                         off_strings, off_data, off_entities, off_relations, off_index)
+
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(header)
+        f.write(string_offsets)
+        f.write(string_data)
+        f.write(b"\0" * (off_entities - off_data - len(string_data)))
+        f.write(entity_blob)
+        f.write(relation_blob)
+        f.write(struct.pack(f"<{slots}I", *table))
+    os.replace(tmp, path)  # readers holding the old file keep their mapping
+    return len(records)
+
+
+class Snapshot:
+    """Read-only view of a snapshot file; use as a context manager.
+
+    Strings are decoded on access and cached, so repeated lookups of the
+    same kinds and files do not decode them again.
+    """
+
+    def __init__(self, path: Path | str):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.entity_count, self.relation_count, self.string_count, self._slots,
+         self._off_strings, self._off_data, self._off_entities, self._off_relations,
+         self._off_index) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise ValueError(f"{path}: not a catalog snapshot (version {VERSION})")
+        self._strings: Dict[int, str] = {}
+
+    def close(self) -> None:
+        self._map.close()
+
+    def __enter__(self) -> Snapshot:
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.entity_count
+
+    def string(self, sid: int) -> str:
+        value = self._strings.get(sid)
+        if value is None:
+            start, end = struct.unpack_from("<II", self._map, self._off_strings + 4 * sid)
+            value = self._strings[sid] = self._map[self._off_data + start:self._off_data + end].decode()
+        return value
+
+    def entity(self, eid: int) -> SnapshotEntity:
+        if not 0 <= eid < self.entity_count:
+            raise IndexError(eid)
+        kind, name, file, index, _, _ = ENTITY.unpack_from(self._map, self._off_entities + ENTITY.size * eid)
+        return SnapshotEntity(eid, self.string(kind), self.string(name), self.string(file), index)
+
+    def lookup(self, ref: str) -> int | None:
+        """Entity id for ``kind:name`` (kind is case-insensitive), or None."""
+        kind, sep, name = ref.partition(":")
+        if not sep:
+            return None
+        key = _ref_key(kind, name)
+        mask = self._slots - 1
+        slot = zlib.crc32(key) & mask
+        while True:
+            (value,) = U32.unpack_from(self._map, self._off_index + 4 * slot)
+            if not value:
+                return None
+            k, n = struct.unpack_from("<II", self._map, self._off_entities + ENTITY.size * (value - 1))
+            if _ref_key(self.string(k), self.string(n)) == key:
+                return value - 1
+            slot = (slot + 1) & mask
+
+    def get(self, ref: str) -> SnapshotEntity | None:
+        eid = self.lookup(ref)
+        return None if eid is None else self.entity(eid)
+
+    def relations(self, eid: int) -> List[SnapshotRelation]:
+        _, _, _, _, start, count = ENTITY.unpack_from(self._map, self._off_entities + ENTITY.size * eid)
+        out = []
+        for i in range(start, start + count):
+            field, kind, name, target = RELATION.unpack_from(self._map, self._off_relations + RELATION.size * i)
+            out.append(SnapshotRelation(self.string(field), self.string(kind), self.string(name),
+                                        None if target < 0 else target))
+        return out
+
+    def __iter__(self) -> Iterator[SnapshotEntity]:
+        return (self.entity(i) for i in range(self.entity_count))
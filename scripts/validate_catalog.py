@@ -6,65 +6,216 @@ Checks:
     Structure:
         - Multi-document YAML handling (supports --- separators)
         - Required top-level fields: apiVersion, kind, metadata.name
-        - apiVersion must equal backstage.io/v1alpha1
+        - apiVersion must equal backstage.io/v1alpha1 (scaffolder.backstage.io/v1beta3
+          for Templates)
         - kind must be one of allowed kinds
         - metadata.name must be kebab-case and <= 63 chars
         - Duplicate (kind, metadata.name) detection
-    Ownership & relations:
-        - spec.owner entity existence (group:<name>)
-        - Component.spec.system reference to existing System
+    Ownership & relations (one indexed pass, see RELATIONS):
+        - spec.owner entity existence (group:<name>, user:<name>; bare names are groups)
+        - Component/API.spec.system reference to existing System
         - System.spec.domain reference to existing Domain
-    Annotations:
-        - Warn if missing github.com/project-slug on Component/System/API
-        - Warn if missing backstage.io/techdocs-ref on Component/System
+        - Component.spec.providesApis / consumesApis references to existing APIs
+        - Component.spec.dependsOn and subcomponentOf references
+        - Group.spec.parent / children references to existing Groups
+        - A missing target is an error, or a warning when its kind is not an
+          allowed kind or has no entities in the catalog (Resources, or Users
+          loaded by an org provider)
+    API definitions (scripts/catalog_openapi.py):
+        - OpenAPI spec.definition (inline, or $text/$openapi/$yaml/$json file
+          substitutions) is structurally valid and every $ref resolves; each
+          definition file is parsed and checked once per run
+    Graph (scripts/catalog_graph.py):
+        - Group parent/children cycles (errors) and dependsOn cycles (warnings)
+        - Orphan Components/APIs, unreachable Systems and Domains
+        - Owning-team closure per Group
+    Discovery (scripts/catalog_discovery.py):
+        - catalog/*.yaml and catalog-info.yaml by default; --include/--exclude
+          take recursive globs (catalog/**/*.{yaml,yml}), --follow-locations
+          adds Location spec.target(s); directories are scanned concurrently
+    Policy rules (scripts/catalog-rules.yaml, or --rules FILE):
+        - Annotations: github.com/project-slug on Component/System/API and
+          backstage.io/techdocs-ref on Component/System, present and well-formed
+        - spec.owner on Component/System/Domain/API/Group
+        - spec.type, spec.lifecycle (enum), API spec.definition, tag format
+        - Compiled once per process into per-kind check tables
     Reporting:
         - Summary counts by kind
         - Warnings listed (do not fail build)
         - JSON output with --json flag (machine readable)
+    Performance:
+        - --jobs N parses and checks files in N worker processes; results are
+          merged in file order so output and exit code match a serial run
+        - --loader picks the libyaml C loader or the pure-Python one; 'auto'
+          (default) uses libyaml when PyYAML has it. Output is the same either way
+        - --cache DIR skips re-parsing files whose content is unchanged since a
+          previous run; relation checks always run over the full entity index
+        - Documents are validated as the YAML parser yields them; only a compact
+          Entity record per document is kept, so memory stays flat on very
+          large files. --report-memory prints peak RSS
+        - --since GIT_REF reports only on catalog files changed since GIT_REF
+          and on entities whose references point into them; combine with
+          --cache so unchanged files are indexed without re-parsing
+        - --watch keeps the entity index in memory, polls catalog files and
+          re-parses only changed ones, re-checking only affected relations
+        - --profile reports wall time and call counts per phase (load, parse,
+          validate_document, validate_relations, graph, report) and the
+          slowest files, also under "profile" in --json; --profile-dump FILE
+          writes cProfile statistics for pstats/snakeviz
+        - --emit-snapshot FILE writes the entity index and resolved relations
+          as a memory-mappable binary file (scripts/catalog_snapshot.py) that
+          downstream tools read without parsing YAML
 Exit codes:
     0 = success (no errors)
     1 = errors found
 Warnings do not fail build.
 """
 from __future__ import annotations
+import os
 import re
 import sys
 import json
+import heapq
+import pickle
+import hashlib
+import shutil
+import time
 import argparse
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager, nullcontext
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Iterator, Set, Iterable
 
 import yaml
 
+import catalog_discovery
+import catalog_graph
+import catalog_openapi
+import catalog_rules
+import catalog_snapshot
+
 ALLOWED_KINDS = {
-    "Component", "System", "Domain", "API", "Group", "Template", "Location"
+    "Component", "System", "Domain", "API", "Group", "User", "Template", "Location"
 }
+TEMPLATE_API_VERSION = "scaffolder.backstage.io/v1beta3"
+KIND_NAMES = {kind.lower(): kind for kind in ALLOWED_KINDS}
+# Bump when checks change in a way that should invalidate --cache entries
+VALIDATOR_VERSION = "5"
 RE_NAME = re.compile(r"^[a-z0-9]([-a-z0-9]*[a-z0-9])?$")
 REPO_ROOT = Path(__file__).resolve().parent.parent
-CATALOG_FILES = list((REPO_ROOT / "catalog").glob("*.yaml")) + [REPO_ROOT / "catalog-info.yaml"]
 
-errors: List[str] = []
-warnings: List[str] = []
-seen: Dict[Tuple[str, str], Path] = {}
-counts: Dict[str, int] = {}
+# YAML loaders by --loader name. The libyaml-backed loader is several times
+# faster but only present when PyYAML was built against libyaml.
+LOADERS: Dict[str, Any] = {"python": yaml.SafeLoader}
+if getattr(yaml, "__with_libyaml__", False):
+    LOADERS["c"] = yaml.CSafeLoader
+DEFAULT_LOADER = "c" if "c" in LOADERS else "python"
 
-documents: List[Dict[str, Any]] = []  # Flat list of all parsed entity docs with meta info
+# References checked by validate_relations:
+#   (spec field, source kinds or None for any, default target kind, list-valued)
+RELATIONS: List[Tuple[str, Set[str] | None, str, bool]] = [
+    ("owner", None, "Group", False),
+    ("system", {"Component", "API"}, "System", False),
+    ("domain", {"System"}, "Domain", False),
+    ("providesApis", {"Component"}, "API", True),
+    ("consumesApis", {"Component"}, "API", True),
+    ("dependsOn", {"Component"}, "Component", True),
+    ("subcomponentOf", {"Component"}, "Component", False),
+    ("parent", {"Group"}, "Group", False),
+    ("children", {"Group"}, "Group", True),
+]
+# spec fields kept on Entity records; everything else is dropped
+RELATION_FIELDS = tuple(field for field, _, _, _ in RELATIONS)
+LIST_FIELDS = {field for field, _, _, many in RELATIONS if many}
 
 def is_kebab(name: str) -> bool:
     return bool(RE_NAME.match(name))
 
-def validate_document(doc: Dict[str, Any], source: Path, index: int) -> None:
+def resolve_loader(name: str) -> str:
+    """Map a --loader value ('auto', 'c' or 'python') to an available loader name."""
+    if name == "auto":
+        return DEFAULT_LOADER
+    if name not in LOADERS:
+        raise ValueError(f"YAML loader '{name}' is not available (PyYAML built without libyaml?)")
+    return name
+
+def iter_yaml_documents(path: Path, loader: str = "auto") -> Iterator[Any]:
+    """Yield the documents in ``path`` one at a time with the requested loader.
+
+    libyaml words some parse errors differently, so if it fails the file is
+    re-parsed with the pure-Python loader and that error is raised instead.
+    This keeps output identical whichever loader is used.
+    """
+    loader = resolve_loader(loader)
+    with open(path, "r", encoding="utf-8") as f:
+        try:
+            yield from yaml.load_all(f, Loader=LOADERS[loader])
+            return
+        except yaml.YAMLError as e:
+            if loader == "python":
+                raise
+            error = e
+    with open(path, "r", encoding="utf-8") as f:
+        for _ in yaml.load_all(f, Loader=LOADERS["python"]):
+            pass
+    raise error
+
+def load_yaml_documents(path: Path, loader: str = "auto") -> List[Any]:
+    return list(iter_yaml_documents(path, loader))
+
+
+class Entity:
+    """Compact record of one catalog entity: what relation checks and the
+    JSON summary need, without the rest of the parsed document.
+
+    Relation fields (see RELATIONS) are slots holding the raw spec values, or
+    None when absent; ``definition`` holds spec.definition of OpenAPI APIs.
+    This is what ``ValidationState.documents`` and the cache store.
+    """
+    __slots__ = ("kind", "name", "file", "index", "definition") + RELATION_FIELDS
+
+    def __init__(self, doc: Dict[str, Any], file: str, index: int):
+        kind = doc.get("kind")
+        self.kind = sys.intern(kind) if isinstance(kind, str) else kind
+        self.name = doc.get("metadata", {}).get("name")
+        self.file = file
+        self.index = index
+        spec = doc.get("spec", {})
+        for field in RELATION_FIELDS:
+            setattr(self, field, spec.get(field) if isinstance(spec, dict) else None)
+        is_openapi = kind == "API" and isinstance(spec, dict) and spec.get("type") == "openapi"
+        self.definition = spec.get("definition") if is_openapi else None
+
+
+def check_document(doc: Dict[str, Any], source: Path, index: int,
+                   rules: catalog_rules.RuleSet | None = None) -> Dict[str, Any]:
+    """Run the checks that only need the document itself: the structural
+    checks below, then the policy ``rules`` (default: catalog-rules.yaml).
+
+    Returns a result dict that ``ValidationState.register_document`` merges.
+    Keeping this free of shared state lets ``--jobs`` run it in worker
+    processes.
+    """
+    result: Dict[str, Any] = {
+        "prefix": f"{source} [doc {index+1}]",
+        "errors": [],
+        "warnings": [],
+        "key": None,
+        "doc": None,
+    }
     if not doc:  # Skip empty documents
-        warnings.append(f"{source}: document #{index+1} is empty; skipping")
-        return
+        result["warnings"].append(f"{source}: document #{index+1} is empty; skipping")
+        return result
     # Skip pure OpenAPI spec files (root key 'openapi' and missing Backstage fields)
     if 'openapi' in doc and 'apiVersion' not in doc and 'kind' not in doc:
-        warnings.append(f"{source} [doc {index+1}]: Skipping OpenAPI spec (not a Backstage entity)")
-        return
+        result["warnings"].append(f"{source} [doc {index+1}]: Skipping OpenAPI spec (not a Backstage entity)")
+        return result
     def err(msg: str):
-        errors.append(f"{source} [doc {index+1}]: {msg}")
+        result["errors"].append(f"{source} [doc {index+1}]: {msg}")
     def warn(msg: str):
-        warnings.append(f"{source} [doc {index+1}]: {msg}")
+        result["warnings"].append(f"{source} [doc {index+1}]: {msg}")
 
     api_version = doc.get("apiVersion")
     kind = doc.get("kind")
@@ -74,7 +225,7 @@ def validate_document(doc: Dict[str, Any], source: Path, index: int) -> None:
     # Required fields
     if not api_version:
         err("Missing apiVersion")
-    elif api_version != "backstage.io/v1alpha1":
+    elif api_version != "backstage.io/v1alpha1" and not (kind == "Template" and api_version == TEMPLATE_API_VERSION):
         err(f"Unexpected apiVersion '{api_version}'")
 
     if not kind:
@@ -90,159 +241,800 @@ def validate_document(doc: Dict[str, Any], source: Path, index: int) -> None:
         if not RE_NAME.match(name):
             err(f"metadata.name '{name}' not kebab-case")
 
-    # Duplicate detection
+    # Duplicate detection needs every file, so only record the key here
     if kind and name:
-        key = (kind, name)
-        if key in seen:
-            other = seen[key]
-            err(f"Duplicate entity {kind}:{name} already defined in {other}")
-        else:
-            seen[key] = source
-            counts[kind] = counts.get(kind, 0) + 1
-
-    # Annotation checks (soft warnings)
-    annotations = metadata.get("annotations", {}) if isinstance(metadata.get("annotations"), dict) else {}
-    if kind in {"Component", "System", "API"}:
-        if "github.com/project-slug" not in annotations:
-            warn(f"{kind} '{name}' missing annotation github.com/project-slug")
-    if kind in {"Component", "System"}:
-        if "backstage.io/techdocs-ref" not in annotations:
-            warn(f"{kind} '{name}' missing annotation backstage.io/techdocs-ref")
-
-    # Owner warnings for relevant kinds
-    if kind in {"Component", "System", "Domain", "API", "Group"}:
-        spec = doc.get("spec", {})
-        owner = spec.get("owner")
-        if not owner:
-            warn(f"Kind {kind} missing spec.owner")
+        result["key"] = (kind, name)
+
+    # Policy checks from the rules file
+    (rules or catalog_rules.load_rules()).apply(doc, kind, name, err, warn)
 
     # Store for relation validation later
-    doc["__file__"] = str(source)
-    doc["__index__"] = index + 1
-    documents.append(doc)
+    result["doc"] = Entity(doc, sys.intern(str(source)), index + 1)
+    return result
 
 
-def validate_relations() -> None:
-    """Validate cross-entity references (owners, system->domain, component->system)."""
-    # Build lookup maps
-    by_kind_name: Dict[Tuple[str, str], Dict[str, Any]] = {}
-    groups: Dict[str, Dict[str, Any]] = {}
-    for doc in documents:
-        kind = doc.get("kind")
-        name = doc.get("metadata", {}).get("name")
-        if not kind or not name:
-            continue
-        by_kind_name[(kind, name)] = doc
-        if kind == "Group":
-            groups[name] = doc
+def parse_file(file: Path, loader: str = "auto",
+               rules: Path = catalog_rules.DEFAULT_RULES_FILE) -> Dict[str, Any]:
+    """Load one catalog file and check each of its documents against ``rules``.
 
-    # Validate owners
-    for doc in documents:
-        kind = doc.get("kind")
-        spec = doc.get("spec", {})
-        owner = spec.get("owner")
-        if owner and isinstance(owner, str):
-            if owner.startswith("group:"):
-                group_name = owner.split(":", 1)[1]
-                if group_name not in groups:
-                    errors.append(f"{doc['__file__']} [doc {doc['__index__']}] owner references missing group '{group_name}'")
-            # Could extend for user: prefix
-        elif owner and not isinstance(owner, str):
-            warnings.append(f"{doc['__file__']} [doc {doc['__index__']}] owner field not a string")
-
-    # Component -> System relation
-    for doc in documents:
-        if doc.get("kind") == "Component":
-            spec = doc.get("spec", {})
-            system = spec.get("system")
-            if system:
-                sys_key = ("System", system)
-                if sys_key not in by_kind_name:
-                    errors.append(f"{doc['__file__']} [doc {doc['__index__']}] references missing System '{system}'")
-
-    # System -> Domain relation
-    for doc in documents:
-        if doc.get("kind") == "System":
-            spec = doc.get("spec", {})
-            domain = spec.get("domain")
-            if domain:
-                dom_key = ("Domain", domain)
-                if dom_key not in by_kind_name:
-                    errors.append(f"{doc['__file__']} [doc {doc['__index__']}] references missing Domain '{domain}'")
-
-
-def build_json_summary() -> Dict[str, Any]:
-    return {
-        "counts": counts,
-        "errors": errors,
-        "warnings": warnings,
-        "entities": [
-            {
-                "kind": d.get("kind"),
-                "name": d.get("metadata", {}).get("name"),
-                "file": d.get("__file__"),
-                "index": d.get("__index__"),
-            }
-            for d in documents if d.get("kind") and d.get("metadata", {}).get("name")
-        ],
-    }
+    This is the unit of work handed to the process pool with ``--jobs``; it
+    only touches its arguments so results can be merged in file order.
+    """
+    result: Dict[str, Any] = {"file": file, "missing": False, "error": None, "count": 0, "results": [],
+                              "parse_s": 0.0, "check_s": 0.0}
+    if not file.exists():
+        result["missing"] = True
+        return result
+    # Documents are checked as they are parsed and dropped straight away; only
+    # their (small) results are buffered, and discarded if the file turns out
+    # not to parse, exactly as if it had been loaded in one go.
+    results = []
+    ruleset = catalog_rules.load_rules(rules)
+    docs = iter_yaml_documents(file, loader)
+    clock = time.perf_counter
+    parse_s = check_s = 0.0
+    while True:
+        start = clock()
+        try:
+            doc = next(docs)
+        except StopIteration:
+            parse_s += clock() - start
+            break
+        except Exception as e:
+            result["error"] = f"{file}: YAML parse error: {e}"
+            result["parse_s"] = parse_s + clock() - start
+            return result
+        parsed = clock()
+        parse_s += parsed - start
+        results.append(check_document(doc, file, len(results), ruleset))
+        check_s += clock() - parsed
+    result["count"] = len(results)
+    result["results"] = results
+    result["parse_s"] = parse_s
+    result["check_s"] = check_s
+    return result
 
 
-def main() -> int:
-    parser = argparse.ArgumentParser(description="Validate Backstage/Roadie catalog YAML")
-    parser.add_argument("--json", action="store_true", help="Emit JSON summary to stdout (suppresses human output except errors)")
-    args = parser.parse_args()
+class ValidationCache:
+    """Persistent ``parse_file`` results keyed by file path and content hash.
 
-    print("== Catalog Semantic Validation ==")
-    print(f"Scanning {len(CATALOG_FILES)} files...\n")
+    Entries live under a fingerprint directory derived from VALIDATOR_VERSION,
+    ALLOWED_KINDS, the PyYAML version, this script's source and the rules
+    file, so changing any of them starts a fresh cache. ``prune`` drops other fingerprints and
+    evicts least recently used entries once the cache exceeds ``max_bytes``.
+    """
 
-    for file in CATALOG_FILES:
-        if not file.exists():
-            warnings.append(f"Missing expected file {file}")
-            continue
+    def __init__(self, root: Path, max_bytes: int, rules: Path = catalog_rules.DEFAULT_RULES_FILE):
+        self.root = root
+        self.max_bytes = max_bytes
+        fingerprint = hashlib.sha256()
+        fingerprint.update(VALIDATOR_VERSION.encode())
+        fingerprint.update(repr(sorted(ALLOWED_KINDS)).encode())
+        fingerprint.update(yaml.__version__.encode())
+        fingerprint.update(Path(__file__).read_bytes())
+        fingerprint.update(Path(catalog_rules.__file__).read_bytes())
+        fingerprint.update(rules.read_bytes())
+        self.dir = root / fingerprint.hexdigest()[:16]
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, file: Path) -> str | None:
         try:
-            with open(file, "r", encoding="utf-8") as f:
-                docs = list(yaml.safe_load_all(f))
-        except Exception as e:
-            errors.append(f"{file}: YAML parse error: {e}")
+            data = file.read_bytes()
+        except OSError:
+            return None
+        return hashlib.sha256(str(file).encode() + b"\0" + data).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.dir / key[:2] / key
+
+    def get(self, key: str | None) -> Dict[str, Any] | None:
+        if key is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                result = pickle.load(f)
+            os.utime(path)  # mark as recently used for eviction
+        except Exception:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, key: str | None, result: Dict[str, Any]) -> None:
+        if key is None or result["missing"]:
+            return
+        path = self._path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp, "wb") as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except OSError:
+            pass  # caching is best effort
+
+    def prune(self) -> None:
+        if not self.root.is_dir():
+            return
+        for entry in os.scandir(self.root):
+            if entry.is_dir() and entry.path != str(self.dir):
+                shutil.rmtree(entry.path, ignore_errors=True)
+        entries = []
+        total = 0
+        for path in self.dir.glob("*/*"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+                total -= size
+            except OSError:
+                pass
+
+
+def iter_file_results(files: List[Path], jobs: int, loader: str = "auto",
+                      cache: ValidationCache | None = None,
+                      profiler: Profiler | None = None,
+                      rules: Path = catalog_rules.DEFAULT_RULES_FILE) -> Iterator[Dict[str, Any]]:
+    """Yield ``parse_file`` results in the order of ``files``.
+
+    With ``jobs > 1`` the files are parsed in a process pool; ``Executor.map``
+    keeps input order, so merging stays deterministic. With a cache, only
+    files whose content changed are parsed. Freshly parsed files are recorded
+    in ``profiler``; cache hits are not, since they were not parsed.
+    """
+    work = partial(parse_file, loader=loader, rules=rules)
+    keys: List[str | None] = [cache.key(f) for f in files] if cache else [None] * len(files)
+    hits = [cache.get(k) for k in keys] if cache else [None] * len(files)
+    misses = [f for f, hit in zip(files, hits) if hit is None]
+    with ExitStack() as stack:
+        if jobs > 1 and len(misses) > 1:
+            pool = stack.enter_context(ProcessPoolExecutor(max_workers=jobs))
+            fresh = pool.map(work, misses, chunksize=max(1, len(misses) // (jobs * 4)))
+        else:
+            fresh = map(work, misses)
+        for key, hit in zip(keys, hits):
+            if hit is None:
+                hit = next(fresh)
+                if cache:
+                    cache.put(key, hit)
+                if profiler:
+                    profiler.add_file(hit)
+            yield hit
+
+
+class Profiler:
+    """Wall time and call counts per phase plus the slowest files (--profile).
+
+    ``parse`` and ``validate_document`` are summed from the per-file timings
+    measured inside ``parse_file``, so with ``--jobs`` they add up time spent
+    in all workers and can exceed the wall time of ``load``.
+    """
+
+    def __init__(self, top: int = 10):
+        self.top = top
+        self.phases: Dict[str, List[float]] = {}  # phase -> [seconds, calls]
+        self.files: List[Tuple[float, float, float, str, int]] = []
+
+    def add(self, phase: str, seconds: float, calls: int = 1) -> None:
+        entry = self.phases.setdefault(phase, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += calls
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add_file(self, result: Dict[str, Any]) -> None:
+        self.add("parse", result["parse_s"])
+        self.add("validate_document", result["check_s"], result["count"])
+        total = result["parse_s"] + result["check_s"]
+        self.files.append((total, result["parse_s"], result["check_s"],
+                           str(result["file"].relative_to(REPO_ROOT)), result["count"]))
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "phases": {name: {"seconds": round(seconds, 6), "calls": int(calls)}
+                       for name, (seconds, calls) in self.phases.items()},
+            "slowest_files": [
+                {"file": file, "seconds": round(total, 6), "parse_seconds": round(parse_s, 6),
+                 "check_seconds": round(check_s, 6), "documents": count}
+                for total, parse_s, check_s, file, count in heapq.nlargest(self.top, self.files)
+            ],
+        }
+
+
+def _git(*args: str) -> str:
+    return subprocess.run(["git", *args], cwd=REPO_ROOT, check=True,
+                          capture_output=True, text=True).stdout
+
+
+def changed_since(ref: str, discovery: catalog_discovery.CatalogDiscovery,
+                  files: List[Path]) -> Tuple[Set[Path], Set[Tuple[str, str]]]:
+    """Return the catalog files changed since ``ref`` (committed, staged,
+    unstaged or untracked) and the entity keys those files defined at ``ref``.
+    A changed path is a catalog file if it is one of the discovered ``files``
+    or, for deleted files, if ``discovery``'s patterns select it.
+
+    The old keys matter because deleting or renaming an entity can break
+    references from files that did not change.
+    """
+    rels = set(_git("diff", "--name-only", "--no-renames", ref, "--").splitlines())
+    rels.update(_git("ls-files", "--others", "--exclude-standard").splitlines())
+    discovered = {f.relative_to(REPO_ROOT).as_posix() for f in files}
+    rels = {r for r in rels if r in discovered or discovery.matches(r)}
+    old_keys: Set[Tuple[str, str]] = set()
+    for rel in rels:
+        try:
+            old_docs = list(yaml.load_all(_git("show", f"{ref}:{rel}"), Loader=LOADERS[DEFAULT_LOADER]))
+        except (subprocess.CalledProcessError, yaml.YAMLError):
+            continue  # file is new since ref, or was unparseable there
+        for doc in old_docs:
+            if isinstance(doc, dict) and isinstance(doc.get("metadata"), dict):
+                kind, name = doc.get("kind"), doc["metadata"].get("name")
+                if kind and name:
+                    old_keys.add((kind, name))
+    return {(REPO_ROOT / r).resolve() for r in rels}, old_keys
+
+
+@lru_cache(maxsize=65536)
+def parse_entity_ref(ref: str, default_kind: str) -> Tuple[str, str]:
+    """Parse a Backstage entity reference ``[kind:][namespace/]name``.
+
+    Kinds are case-insensitive and normalised to their catalog spelling.
+    Namespaces are not modelled by this validator, so they are dropped.
+    """
+    kind, sep, rest = ref.partition(":")
+    if not sep:
+        kind, rest = default_kind, ref
+    kind = KIND_NAMES.get(kind.lower(), kind[:1].upper() + kind[1:])
+    return kind, rest.rpartition("/")[2]
+
+
+def iter_refs(entity: Entity) -> Iterator[Tuple[str, Any, Tuple[str, str] | None]]:
+    """Yield ``(spec field, raw value, (kind, name))`` for each reference of
+    ``entity``, per RELATIONS. The key is None when the value is not a string;
+    list fields that are not lists are yielded once with the whole value.
+    """
+    kind = entity.kind
+    for field, source_kinds, default_kind, many in RELATIONS:
+        if source_kinds and kind not in source_kinds:
             continue
-        print(f"File: {file.relative_to(REPO_ROOT)} ({len(docs)} document(s))")
-        for idx, doc in enumerate(docs):
-            validate_document(doc, file, idx)
+        value = getattr(entity, field)
+        if not value:
+            continue
+        if many and not isinstance(value, list):
+            yield field, value, None
+            continue
+        for item in (value if many else [value]):
+            key = parse_entity_ref(item, default_kind) if isinstance(item, str) else None
+            yield field, item, key
 
-    # Relation checks (after all docs loaded)
-    validate_relations()
 
+def relation_diagnostics(entity: Entity, index: Set[Tuple[str, str]],
+                         kinds: Set[str] | None = None) -> List[Tuple[str, bool, str]]:
+    """``(spec field, is_error, message)`` for each reference of ``entity``
+    that is malformed or does not resolve against ``index``.
+
+    A missing target is an error when this catalog defines entities of its
+    kind (``kinds``, default: every kind in ``index``); otherwise they come
+    from elsewhere (a provider, a plugin) and it is only a warning.
+    """
+    if kinds is None:
+        kinds = {kind for kind, _ in index}
+    found = []
+    where = f"{entity.file} [doc {entity.index}]"
+    for field, _, key in iter_refs(entity):
+        if key is None:
+            raw = getattr(entity, field)
+            if field not in LIST_FIELDS:
+                problem = "field not a string"
+            elif isinstance(raw, list):
+                problem = "entry not a string"
+            else:
+                problem = "field not a list"
+            found.append((field, False, f"{where} {field} {problem}"))
+        elif key not in index:
+            kind, name = key
+            if field in ("system", "domain"):
+                msg = f"references missing {kind} '{name}'"
+            else:
+                msg = f"{field} references missing {kind} '{name}'"
+            if kind in kinds and kind in ALLOWED_KINDS:
+                found.append((field, True, f"{where} {msg}"))
+            else:
+                found.append((field, False, f"{where} {msg} (no {kind} entities in the catalog)"))
+    return found
+
+
+class ValidationState:
+    """Everything a validation run accumulates: diagnostics, the duplicate
+    index, per-kind counts and the Entity records used by relation checks.
+
+    A fresh state is built for each run; --watch builds a new one from its
+    in-memory file results whenever something changes.
+    """
+
+    def __init__(self):
+        self.errors: List[str] = []
+        self.warnings: List[str] = []
+        self.seen: Dict[Tuple[str, str], Path] = {}
+        self.counts: Dict[str, int] = {}
+        self.documents: List[Entity] = []  # compact entity records, in file/document order
+        self.graph: Dict[str, Any] = {}
+
+    def register_document(self, result: Dict[str, Any], source: Path, report: bool = True,
+                          affected_keys: Set[Tuple[str, str]] | None = None) -> None:
+        """Merge a ``check_document`` result, in call order.
+
+        With ``report=False`` (unchanged files under --since) the document is
+        only indexed; of its diagnostics, just duplicates of ``affected_keys``
+        are kept.
+        """
+        if report:
+            self.errors.extend(result["errors"])
+        key = result["key"]
+        if key:
+            if key in self.seen:
+                other = self.seen[key]
+                if report or (affected_keys and key in affected_keys):
+                    self.errors.append(f"{result['prefix']}: Duplicate entity {key[0]}:{key[1]} already defined in {other}")
+            else:
+                self.seen[key] = source
+                self.counts[key[0]] = self.counts.get(key[0], 0) + 1
+        if report:
+            self.warnings.extend(result["warnings"])
+        if result["doc"] is not None:
+            self.documents.append(result["doc"])
+
+    def validate_document(self, doc: Dict[str, Any], source: Path, index: int) -> None:
+        self.register_document(check_document(doc, source, index), source)
+
+    def merge_file_result(self, result: Dict[str, Any], report: bool = True,
+                          affected_keys: Set[Tuple[str, str]] | None = None, echo: bool = True) -> None:
+        """Apply a ``parse_file`` result, producing the same output as a serial scan.
+
+        ``report`` and ``affected_keys`` are passed through to
+        ``register_document``; ``echo`` prints the per-file line.
+        """
+        file = result["file"]
+        if result["missing"]:
+            if report:
+                self.warnings.append(f"Missing expected file {file}")
+            return
+        if result["error"]:
+            if report:
+                self.errors.append(result["error"])
+            return
+        if report and echo:
+            print(f"File: {file.relative_to(REPO_ROOT)} ({result['count']} document(s))")
+        for doc_result in result["results"]:
+            self.register_document(doc_result, file, report, affected_keys)
+
+    def affected_documents(self, changed_files: Set[str], changed_keys: Set[Tuple[str, str]]) -> List[Entity]:
+        """Documents whose relations may differ from the last run: every entity
+        in a changed file plus entities referencing a key defined (now or
+        before the change) in a changed file.
+        """
+        return [
+            entity for entity in self.documents
+            if entity.file in changed_files or any(key in changed_keys for _, _, key in iter_refs(entity))
+        ]
+
+    def validate_relations(self, targets: Iterable[Entity] | None = None,
+                           previous: Dict[Tuple[str, int], List[Tuple[str, bool, str]]] | None = None
+                           ) -> Dict[Tuple[str, int], List[Tuple[str, bool, str]]]:
+        """Validate cross-entity references listed in RELATIONS.
+
+        Builds one (kind, name) index, then resolves every reference of every
+        target in a single pass. References resolve against every document;
+        only ``targets`` (default: all documents) are checked. With
+        ``previous`` (--watch), every document is reported, reusing earlier
+        results for documents that are not targets. Diagnostics are grouped by
+        spec field in RELATIONS order so output stays stable.
+
+        Returns the per-document results, keyed by (file, index).
+        """
+        index = {(e.kind, e.name) for e in self.documents if e.kind and e.name}
+        kinds = {kind for kind, _ in index}
+        per_entity: Dict[Tuple[str, int], List[Tuple[str, bool, str]]] = {}
+        if previous is None:
+            for entity in (self.documents if targets is None else targets):
+                per_entity[(entity.file, entity.index)] = relation_diagnostics(entity, index, kinds)
+        else:
+            recheck = {(e.file, e.index) for e in (self.documents if targets is None else targets)}
+            for entity in self.documents:
+                ident = (entity.file, entity.index)
+                if ident in previous and ident not in recheck:
+                    per_entity[ident] = previous[ident]
+                else:
+                    per_entity[ident] = relation_diagnostics(entity, index, kinds)
+
+        found: Dict[str, List[Tuple[bool, str]]] = {field: [] for field in RELATION_FIELDS}
+        for diagnostics in per_entity.values():
+            for field, is_error, msg in diagnostics:
+                found[field].append((is_error, msg))
+        for field in RELATION_FIELDS:
+            for is_error, msg in found[field]:
+                (self.errors if is_error else self.warnings).append(msg)
+        return per_entity
+
+    def validate_definitions(self, targets: Iterable[Entity] | None = None, loader: str = DEFAULT_LOADER) -> None:
+        """Check the OpenAPI definitions of ``targets`` (default: all
+        documents). One resolver serves the whole pass, so a definition file
+        shared by many APIs is parsed and checked once."""
+        resolver = catalog_openapi.DefinitionResolver(LOADERS[loader])
+        for entity in (self.documents if targets is None else targets):
+            if entity.definition is None:
+                continue
+            for problem in catalog_openapi.check_definition(entity.definition, Path(entity.file), resolver):
+                self.errors.append(f"{entity.file} [doc {entity.index}]: spec.definition: {problem}")
+
+    def analyze_graph(self, scope: Set[Tuple[str, str]] | None = None) -> None:
+        """Run catalog_graph over the documents and report its cycles: Group
+        hierarchy cycles are errors, dependsOn cycles warnings. With ``scope``
+        (--since, --watch) only cycles through an affected entity are reported.
+        """
+        self.graph = catalog_graph.analyze(self.documents, iter_refs)
+        for target, label, cycles in ((self.errors, "Group hierarchy cycle", self.graph["group_cycles"]),
+                                      (self.warnings, "dependsOn cycle", self.graph["dependency_cycles"])):
+            for cycle in cycles:
+                if scope is None or any(key in scope for key in cycle):
+                    target.append(f"{label} between {', '.join(catalog_graph.entity_ref(k) for k in cycle)}")
+
+    def build_json_summary(self) -> Dict[str, Any]:
+        return {
+            "counts": self.counts,
+            "errors": self.errors,
+            "warnings": self.warnings,
+            "entities": [
+                {"kind": e.kind, "name": e.name, "file": e.file, "index": e.index}
+                for e in self.documents if e.kind and e.name
+            ],
+            "graph": catalog_graph.to_json(self.graph),
+        }
+
+
+def _format_refs(keys: List[Tuple[str, str]], limit: int = 10) -> str:
+    if not keys:
+        return "none"
+    shown = ", ".join(catalog_graph.entity_ref(k) for k in keys[:limit])
+    return shown + (f", ... ({len(keys)} total)" if len(keys) > limit else "")
+
+
+def print_graph(graph: Dict[str, Any]) -> None:
+    print("\n== Graph ==")
+    print(f"  Orphans (Components/APIs in no System): {_format_refs(graph['orphans'])}")
+    print(f"  Unreachable Systems (no Domain): {_format_refs(graph['unreachable_systems'])}")
+    print(f"  Unreachable Domains (no Systems): {_format_refs(graph['unreachable_domains'])}")
+    if graph["ownership"]:
+        print("  Owning-team closure:")
+        for group, owned in graph["ownership"].items():
+            print(f"    {catalog_graph.entity_ref(group)}: {len(owned)} entit{'y' if len(owned) == 1 else 'ies'}")
+
+
+def peak_memory() -> Dict[str, float] | None:
+    """Peak RSS in MB of this process and of its largest finished worker
+    (--jobs), or None where the ``resource`` module is unavailable (Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    scale = 1 if sys.platform == "darwin" else 1024  # ru_maxrss is bytes on macOS, KiB elsewhere
+    return {
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20, 1),
+        "peak_worker_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale / 2**20, 1),
+    }
+
+
+def print_profile(profile: Dict[str, Any]) -> None:
+    print("\n== Profile ==")
+    for name, phase in profile["phases"].items():
+        print(f"  {name}: {phase['seconds'] * 1000:.1f} ms ({phase['calls']} call(s))")
+    if profile["slowest_files"]:
+        print("  Slowest files:")
+        for entry in profile["slowest_files"]:
+            print(f"    {entry['seconds'] * 1000:8.1f} ms  {entry['file']} ({entry['documents']} document(s), "
+                  f"parse {entry['parse_seconds'] * 1000:.1f} ms)")
+
+
+def print_report(state: ValidationState, args: argparse.Namespace, profiler: Profiler | None = None) -> int:
+    """Print the JSON or human report for ``state``; return the exit code."""
     if args.json:
         # Emit JSON only
-        summary = build_json_summary()
+        if profiler:
+            with profiler.phase("report"):
+                summary = state.build_json_summary()
+            summary["profile"] = profiler.to_json()
+        else:
+            summary = state.build_json_summary()
+        if args.report_memory:
+            summary["memory"] = peak_memory()
         print(json.dumps(summary, indent=2))
-        return 1 if errors else 0
+        return 1 if state.errors else 0
+    if profiler:
+        with profiler.phase("report"):
+            code = _print_human_report(state, args)
+        print_profile(profiler.to_json())
+        return code
+    return _print_human_report(state, args)
+
+
+def _print_human_report(state: ValidationState, args: argparse.Namespace) -> int:
 
     # Human output
     print("\n== Summary ==")
-    if counts:
-        for kind in sorted(counts):
-            print(f"  {kind}: {counts[kind]}")
+    if state.counts:
+        for kind in sorted(state.counts):
+            print(f"  {kind}: {state.counts[kind]}")
     else:
         print("  No valid entities discovered.")
+    if args.report_memory:
+        memory = peak_memory()
+        if memory:
+            print(f"  Peak memory: {memory['peak_rss_mb']} MB RSS (largest worker {memory['peak_worker_rss_mb']} MB)")
+        else:
+            print("  Peak memory: not available on this platform")
+    print_graph(state.graph)
 
-    if warnings:
+    if state.warnings:
         print("\n== Warnings ==")
-        for w in warnings:
+        for w in state.warnings:
             print(f"  WARN: {w}")
     else:
         print("\nNo warnings.")
 
-    if errors:
+    if state.errors:
         print("\n== Errors ==")
-        for e in errors:
+        for e in state.errors:
             print(f"  ERROR: {e}")
-        print(f"\nValidation failed with {len(errors)} error(s).")
+        print(f"\nValidation failed with {len(state.errors)} error(s).")
         return 1
 
     print("\nAll catalog entities passed semantic validation.")
     return 0
 
+
+def emit_snapshot(state: ValidationState, path: Path) -> None:
+    count = catalog_snapshot.write_snapshot(path, state.documents, iter_refs)
+    print(f"Snapshot: {count} entities written to {path}", file=sys.stderr)
+
+
+def _file_keys(result: Dict[str, Any]) -> Set[Tuple[str, str]]:
+    return {r["key"] for r in result["results"] if r["key"]}
+
+
+class WatchSession:
+    """Long-running --watch loop.
+
+    Keeps every file's ``parse_file`` result and every entity's relation
+    diagnostics in memory. Catalog files are polled (stat only) every
+    ``interval`` seconds; changed, added or removed files are re-parsed, a
+    new ValidationState is merged from the kept results, and relations are
+    re-resolved only for entities affected by the change.
+    """
+
+    def __init__(self, args: argparse.Namespace, loader: str, jobs: int, cache: ValidationCache | None,
+                 discovery: catalog_discovery.CatalogDiscovery):
+        self.args = args
+        self.loader = loader
+        self.interval = args.watch_interval
+        self.discovery = discovery
+        self.files = discovery.files()
+        self.stamps = {f: self._stamp(f) for f in self.files}
+        self.results = {r["file"]: r for r in iter_file_results(self.files, jobs, loader, cache, rules=args.rules)}
+        self.relations: Dict[Tuple[str, int], List[Tuple[str, bool, str]]] = {}
+        self.kinds: Set[str] = set()
+
+    @staticmethod
+    def _stamp(file: Path) -> Tuple[int, int] | None:
+        try:
+            st = file.stat()
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def poll(self) -> Set[Path]:
+        """Re-parse files whose stat changed; return the set of changed files."""
+        files = self.discovery.files()
+        stamps = {f: self._stamp(f) for f in files}
+        # A new path is changed even if it cannot be stat'ed (it may have gone again since the listing)
+        changed = {f for f in files if f not in self.stamps or stamps[f] != self.stamps[f]}
+        changed.update(f for f in self.files if f not in stamps)
+        self.files, self.stamps = files, stamps
+        return changed
+
+    def validate(self, changed: Set[Path] | None) -> int:
+        """Rebuild the state after ``changed`` files (None: initial run) and report."""
+        changed_keys: Set[Tuple[str, str]] = set()
+        if changed:
+            for file in changed:
+                old = self.results.pop(file, None)
+                if old:
+                    changed_keys |= _file_keys(old)
+                if file in self.stamps:
+                    self.results[file] = parse_file(file, self.loader, self.args.rules)
+                    changed_keys |= _file_keys(self.results[file])
+        state = ValidationState()
+        for file in self.files:
+            state.merge_file_result(self.results[file], echo=changed is None or file in changed)
+        # Whether a missing target is an error depends on which kinds exist, so recheck everything when they change
+        kinds = {e.kind for e in state.documents if e.kind and e.name}
+        if changed is None or kinds != self.kinds:
+            self.relations = state.validate_relations(previous={})
+        else:
+            affected = state.affected_documents({str(f) for f in changed}, changed_keys)
+            self.relations = state.validate_relations(affected, previous=self.relations)
+        self.kinds = kinds
+        state.validate_definitions(loader=self.loader)
+        state.analyze_graph()
+        if self.args.emit_snapshot:
+            emit_snapshot(state, self.args.emit_snapshot)
+        return print_report(state, self.args)
+
+    def run(self) -> int:
+        code = self.validate(None)
+        print(f"\nWatching {len(self.files)} files for changes (Ctrl+C to stop)...")
+        try:
+            while True:
+                time.sleep(self.interval)
+                start = time.perf_counter()
+                changed = self.poll()
+                if not changed:
+                    continue
+                print(f"\n== {time.strftime('%H:%M:%S')} {len(changed)} file(s) changed ==")
+                code = self.validate(changed)
+                print(f"\nRe-validated in {(time.perf_counter() - start) * 1000:.1f} ms; watching...")
+        except KeyboardInterrupt:
+            return code
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Validate Backstage/Roadie catalog YAML")
+    parser.add_argument("--json", action="store_true", help="Emit JSON summary to stdout (suppresses human output except errors)")
+    parser.add_argument("--jobs", "-j", type=int, default=1, metavar="N",
+                        help="Parse and check files in N worker processes (0 = one per CPU; default 1)")
+    parser.add_argument("--loader", choices=["auto", "c", "python"], default="auto",
+                        help="YAML loader: libyaml ('c'), pure Python, or 'auto' to prefer libyaml (default)")
+    parser.add_argument("--cache", type=Path, metavar="DIR",
+                        help="Reuse results for unchanged files from an on-disk cache in DIR")
+    parser.add_argument("--cache-max-mb", type=float, default=256, metavar="MB",
+                        help="Evict least recently used cache entries above this size (default 256)")
+    parser.add_argument("--report-memory", action="store_true",
+                        help="Report peak memory use (RSS) of the validator and its workers")
+    parser.add_argument("--since", metavar="GIT_REF",
+                        help="Only report on catalog files changed since GIT_REF and relations they affect")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running and re-validate changed files as they are saved")
+    parser.add_argument("--watch-interval", type=float, default=0.5, metavar="SECONDS",
+                        help="Polling interval for --watch (default 0.5)")
+    parser.add_argument("--include", action="append", metavar="GLOB",
+                        help="Catalog files to validate, relative to the repo root; repeatable. Supports **, "
+                             "and {yaml,yml} (default: " + " ".join(catalog_discovery.DEFAULT_INCLUDE) + ")")
+    parser.add_argument("--exclude", action="append", default=[], metavar="GLOB",
+                        help="Skip matching files or directories; repeatable. Patterns without / match names "
+                             "at any depth (always excluded: " + " ".join(catalog_discovery.DEFAULT_EXCLUDE) + ")")
+    parser.add_argument("--follow-locations", action="store_true",
+                        help="Also validate files named by Location entities' spec.target(s), transitively")
+    parser.add_argument("--scan-threads", type=int, default=8, metavar="N",
+                        help="Threads scanning directories during discovery (default 8)")
+    parser.add_argument("--rules", type=Path, default=catalog_rules.DEFAULT_RULES_FILE, metavar="FILE",
+                        help="Policy rules file (default scripts/catalog-rules.yaml)")
+    parser.add_argument("--emit-snapshot", type=Path, metavar="FILE",
+                        help="Write entities and resolved relations to a binary snapshot (see catalog_snapshot.py)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Report wall time and call counts per phase and the slowest files (also in --json)")
+    parser.add_argument("--profile-top", type=int, default=10, metavar="N",
+                        help="Number of slowest files listed by --profile (default 10)")
+    parser.add_argument("--profile-dump", type=Path, metavar="FILE",
+                        help="Write cProfile statistics (pstats format) to FILE; with --jobs, "
+                             "time spent in workers is not included")
+    args = parser.parse_args()
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    try:
+        loader = resolve_loader(args.loader)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.watch and args.since:
+        parser.error("--watch and --since cannot be combined")
+    if args.watch and (args.profile or args.profile_dump):
+        parser.error("--profile cannot be combined with --watch")
+    args.rules = args.rules.resolve()
+    try:
+        catalog_rules.load_rules(args.rules)
+    except catalog_rules.RuleError as e:
+        parser.error(f"--rules: {e}")
+
+    profiler = Profiler(args.profile_top) if args.profile else None
+    phase = profiler.phase if profiler else (lambda name: nullcontext())
+    if args.profile_dump:
+        import cProfile
+        dump = cProfile.Profile()
+        dump.enable()
+
+    discovery = catalog_discovery.CatalogDiscovery(
+        REPO_ROOT, args.include or catalog_discovery.DEFAULT_INCLUDE,
+        list(catalog_discovery.DEFAULT_EXCLUDE) + args.exclude,
+        args.follow_locations, args.scan_threads, LOADERS[loader])
+    with phase("discover"):
+        files = discovery.files()
+
+    changed: Set[Path] | None = None
+    changed_keys: Set[Tuple[str, str]] = set()
+    if args.since:
+        try:
+            changed, changed_keys = changed_since(args.since, discovery, files)
+        except (OSError, subprocess.CalledProcessError) as e:
+            parser.error(f"--since {args.since}: {getattr(e, 'stderr', None) or e}")
+
+    print("== Catalog Semantic Validation ==")
+    if changed is None:
+        print(f"Scanning {len(files)} files...\n")
+    else:
+        n_changed = sum(1 for f in files if f.resolve() in changed)
+        print(f"Scanning {len(files)} files ({n_changed} changed since {args.since})...\n")
+
+    cache = ValidationCache(args.cache, int(args.cache_max_mb * 1024 * 1024), args.rules) if args.cache else None
+    if args.watch:
+        return WatchSession(args, loader, jobs, cache, discovery).run()
+
+    state = ValidationState()
+    with phase("load"):
+        results = iter_file_results(files, jobs, loader, cache, profiler, args.rules)
+        if changed is None:
+            for result in results:
+                state.merge_file_result(result)
+        else:
+            # Keys defined by changed files now, plus those they defined at the base ref
+            results = list(results)
+            for result in results:
+                if result["file"].resolve() in changed:
+                    changed_keys |= _file_keys(result)
+            for result in results:
+                state.merge_file_result(result, result["file"].resolve() in changed, changed_keys)
+    if cache:
+        cache.prune()
+        print(f"Cache: {cache.hits} hit(s), {cache.misses} miss(es)", file=sys.stderr)
+
+    # Relation checks (after all docs loaded)
+    if changed is None:
+        with phase("validate_relations"):
+            state.validate_relations()
+        with phase("validate_definitions"):
+            state.validate_definitions(loader=loader)
+        with phase("graph"):
+            state.analyze_graph()
+    else:
+        affected = state.affected_documents({str(f) for f in files if f.resolve() in changed}, changed_keys)
+        with phase("validate_relations"):
+            state.validate_relations(affected)
+        with phase("validate_definitions"):
+            state.validate_definitions(affected, loader)
+        with phase("graph"):
+            state.analyze_graph({(e.kind, e.name) for e in affected})
+    if args.emit_snapshot:
+        with phase("snapshot"):
+            emit_snapshot(state, args.emit_snapshot)
+    code = print_report(state, args, profiler)
+    if args.profile_dump:
+        dump.disable()
+        dump.dump_stats(args.profile_dump)
+        print(f"cProfile statistics written to {args.profile_dump}", file=sys.stderr)
+    return code
+
 if __name__ == "__main__":
     raise SystemExit(main())
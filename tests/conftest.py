@@ -0,0 +1,13 @@
+"""
+Tests for the scripts in tools/ and scripts/. Those are run as plain
+scripts that import their siblings by name, so both directories are put on
+sys.path here, the way `python tools/compress.py` would see them.
+"""
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+for sub in ('tools', 'scripts'):
+    path = str(ROOT / sub)
+    if path not in sys.path:
+        sys.path.insert(0, path)
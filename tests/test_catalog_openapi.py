@@ -0,0 +1,45 @@
+"""Tests for scripts/catalog_openapi.py."""
+import catalog_openapi
+
+SPEC = """openapi: 3.0.0
+info:
+  title: Pets
+  version: "1"
+paths:
+  /pets:
+    get:
+      responses:
+        "200":
+          $ref: "#/components/responses/Pets"
+components:
+  responses:
+    Pets:
+      description: ok
+"""
+
+
+def check(definition, source):
+    return catalog_openapi.check_definition(definition, source, catalog_openapi.DefinitionResolver())
+
+
+def test_non_string_key_is_an_inline_definition(tmp_path):
+    source = tmp_path / "catalog-info.yaml"
+    for definition in ({1: "x"}, {None: {}}):
+        assert check(definition, source) == ["unsupported openapi version 'None'", "missing info"]
+
+
+def test_substitutions(tmp_path):
+    source = tmp_path / "catalog-info.yaml"
+    (tmp_path / "api.yaml").write_text(SPEC, encoding="utf-8")
+    assert check({"$text": "api.yaml"}, source) == []
+    assert check({"$text": "https://example.com/api.yaml"}, source) == []
+    assert check({"$text": 3}, source) == ["$text target is not a string"]
+    assert check({"$bogus": "api.yaml"}, source) == ["unsupported substitution $bogus"]
+    assert check({"$text": "missing.yaml"}, source)[0].startswith("missing.yaml: cannot read ")
+
+
+def test_inline_definition_refs(tmp_path):
+    source = tmp_path / "catalog-info.yaml"
+    assert check(SPEC, source) == []
+    problems = check(SPEC.replace("#/components/responses/Pets", "#/components/responses/Cats"), source)
+    assert len(problems) == 1 and "#/components/responses/Cats" in problems[0]
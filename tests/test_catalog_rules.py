@@ -0,0 +1,124 @@
+"""Tests for scripts/catalog_rules.py."""
+import pytest
+import yaml
+
+import bench_catalog
+import catalog_rules
+import validate_catalog as vc
+
+
+def run(rules, doc):
+    """(errors, warnings) of ``rules`` for ``doc``."""
+    errors, warnings = [], []
+    metadata = doc.get("metadata")
+    name = metadata.get("name") if isinstance(metadata, dict) else None
+    rules.apply(doc, doc.get("kind"), name, errors.append, warnings.append)
+    return errors, warnings
+
+
+def compile_one(**rule):
+    return catalog_rules.compile_rules({"rules": [rule]})
+
+
+def test_baseline_rules_match_hardcoded_policy():
+    rules = catalog_rules.compile_rules(bench_catalog.BASELINE_RULES)
+    hardcoded = bench_catalog.HardcodedPolicy()
+    docs = [yaml.safe_load(text) for text in bench_catalog.generate_documents(300)]
+    for i, doc in enumerate(docs):
+        if i % 5 == 0:
+            doc["metadata"].pop("annotations", None)
+        if i % 7 == 0:
+            doc["spec"].pop("owner", None)
+        if i % 4 == 0:
+            doc["metadata"]["annotations"] = {"github.com/project-slug": ""}
+    reported = 0
+    for doc in docs:
+        assert run(rules, doc) == run(hardcoded, doc)
+        reported += len(run(rules, doc)[1])
+    assert reported
+
+
+def test_present_empty_annotation_is_checked_not_missing():
+    rules = compile_one(annotation="a/b", required=True, pattern="^x")
+    assert run(rules, {"kind": "C", "metadata": {"name": "n"}}) == ([], ["C 'n' missing annotation a/b"])
+    assert run(rules, {"kind": "C", "metadata": {"name": "n", "annotations": {"a/b": ""}}}) == (
+        [], ["C 'n' annotation a/b '' does not match ^x"])
+    assert run(rules, {"kind": "C", "metadata": {"name": "n", "annotations": {"a/b": "xy"}}}) == ([], [])
+
+
+def test_empty_field_is_missing():
+    rules = compile_one(field="spec.owner", required=True, severity="error")
+    for spec in ({}, {"owner": ""}, {"owner": []}, None, "not a mapping"):
+        assert run(rules, {"kind": "C", "metadata": {"name": "n"}, "spec": spec}) == (["C 'n' missing spec.owner"], [])
+
+
+def test_enum_failure_skips_pattern():
+    rules = compile_one(field="spec.lifecycle", enum=["production"], pattern="^p")
+    doc = {"kind": "C", "metadata": {"name": "n"}, "spec": {"lifecycle": "beta"}}
+    assert run(rules, doc) == ([], ["C 'n' spec.lifecycle 'beta' not one of ['production']"])
+    doc["spec"]["lifecycle"] = ["production"]  # unhashable values are not allowed either
+    assert len(run(rules, doc)[1]) == 1
+
+
+def test_pattern_reports_first_bad_list_item_once():
+    rules = compile_one(field="metadata.tags", pattern="^[a-z]+$")
+    doc = {"kind": "C", "metadata": {"name": "n", "tags": ["ok", "Bad", "Worse", 3]}}
+    assert run(rules, doc) == ([], ["C 'n' metadata.tags 'Bad' does not match ^[a-z]+$"])
+
+
+def test_document_path_lookup():
+    rules = compile_one(field="spec.profile.email", required=True)
+    assert run(rules, {"kind": "User", "metadata": {"name": "u"}, "spec": {"profile": {"email": "a@b"}}}) == ([], [])
+    assert run(rules, {"kind": "User", "metadata": {"name": "u"}, "spec": {"profile": "x"}}) == (
+        [], ["User 'u' missing spec.profile.email"])
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("fixed text", "fixed text"),
+    ("{kind}/{name}", "C/n"),
+    ("{kind!r} {name!r} {value}", "'C' 'n' beta"),
+    ("{name:>4}|{value.__class__.__name__}", "   n|str"),
+    ("{{literal}} {name} {field} {enum}", "{literal} n spec.lifecycle ['production']"),
+])
+def test_messages(message, expected):
+    for kinds in (None, ["C"]):  # formatted per kind, and for any kind
+        rule = {"field": "spec.lifecycle", "enum": ["production"], "message": message}
+        if kinds:
+            rule["kinds"] = kinds
+        doc = {"kind": "C", "metadata": {"name": "n"}, "spec": {"lifecycle": "beta"}}
+        assert run(catalog_rules.compile_rules({"rules": [rule]}), doc) == ([], [expected])
+
+
+def test_rules_without_kinds_apply_to_every_kind_in_order():
+    rules = catalog_rules.compile_rules({"rules": [
+        {"field": "spec.a", "required": True},
+        {"kinds": ["C"], "field": "spec.b", "required": True},
+        {"field": "spec.c", "required": True},
+    ]})
+    assert run(rules, {"kind": "C", "metadata": {"name": "n"}})[1] == [
+        "C 'n' missing spec.a", "C 'n' missing spec.b", "C 'n' missing spec.c"]
+    assert run(rules, {"kind": "D", "metadata": {"name": "n"}})[1] == ["D 'n' missing spec.a", "D 'n' missing spec.c"]
+    assert run(rules, {"kind": ["odd"], "metadata": "not a mapping"})[1] == [
+        "['odd'] 'None' missing spec.a", "['odd'] 'None' missing spec.c"]
+
+
+@pytest.mark.parametrize("rule", [
+    "not a mapping",
+    {"field": "spec.a", "annotation": "a"},
+    {"field": "spec.a", "bogus": 1},
+    {"field": "spec.a", "enum": "production"},
+    {"field": "spec.a", "pattern": "("},
+    {"field": "spec.a", "severity": "fatal"},
+    {"field": "spec.a", "message": "{unknown}"},
+    {"field": "spec.a", "kinds": "Component"},
+])
+def test_invalid_rules(rule):
+    with pytest.raises(catalog_rules.RuleError):
+        catalog_rules.compile_rules({"rules": [rule]})
+
+
+def test_default_rules_file_loads():
+    rules = catalog_rules.load_rules()
+    result = vc.check_document({"apiVersion": "backstage.io/v1alpha1", "kind": "Component",
+                                "metadata": {"name": "c"}, "spec": {}}, vc.Path("c.yaml"), 0, rules)
+    assert "c.yaml [doc 1]: Kind Component missing spec.owner" in result["warnings"]
@@ -0,0 +1,213 @@
+"""Tests for tools/compress.py."""
+import io
+import os
+import random
+import shutil
+import subprocess
+import tarfile
+import zipfile
+import zlib
+
+import pytest
+
+import compress
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def read_tree(root):
+    """{relative path: bytes} of the regular files under `root` (links followed)."""
+    out = {}
+    for base, _, files in os.walk(root):
+        for name in files:
+            full = os.path.join(base, name)
+            with open(full, 'rb') as f:
+                out[os.path.relpath(full, root).replace(os.sep, '/')] = f.read()
+    return out
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """A source tree with compressible, incompressible, empty and duplicate files."""
+    rng = random.Random(0)
+    src = tmp_path / 'src'
+    write(str(src / 'text.txt'), b'lorem ipsum dolor sit amet\n' * 20000)
+    write(str(src / 'random.bin'), bytes(rng.getrandbits(8) for _ in range(300000)))
+    write(str(src / 'empty'), b'')
+    write(str(src / 'sub' / 'deeper' / 'copy.txt'), b'lorem ipsum dolor sit amet\n' * 20000)
+    write(str(src / 'sub' / 'small.json'), b'{"a": 1}')
+    return src
+
+
+def extract_tar(path, dest):
+    if path.endswith('.zst'):
+        data = subprocess.run(['zstd', '-dc', path], check=True, capture_output=True).stdout
+        tar = tarfile.open(fileobj=io.BytesIO(data))
+    else:
+        tar = tarfile.open(path)
+    with tar:
+        tar.extractall(dest, filter='data')
+    return read_tree(dest)
+
+
+def test_crc32_combine():
+    rng = random.Random(1)
+    data = bytes(rng.getrandbits(8) for _ in range(5000))
+    for split in (0, 1, 7, 2500, 4999, 5000):
+        a, b = data[:split], data[split:]
+        assert compress.crc32_combine(zlib.crc32(a), zlib.crc32(b), len(b)) == zlib.crc32(data)
+
+
+@pytest.mark.parametrize('jobs', [1, 4])
+@pytest.mark.parametrize('dedup', [False, True])
+def test_zip_round_trip(tree, tmp_path, jobs, dedup):
+    out = str(tmp_path / 'out.zip')
+    # small deflate chunks, so the parallel writer combines the CRCs of several chunks per file
+    results = compress.compress_zip([str(tree)], out, jobs, chunk_size=64 * 1024 if jobs > 1 else None, dedup=dedup)
+    assert read_zip(out) == {'src/' + k: v for k, v in read_tree(tree).items()}
+    assert results[0].files == 5 and results[0].raw == sum(map(len, read_tree(tree).values()))
+
+
+def test_zip_parallel_output_does_not_depend_on_jobs(tree, tmp_path):
+    outs = []
+    for jobs in (2, 5):
+        outs.append(str(tmp_path / f'out{jobs}.zip'))
+        compress.compress_zip([str(tree)], outs[-1], jobs, chunk_size=64 * 1024)
+    with open(outs[0], 'rb') as a, open(outs[1], 'rb') as b:
+        assert a.read() == b.read()
+
+
+def test_zip_contents_source(tree, tmp_path):
+    out = str(tmp_path / 'out.zip')
+    compress.compress_zip([os.path.join(str(tree), '.')], out)
+    assert read_zip(out) == read_tree(tree)
+
+
+@pytest.mark.parametrize('codec', ['gz', 'xz', 'zst'])
+@pytest.mark.parametrize('jobs', [1, 3])
+def test_tar_round_trip(tree, tmp_path, codec, jobs):
+    if codec == 'zst' and not (compress.has_zstd() and shutil.which('zstd')):
+        pytest.skip('needs the zstd binary')
+    out = str(tmp_path / f'out.tar.{codec}')
+    compress.compress_tar([str(tree)], out, codec, jobs)
+    assert extract_tar(out, tmp_path / 'dest') == {'src/' + k: v for k, v in read_tree(tree).items()}
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_7z_round_trip(tree, tmp_path, jobs):
+    out = str(tmp_path / 'out.7z')
+    # jobs=1 goes through py7zr when it is installed, jobs=2 through sevenzip.write_7z
+    compress.compress_7z([str(tree), str(tree / 'text.txt')], out, jobs, block_size=256 * 1024 if jobs > 1 else None)
+    expected = {'src/' + k: v for k, v in read_tree(tree).items()}
+    expected['text.txt'] = expected['src/text.txt']
+    assert read_7z(out, tmp_path / 'dest') == expected
+
+
+@pytest.mark.parametrize('fmt', ['zip', 'tar.gz'])
+def test_stream_round_trip(tree, tmp_path, fmt):
+    pipe = compress.open_archive_stream(fmt, [str(tree)], capacity=64 * 1024)  # smaller than the archive
+    out = str(tmp_path / ('out.' + fmt))
+    with open(out, 'wb') as f:
+        while True:
+            data = pipe.read(10000)
+            if not data:
+                break
+            f.write(data)
+    expected = {'src/' + k: v for k, v in read_tree(tree).items()}
+    assert (read_zip(out) if fmt == 'zip' else extract_tar(out, tmp_path / 'dest')) == expected
+
+
+@pytest.mark.skipif(not hasattr(os, 'symlink'), reason='needs symlinks')
+@pytest.mark.parametrize('fmt', ['tar.gz', 'zip'])
+def test_dedup_ignores_symlinks(tmp_path, fmt):
+    src = tmp_path / 'src'
+    write(str(src / 'z.bin'), os.urandom(5000))
+    os.symlink('z.bin', src / 'a_link')  # sorts first, so it used to become the "original"
+    paths = [str(src / 'a_link'), str(src / 'z.bin')]
+    assert compress.find_duplicates(paths) == {}
+
+    out = str(tmp_path / ('out.' + fmt))
+    compress.compress(fmt, [str(src)], out, dedup=True)
+    dest = tmp_path / 'dest'
+    if fmt == 'zip':
+        with zipfile.ZipFile(out) as zf:
+            zf.extractall(dest)
+    else:
+        with tarfile.open(out) as tar:
+            assert not any(m.islnk() for m in tar.getmembers())
+            tar.extractall(dest, filter='data')
+    with open(src / 'z.bin', 'rb') as f:
+        original = f.read()
+    with open(dest / 'src' / 'z.bin', 'rb') as f:
+        assert f.read() == original
+    if fmt != 'zip':
+        assert os.readlink(dest / 'src' / 'a_link') == 'z.bin'
+
+
+def test_tar_dedup_links_regular_copies(tmp_path):
+    src = tmp_path / 'src'
+    data = os.urandom(10000)
+    write(str(src / 'a' / 'x.bin'), data)
+    write(str(src / 'b' / 'x.bin'), data)
+    out = str(tmp_path / 'out.tar.gz')
+    compress.compress('tar.gz', [str(src)], out, dedup=True)
+    with tarfile.open(out) as tar:
+        links = [m for m in tar.getmembers() if m.islnk()]
+        assert [(m.name, m.linkname) for m in links] == [('src/b/x.bin', 'src/a/x.bin')]
+        tar.extractall(tmp_path / 'dest', filter='data')
+    assert read_tree(tmp_path / 'dest' / 'src') == read_tree(src)
+
+
+def read_zip(path):
+    with zipfile.ZipFile(path) as zf:
+        assert zf.testzip() is None
+        return {info.filename: zf.read(info) for info in zf.infolist() if not info.is_dir()}
+
+
+def test_append_without_manifest_only_adds_changes(tmp_path):
+    src = tmp_path / 'src'
+    for name in ('a.txt', 'b.txt', 'sub/c.txt'):
+        write(str(src / name), name.encode() * 100)
+    out = str(tmp_path / 'out.zip')
+    compress.compress_zip([str(src)], out)  # a plain ZIP: no manifest
+    write(str(src / 'b.txt'), b'changed, and longer than before')
+    write(str(src / 'new.txt'), b'new')
+    os.remove(src / 'sub' / 'c.txt')
+
+    lines = []
+    compress.compress_zip([str(src)], out, log=lines.append, append=True)
+    added = sorted(line.split(' as ')[1] for line in lines if line.startswith('Adding '))
+    assert added == ['src/b.txt', 'src/new.txt']
+    assert read_zip(out) == {'src/' + k: v for k, v in read_tree(src).items()}
+    assert os.path.exists(compress.manifest_path_for(out))
+
+    lines.clear()
+    compress.compress_zip([str(src)], out, log=lines.append, append=True)
+    assert not [line for line in lines if line.startswith('Adding ')]
+
+
+def read_7z(path, dest):
+    py7zr = pytest.importorskip('py7zr')
+    with py7zr.SevenZipFile(path) as archive:
+        archive.extractall(dest)
+    return read_tree(dest)
+
+
+def test_7z_blocks_skip_failed_source(tmp_path):
+    src = tmp_path / 'src'
+    write(str(src / 'a.txt'), b'a' * 1000)
+    missing = str(tmp_path / 'missing.txt')
+    failed, done = [], []
+    out = str(tmp_path / 'out.7z')
+    results = compress.compress_7z([missing, str(src)], out, jobs=2, item_done=lambda i, s: done.append(i),
+                                   item_failed=lambda i, e: failed.append((i, type(e))))
+    assert failed == [(0, FileNotFoundError)]
+    assert done == [1]
+    assert results[0] is None and results[1].files == 1
+    with open(out, 'rb') as f:
+        assert f.read(6) == b"7z\xbc\xaf'\x1c"
+    assert read_7z(out, tmp_path / 'dest') == {'src/a.txt': b'a' * 1000}
@@ -0,0 +1,68 @@
+"""Tests for tools/unzip.py: the parallel path must behave like the serial one."""
+import os
+import random
+import warnings
+import zipfile
+
+import pytest
+
+import unzip
+from test_compress import read_tree, write
+
+
+@pytest.fixture
+def archive(tmp_path):
+    rng = random.Random(2)
+    path = str(tmp_path / 'in.zip')
+    with warnings.catch_warnings(), zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        warnings.simplefilter('ignore')  # duplicate names are intended
+        zf.writestr('top/', b'')
+        for i in range(40):
+            zf.writestr(f'top/d{i % 4}/f{i}.txt', f'file {i}\n'.encode() * rng.randrange(1, 5000))
+        zf.writestr('top/empty', b'')
+        zf.writestr('top/big.bin', bytes(rng.getrandbits(8) for _ in range(200000)))
+        zf.writestr('top/dup.txt', b'first')
+        zf.writestr('top/dup.txt', b'second')
+        zf.writestr('top/only/in/dirs/', b'')
+    return path
+
+
+def extract(archive, target, jobs, overwrite=False):
+    events, progress = [], []
+    unzip.unzip_file_with_progress(archive, str(target), overwrite, lambda done, total: progress.append((done, total)),
+                                   lambda action, path: events.append((action, os.path.relpath(path, target))), jobs)
+    return sorted(events), progress[-1]
+
+
+@pytest.mark.parametrize('overwrite', [False, True])
+def test_parallel_matches_serial(archive, tmp_path, monkeypatch, overwrite):
+    monkeypatch.setattr(unzip, 'UNZIP_BATCH_FILES', 3)  # many batches
+    outcomes = []
+    for jobs in (1, 4):
+        target = tmp_path / f'out{jobs}'
+        write(str(target / 'top' / 'd1' / 'f1.txt'), b'already there')
+        events, last = extract(archive, target, jobs, overwrite)
+        tree = read_tree(target)
+        dirs = sorted(os.path.relpath(base, target) for base, _, _ in os.walk(target))
+        outcomes.append((events, last, tree, dirs))
+    assert outcomes[0] == outcomes[1]
+    events, (done, total), tree, _ = outcomes[0]
+    assert done == total
+    # Without overwrite, the first copy of a duplicate name is kept, as is a file that was already there
+    assert tree['top/dup.txt'] == (b'second' if overwrite else b'first')
+    assert (tree['top/d1/f1.txt'] == b'already there') != overwrite
+    assert (('skipped', os.path.join('top', 'd1', 'f1.txt')) in events) != overwrite
+
+
+def test_bad_member_is_reported_and_skipped(tmp_path):
+    path = str(tmp_path / 'in.zip')
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED) as zf:
+        zf.writestr('a.txt', b'a' * 100)
+        zf.writestr('b.txt', b'b' * 100)
+    with zipfile.ZipFile(path) as zf:
+        offset = zf.getinfo('a.txt').header_offset + len(zf.getinfo('a.txt').FileHeader())
+    with open(path, 'r+b') as f:  # corrupt a.txt's data, so its CRC check fails
+        f.seek(offset)
+        f.write(b'x')
+    results = [extract(path, tmp_path / f'out{jobs}', jobs)[0] for jobs in (1, 2)]
+    assert results[0] == results[1] == [('error', 'a.txt'), ('extracted', 'b.txt')]
@@ -0,0 +1,206 @@
+"""Tests for scripts/validate_catalog.py."""
+import argparse
+import json
+import subprocess
+import sys
+
+import pytest
+
+import bench_catalog
+import catalog_rules
+import catalog_snapshot
+import validate_catalog as vc
+
+SCRIPT = vc.REPO_ROOT / "scripts" / "validate_catalog.py"
+COMPONENT = """apiVersion: backstage.io/v1alpha1
+kind: Component
+metadata:
+  name: {name}
+spec:
+  type: service
+  owner: {owner}
+"""
+
+
+class Listing:
+    """A discovery whose file list the test sets."""
+
+    def __init__(self, files):
+        self.list = list(files)
+
+    def files(self):
+        return list(self.list)
+
+
+def json_summary(out):
+    """The --json summary at the end of ``out`` (after the per-file lines)."""
+    return json.loads(out[out.find("\n{") + 1:])  # find() is -1 when the summary is all there is
+
+
+def watch_args():
+    return argparse.Namespace(json=True, report_memory=False, watch_interval=0, emit_snapshot=None,
+                              rules=catalog_rules.DEFAULT_RULES_FILE)
+
+
+def test_watch_file_that_appears_and_disappears(tmp_path, capsys, monkeypatch):
+    monkeypatch.setattr(vc, "REPO_ROOT", tmp_path)
+    a = tmp_path / "a.yaml"
+    a.write_text(COMPONENT.format(name="a", owner="group:team"), encoding="utf-8")
+    gone = tmp_path / "gone.yaml"  # listed, but removed before it could be stat'ed
+    listing = Listing([a])
+    session = vc.WatchSession(watch_args(), vc.resolve_loader("auto"), 1, None, listing)
+    session.validate(None)
+
+    listing.list.append(gone)
+    assert session.poll() == {gone}
+    session.validate({gone})
+    capsys.readouterr()
+
+    listing.list.remove(gone)
+    assert session.poll() == {gone}
+    session.validate({gone})
+    summary = json_summary(capsys.readouterr().out)
+    assert summary["counts"] == {"Component": 1}
+
+    b = tmp_path / "b.yaml"
+    b.write_text(COMPONENT.format(name="b", owner="group:team"), encoding="utf-8")
+    listing.list.append(b)
+    assert session.poll() == {b}
+    session.validate({b})
+    assert json_summary(capsys.readouterr().out)["counts"] == {"Component": 2}
+    assert session.poll() == set()
+
+
+def test_missing_targets_of_kinds_outside_the_catalog_are_warnings():
+    index = {("Group", "team"), ("Component", "web")}
+    entity = vc.Entity({"kind": "Component", "metadata": {"name": "api"},
+                        "spec": {"owner": "group:ghost", "dependsOn": ["component:gone", "resource:db", "user:jo"]}},
+                       "c.yaml", 1)
+    assert vc.relation_diagnostics(entity, index) == [
+        ("owner", True, "c.yaml [doc 1] owner references missing Group 'ghost'"),
+        ("dependsOn", True, "c.yaml [doc 1] dependsOn references missing Component 'gone'"),
+        ("dependsOn", False, "c.yaml [doc 1] dependsOn references missing Resource 'db' "
+                             "(no Resource entities in the catalog)"),
+        ("dependsOn", False, "c.yaml [doc 1] dependsOn references missing User 'jo' "
+                             "(no User entities in the catalog)"),
+    ]
+    # Once the catalog defines Users, a missing one is an error
+    assert vc.relation_diagnostics(entity, index | {("User", "al")})[3][1] is True
+
+
+def run_validator(*args):
+    return subprocess.run([sys.executable, str(SCRIPT), *args], capture_output=True, text=True)
+
+
+def test_cache_stats_do_not_break_json(tmp_path):
+    for hits in ("0 hit(s)", "hit(s), 0 miss(es)"):
+        run = run_validator("--json", "--cache", str(tmp_path / "cache"))
+        assert run.returncode == 0, run.stderr
+        assert "Cache: " not in run.stdout and hits in run.stderr
+        assert json_summary(run.stdout)["counts"]
+
+
+def test_snapshot_matches_json_summary(tmp_path):
+    path = tmp_path / "catalog.snap"
+    run = run_validator("--json", "--emit-snapshot", str(path))
+    assert run.returncode == 0, run.stderr
+    assert "Snapshot: " in run.stderr
+    summary = json_summary(run.stdout)
+    with catalog_snapshot.Snapshot(path) as snap:
+        entities = list(snap)
+        counts = {}
+        for entity in entities:
+            counts[entity.kind] = counts.get(entity.kind, 0) + 1
+            assert snap.get(f"{entity.kind.lower()}:{entity.name}") == entity
+            for relation in snap.relations(entity.id):
+                assert relation.target is not None  # the catalog passes, so every reference resolves
+                target = snap.entity(relation.target)
+                assert (target.kind, target.name) == (relation.kind, relation.name)
+        assert snap.get("component:no-such-entity") is None
+    assert counts == summary["counts"]
+
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+    """A synthetic catalog under tmp_path/catalog, with broken references
+    and duplicates; tmp_path is the repo root."""
+    docs = bench_catalog.generate_documents(300, broken=0.05, duplicates=0.02, seed=1)
+    bench_catalog.write_catalog(tmp_path / "catalog", docs, files_per_dir=20, docs_per_file=3)
+    monkeypatch.setattr(vc, "REPO_ROOT", tmp_path)
+    return tmp_path
+
+
+def validate(monkeypatch, capsys, *args):
+    """(exit code, stdout, stderr) of validate_catalog.py ``args`` on the
+    ``catalog`` fixture."""
+    monkeypatch.setattr(sys, "argv", ["validate_catalog.py", "--include", "catalog/**/*.yaml", *args])
+    code = vc.main()
+    out, err = capsys.readouterr()
+    return code, out, err
+
+
+@pytest.mark.parametrize("json_output", [False, True])
+def test_jobs_match_serial_run(catalog, monkeypatch, capsys, json_output):
+    flags = ["--json"] if json_output else []
+    serial = validate(monkeypatch, capsys, *flags)
+    assert serial[0] == 1  # the catalog has broken references
+    assert validate(monkeypatch, capsys, "--jobs", "3", *flags)[:2] == serial[:2]
+
+
+def test_cache(catalog, monkeypatch, capsys, tmp_path):
+    cache = str(tmp_path / "cache")
+    rules = tmp_path / "rules.yaml"
+    rules.write_bytes(catalog_rules.DEFAULT_RULES_FILE.read_bytes())
+    args = ("--json", "--rules", str(rules))
+    uncached = validate(monkeypatch, capsys, *args)
+    files = sorted((catalog / "catalog").glob("**/*.yaml"))
+
+    cold = validate(monkeypatch, capsys, *args, "--cache", cache)
+    assert cold[:2] == uncached[:2] and f"0 hit(s), {len(files)} miss(es)" in cold[2]
+    warm = validate(monkeypatch, capsys, *args, "--cache", cache)
+    assert warm[:2] == uncached[:2] and f"{len(files)} hit(s), 0 miss(es)" in warm[2]
+
+    # An edited file is parsed again
+    files[0].write_text(files[0].read_text(encoding="utf-8") + "---\n" + COMPONENT.format(name="new", owner="nobody"),
+                        encoding="utf-8")
+    edited = validate(monkeypatch, capsys, *args, "--cache", cache)
+    assert f"{len(files) - 1} hit(s), 1 miss(es)" in edited[2]
+    assert edited[:2] == validate(monkeypatch, capsys, *args)[:2] != uncached[:2]
+
+    # So is everything once the rules change
+    rules.write_text(rules.read_text(encoding="utf-8") + "  - field: spec.nothing\n    required: true\n",
+                     encoding="utf-8")
+    assert f"0 hit(s), {len(files)} miss(es)" in validate(monkeypatch, capsys, *args, "--cache", cache)[2]
+
+
+def test_since(catalog, monkeypatch, capsys):
+    def git(*args):
+        subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+                       cwd=catalog, check=True, capture_output=True)
+    git("init", "-q")
+    git("add", "-A")
+    git("commit", "-q", "-m", "catalog")
+    full = json_summary(validate(monkeypatch, capsys, "--json")[1])
+    assert full["errors"]
+    code, out, _ = validate(monkeypatch, capsys, "--json", "--since", "HEAD")
+    assert code == 0 and json_summary(out)["errors"] == []  # nothing changed
+
+    # Break a reference in one file and delete a Domain that unchanged Systems use
+    files = sorted((catalog / "catalog").glob("**/*.yaml"))
+    domain = "kind: Domain\nmetadata:\n  name: domain-0\n"
+    domain_file = next(f for f in files if domain in f.read_text(encoding="utf-8"))
+    domain_file.write_text("---\n".join(d for d in domain_file.read_text(encoding="utf-8").split("---\n")
+                                        if domain not in d), encoding="utf-8")
+    component_file = files[-1]
+    component_file.write_text(component_file.read_text(encoding="utf-8").replace(
+        "owner: group:", "owner: group:nobody-", 1), encoding="utf-8")
+    current = json_summary(validate(monkeypatch, capsys, "--json")[1])
+    code, out, _ = validate(monkeypatch, capsys, "--json", "--since", "HEAD")
+    errors = json_summary(out)["errors"]
+    assert code == 1
+    assert any("owner references missing Group 'nobody-" in e and str(component_file) in e for e in errors)
+    assert any("references missing Domain 'domain-0'" in e for e in errors)
+    # Only errors that involve the changed files, and all of those
+    assert set(errors) < set(current["errors"])
+    unrelated = set(current["errors"]) - set(errors)
+    assert unrelated and not any("domain-0'" in e or str(component_file) in e for e in unrelated)
@@ -0,0 +1,251 @@
+"""
+Benchmarks for tools/compress.py.
+
+Commands:
+    io    Compare file ingestion strategies on many small files and on a few
+          huge files: plain 8 KB read() calls (the old copy loop) against
+          ChunkReader with readinto into a reused 1 / 4 / 16 MB buffer, with
+          mmap, and with its defaults. Each strategy feeds either zlib.crc32
+          (to time the reading alone) or stored ZIP entries (--consumer zip).
+    formats
+          Archive one tree (--source, or a generated tree of text files with
+          duplicates and a few incompressible blobs) in every format and
+          preset: zip and 7z against tar.zst, tar.gz and tar.xz. Reports
+          time, size and ratio, then the time to read everything back.
+
+For io, test files are random data written to a temporary directory (or --dir).
+By default they stay in the page cache, which times the per-chunk overhead;
+--cold evicts them before every pass (posix_fadvise DONTNEED, Linux) so the
+disk is included.
+
+Usage:
+    python tools/bench_compress.py io
+    python tools/bench_compress.py io --small-files 5000 --large-files 2 --large-mb 1024 --cold
+    python tools/bench_compress.py formats --source build/ --level fast balanced
+"""
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+import zlib
+
+import compress
+from compress import ChunkReader
+
+MB = 1024 * 1024
+NO_MMAP = float('inf')
+
+
+def read_8k(path):
+    """The copy loop ChunkReader replaced: a new bytes object per 8 KB."""
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(8192)
+            if not chunk:
+                break
+            yield chunk
+
+
+STRATEGIES = [
+    ('read 8 KB', lambda: read_8k),
+    ('readinto 1 MB', lambda: ChunkReader(1 * MB, NO_MMAP).chunks),
+    ('readinto 4 MB', lambda: ChunkReader(4 * MB, NO_MMAP).chunks),
+    ('readinto 16 MB', lambda: ChunkReader(16 * MB, NO_MMAP).chunks),
+    ('mmap 4 MB', lambda: ChunkReader(4 * MB, 0).chunks),
+    ('ChunkReader()', lambda: ChunkReader().chunks),
+]
+
+
+def write_files(out_dir, prefix, count, size):
+    """`count` files of `size` random bytes (a 1 MB random block repeated)."""
+    block = os.urandom(min(size, MB))
+    paths = []
+    for i in range(count):
+        path = os.path.join(out_dir, f'{prefix}{i:06d}.bin')
+        with open(path, 'wb') as f:
+            left = size
+            while left:
+                n = min(left, len(block))
+                f.write(block[:n])
+                left -= n
+        paths.append(path)
+    return paths
+
+
+def evict(paths):
+    """Drop `paths` from the page cache (Linux; needs clean pages, see os.sync)."""
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def consume_crc32(paths, chunks, out_path):
+    crc = 0
+    for path in paths:
+        for chunk in chunks(path):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def consume_zip(paths, chunks, out_path):
+    with zipfile.ZipFile(out_path, 'w') as zf:
+        for path in paths:
+            zinfo = zipfile.ZipInfo(os.path.basename(path))
+            zinfo.compress_type = zipfile.ZIP_STORED
+            zinfo.file_size = os.path.getsize(path)
+            with zf.open(zinfo, 'w') as dest:
+                for chunk in chunks(path):
+                    dest.write(chunk)
+
+
+CONSUMERS = {'crc32': consume_crc32, 'zip': consume_zip}
+
+
+def bench_io(args):
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        print(f'Writing test files to {tmp} ...')
+        sets = [
+            (f'{args.small_files} small files x {args.small_kb} KB',
+             write_files(tmp, 'small', args.small_files, args.small_kb * 1024)),
+            (f'{args.large_files} large files x {args.large_mb} MB',
+             write_files(tmp, 'large', args.large_files, args.large_mb * MB)),
+        ]
+        if args.cold:
+            if not hasattr(os, 'posix_fadvise'):
+                print('--cold needs os.posix_fadvise (Linux)', file=sys.stderr)
+                return 2
+            os.sync()
+        out_path = os.path.join(tmp, 'out.zip')
+        consume = CONSUMERS[args.consumer]
+        print(f'Consumer: {args.consumer}, {"cold" if args.cold else "warm"} cache, best of {args.repeat}')
+        for label, paths in sets:
+            total = sum(os.path.getsize(p) for p in paths)
+            print(f'\n{label} ({total / MB:.0f} MB):')
+            baseline = None
+            for name, make in STRATEGIES:
+                best = None
+                for _ in range(args.repeat):
+                    chunks = make()
+                    if args.cold:
+                        evict(paths)
+                    start = time.perf_counter()
+                    consume(paths, chunks, out_path)
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                baseline = baseline or best
+                print(f'  {name:>15}: {total / MB / best:8.0f} MB/s  {len(paths) / best:9.0f} files/s'
+                      f'  ({baseline / best:.2f}x)')
+    return 0
+
+
+WORDS = ('def', 'class', 'return', 'import', 'self', 'value', 'config', 'build', 'target', 'error',
+         'for', 'in', 'if', 'else', 'None', 'True', '(', ')', ':', '=', '.', '\n', '    ')
+
+
+def write_tree(out_dir, files, mb):
+    """A tree of about `mb` MB that looks like build output: `files` text
+    files, a copy of a tenth of them in a vendor/ directory and 10% of the
+    bytes as random (incompressible) blobs."""
+    rng = random.Random(0)
+    root = os.path.join(out_dir, 'tree')
+    per_file = max(1, int(mb * MB * 0.8 / files / 1.1))
+    for i in range(files):
+        path = os.path.join(root, 'src', f'pkg{i % 20:02d}', f'module{i:05d}.py')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        text = ' '.join(rng.choice(WORDS) for _ in range(per_file // 4))
+        with open(path, 'w') as f:
+            f.write(text)
+        if i % 10 == 0:
+            vendored = os.path.join(root, 'vendor', os.path.relpath(path, os.path.join(root, 'src')))
+            os.makedirs(os.path.dirname(vendored), exist_ok=True)
+            shutil.copyfile(path, vendored)
+    os.makedirs(os.path.join(root, 'assets'), exist_ok=True)
+    for i in range(4):
+        with open(os.path.join(root, 'assets', f'blob{i}.bin'), 'wb') as f:
+            f.write(os.urandom(max(1, int(mb * MB * 0.1 / 4))))
+    return root
+
+
+def read_back(fmt, path):
+    """Decompress `path` and discard the data; False if no reader is available."""
+    if fmt == 'zip':
+        with zipfile.ZipFile(path) as zf:
+            for name in zf.namelist():
+                zf.read(name)
+    elif fmt in ('tar.gz', 'tar.xz'):
+        with tarfile.open(path, 'r|*') as tar:
+            for member in tar:
+                if member.isreg():
+                    tar.extractfile(member).read()
+    elif fmt == 'tar.zst' and shutil.which('zstd'):
+        subprocess.run(['zstd', '-d', '-q', '-c', path], stdout=subprocess.DEVNULL, check=True)
+    elif fmt == '7z' and shutil.which('bsdtar'):
+        subprocess.run(['bsdtar', '-xOf', path], stdout=subprocess.DEVNULL, check=True)
+    else:
+        return False
+    return True
+
+
+def bench_formats(args):
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        source = args.source or write_tree(tmp, args.files, args.mb)
+        total = sum(os.path.getsize(full) for _, full, _ in compress.collect_files([source]))
+        formats = [f for f in args.format if f != 'tar.zst' or compress.has_zstd()]
+        print(f'{source}: {total / MB:.0f} MB, {args.jobs} jobs')
+        print(f'{"format":>8} {"level":>9} {"seconds":>8} {"MB/s":>7} {"size MB":>8} {"ratio":>6} {"read MB/s":>9}')
+        for level in args.level:
+            for fmt in formats:
+                out_path = os.path.join(tmp, 'out.' + fmt)
+                start = time.perf_counter()
+                compress.compress(fmt, [source], out_path, args.jobs, level)
+                elapsed = time.perf_counter() - start
+                size = os.path.getsize(out_path)
+                start = time.perf_counter()
+                read = read_back(fmt, out_path)
+                read_rate = f'{total / MB / (time.perf_counter() - start):9.0f}' if read else f'{"-":>9}'
+                print(f'{fmt:>8} {level:>9} {elapsed:8.2f} {total / MB / elapsed:7.1f} {size / MB:8.1f}'
+                      f' {size / total:6.1%} {read_rate}')
+                os.remove(out_path)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    io = sub.add_parser('io', help='Compare read strategies on small and large files')
+    io.add_argument('--small-files', type=int, default=2000)
+    io.add_argument('--small-kb', type=int, default=16)
+    io.add_argument('--large-files', type=int, default=2)
+    io.add_argument('--large-mb', type=int, default=256)
+    io.add_argument('--consumer', choices=list(CONSUMERS), default='crc32')
+    io.add_argument('--repeat', type=int, default=3)
+    io.add_argument('--cold', action='store_true', help='evict the files from the page cache before each pass')
+    io.add_argument('--dir', help='where to create the test files (default: system temp dir)')
+    fmts = sub.add_parser('formats', help='Compare zip, 7z and tar.zst/gz/xz on one tree')
+    fmts.add_argument('--source', help='tree to archive (default: a generated one)')
+    fmts.add_argument('--files', type=int, default=2000, help='text files in the generated tree')
+    fmts.add_argument('--mb', type=int, default=64, help='approximate size of the generated tree')
+    fmts.add_argument('--format', nargs='+', choices=[f for f in compress.FORMATS if f != 'rar'],
+                      default=['zip', '7z', 'tar.zst', 'tar.gz', 'tar.xz'])
+    fmts.add_argument('--level', nargs='+', choices=list(compress.PRESETS), default=['fast', 'balanced'])
+    fmts.add_argument('--jobs', type=int, default=os.cpu_count() or 1)
+    fmts.add_argument('--dir', help='where to create the archives (default: system temp dir)')
+    args = parser.parse_args()
+    if args.command == 'io':
+        return bench_io(args)
+    if args.command == 'formats':
+        return bench_formats(args)
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,1429 @@
+"""
+GUI-free compression engine used by compressor.py, also usable as a CLI:
+
+    python tools/compress.py --format zip --jobs 8 --level fast src... -o out.zip
+
+Formats: zip (zipfile; --jobs > 1 deflates files and 4 MB chunks of large
+files on a thread pool), 7z, rar (the external 'rar'/'winrar' binary) and
+tar.zst / tar.gz / tar.xz (also .tzst, .tgz, .txz). --format defaults to
+the extension of -o and --level picks a preset (fast / balanced / max, see
+PRESETS). Importing this module imports neither tkinter nor py7zr, so
+scripts start quickly.
+
+7z archives are written by sevenzip.py when --jobs > 1 (or py7zr is not
+installed): files are packed into solid blocks of --block-mb (default 16)
+that are LZMA2-compressed on a thread pool, with --dict-mb setting the
+dictionary; --jobs 1 uses py7zr. Tar formats stream the tar straight into
+the compressor: zstd on --jobs threads with long-distance matching
+(--no-long to disable), through the zstandard module or the zstd binary;
+pigz / xz -T (with --jobs > 1) or gzip / lzma for the others.
+`tools/bench_compress.py formats` compares the formats.
+
+Duplicate files (--dedup): files of equal size are hashed and each one
+identical to an earlier file reuses its data. In a ZIP the compressed data
+of the first copy is copied instead of compressing it again (on by
+default; the archive is unchanged). In a tar the copy is stored as a hard
+link, so its data is not stored at all (off by default, since extraction
+then creates hard links). 7z packs files into solid blocks and has
+neither, so it is not supported there. The log reports the bytes reused
+and an estimate of the CPU time avoided.
+
+Python API: compress(fmt, sources, out_path, jobs=1, preset='max', **callbacks)
+or compress_zip / compress_7z / compress_tar / compress_rar. Sources are files or
+directories (archived under their own name, or at the top of the archive
+when given as 'dir/.'). All callbacks are optional
+and are called from the thread running the job:
+    log(message)                  one line of trace
+    progress(index, done, total)  bytes of sources[index] processed so far
+    item_done(index, stats)       sources[index] finished, with its ItemStats
+    item_failed(index, error)     sources[index] failed and was skipped (7z)
+Other failures raise CompressError or OSError.
+
+File data is read through ChunkReader: readinto into one reused buffer of
+--chunk-mb (1-16 MB), mmap for files of 64 MB or more, and sequential
+read-ahead hints (posix_fadvise) on Linux. `tools/bench_compress.py io`
+compares it with plain 8 KB reads.
+
+Incremental ZIPs (--manifest FILE, --append): a JSON manifest records the
+size, mtime and SHA-256 of every archived file. The next run stats each
+file and only reads those whose size or mtime changed, so an unchanged
+tree costs one stat per file. With --manifest alone the archive holds only
+new and changed files plus a deletion list (DELETIONS_MEMBER); with
+--append (manifest defaults to OUT.manifest.json) the existing ZIP is
+updated in place: new members are appended and replaced or deleted ones
+are dropped from the central directory, without rewriting unchanged
+members. Their old data stays in the file until a full re-archive. An
+existing ZIP without a manifest is compared with its members' sizes and
+dates instead (zip_manifest). Appending writes over the old central
+directory, so an interrupted --append leaves a ZIP that cannot be opened;
+keep a copy if that matters.
+
+Streaming: open_archive_stream() writes a zip or tar archive into a
+bounded in-memory StreamPipe on a background thread, for uploads that read
+it while it is produced (ftp_explorer.py) instead of from a temporary file.
+"""
+import argparse
+import gzip
+import hashlib
+import importlib.util
+import json
+import lzma
+import math
+import mmap
+import os
+import shutil
+import stat
+import struct
+import subprocess
+import sys
+import tarfile
+import threading
+import time
+import zlib
+import zipfile
+from collections import Counter, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
+
+
+FORMATS = ('zip', '7z', 'rar', 'tar.zst', 'tar.gz', 'tar.xz')
+FORMAT_SUFFIXES = {'.tzst': 'tar.zst', '.tgz': 'tar.gz', '.txz': 'tar.xz'}
+ZIP_CHUNK_SIZE = 4 * 1024 * 1024  # large files are deflated as independent chunks of this size
+ZIP_WINDOW = 32 * 1024  # deflate window; each chunk is primed with the previous 32 KB
+READ_CHUNK_SIZE = 1024 * 1024  # default read size of the streaming ZIP writer
+MIN_CHUNK_SIZE, MAX_CHUNK_SIZE = 1024 * 1024, 16 * 1024 * 1024
+MMAP_THRESHOLD = 64 * 1024 * 1024  # files at least this large are read through mmap
+ZSTD_LONG_WINDOW_LOG = 27  # --long window (128 MB); zstd decoders accept it without extra flags
+MANIFEST_VERSION = 1
+DELETIONS_MEMBER = '.deleted-files.txt'  # incremental archives: one deleted path per line
+PIPE_CAPACITY = 8 * 1024 * 1024  # bytes buffered between a streaming archiver and its reader
+
+# Formats that are already compressed: deflating them again burns CPU for ~0% gain
+INCOMPRESSIBLE_EXTENSIONS = frozenset((
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.avif',
+    '.mp3', '.m4a', '.aac', '.ogg', '.opus', '.flac',
+    '.mp4', '.m4v', '.mkv', '.mov', '.avi', '.webm',
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.txz', '.zst', '.lz4', '.7z', '.rar', '.cab',
+    '.jar', '.war', '.apk', '.whl', '.docx', '.xlsx', '.pptx', '.odt', '.ods', '.epub',
+    '.woff', '.woff2',
+))
+ENTROPY_SAMPLE = 16 * 1024  # bytes read from the start of a file to estimate its entropy
+ENTROPY_THRESHOLD = 7.5  # bits per byte; random or compressed data is ~7.9+, text ~4-5
+
+# zip_level: deflate level (also tar.gz), lzma_preset: LZMA2 preset for 7z and tar.xz,
+# zstd_level: level for tar.zst,
+# incompressible_level: deflate level for incompressible files (None = store them)
+PRESETS = {
+    'fast': {'zip_level': 1, 'lzma_preset': 1, 'zstd_level': 3, 'incompressible_level': None},
+    'balanced': {'zip_level': 6, 'lzma_preset': 5, 'zstd_level': 9, 'incompressible_level': None},
+    'max': {'zip_level': 9, 'lzma_preset': 9, 'zstd_level': 19, 'incompressible_level': 1},
+}
+DEFAULT_PRESET = 'max'
+
+
+def sample_entropy(path, size=ENTROPY_SAMPLE):
+    """Shannon entropy in bits per byte of the first `size` bytes of `path`."""
+    with open(path, 'rb') as f:
+        data = f.read(size)
+    n = len(data)
+    return -sum(c / n * math.log2(c / n) for c in Counter(data).values()) if n else 0.0
+
+
+def incompressible_reason(path):
+    """Why `path` looks incompressible, or None if it should be compressed."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in INCOMPRESSIBLE_EXTENSIONS:
+        return f'{ext} is already compressed'
+    try:
+        entropy = sample_entropy(path)
+    except OSError:
+        return None
+    if entropy >= ENTROPY_THRESHOLD:
+        return f'entropy {entropy:.2f} bits/byte'
+    return None
+
+
+def choose_compression(path, preset=DEFAULT_PRESET):
+    """(zipfile compress type, level, reason) for `path` under `preset`;
+    reason is None unless the file was detected as incompressible."""
+    settings = PRESETS[preset]
+    reason = incompressible_reason(path)
+    if reason is None:
+        return zipfile.ZIP_DEFLATED, settings['zip_level'], None
+    if settings['incompressible_level'] is None:
+        return zipfile.ZIP_STORED, 0, reason
+    return zipfile.ZIP_DEFLATED, settings['incompressible_level'], reason
+
+
+def format_stats(raw, packed, seconds):
+    """'12.3 MB -> 4.5 MB (36.6%), 85.2 MB/s' for an item's log line."""
+    ratio = f'{packed * 100 / raw:.1f}%' if raw else 'n/a'
+    rate = raw / seconds / 1e6 if seconds > 0 else float('inf')
+    return f'{raw / 1e6:.1f} MB -> {packed / 1e6:.1f} MB ({ratio}), {rate:.1f} MB/s'
+
+
+@lru_cache(maxsize=64)
+def _crc32_shift(length):
+    """GF(2) matrix that advances a CRC-32 over `length` zero bytes (zlib's crc32_combine)."""
+    def times(mat, vec):
+        total, i = 0, 0
+        while vec:
+            if vec & 1:
+                total ^= mat[i]
+            vec >>= 1
+            i += 1
+        return total
+
+    def square(mat):
+        return [times(mat, mat[n]) for n in range(32)]
+
+    def shift(crc, n):
+        odd = [0xEDB88320] + [1 << k for k in range(31)]
+        even = square(odd)
+        odd = square(even)
+        while True:
+            even = square(odd)
+            if n & 1:
+                crc = times(even, crc)
+            n >>= 1
+            if not n:
+                return crc
+            odd = square(even)
+            if n & 1:
+                crc = times(odd, crc)
+            n >>= 1
+            if not n:
+                return crc
+
+    return [shift(1 << k, length) for k in range(32)]
+
+
+def crc32_combine(crc1, crc2, len2):
+    """CRC-32 of A+B from crc32(A), crc32(B) and len(B)."""
+    if not crc1:  # the shift is linear, so a zero CRC stays zero
+        return crc2
+    if len2 <= 0:
+        return crc1
+    mat, total, i = _crc32_shift(len2), 0, 0
+    while crc1:
+        if crc1 & 1:
+            total ^= mat[i]
+        crc1 >>= 1
+        i += 1
+    return total ^ crc2
+
+
+def _advise_sequential(fd, offset=0, length=0):
+    """Hint that `fd` will be read sequentially, so the kernel reads ahead
+    more aggressively (Linux and other POSIX systems; a no-op elsewhere)."""
+    if hasattr(os, 'posix_fadvise'):
+        try:
+            os.posix_fadvise(fd, offset, length, os.POSIX_FADV_SEQUENTIAL)
+        except OSError:
+            pass
+
+
+class ChunkReader:
+    """Reads files in `chunk_size` pieces without allocating per chunk.
+
+    Files smaller than `mmap_threshold` are read with readinto into one
+    reused buffer; larger ones are memory-mapped and sliced. chunks() yields
+    memoryviews that are only valid until the next one is requested, so
+    consumers must write or hash them right away. Use one reader per thread.
+    """
+
+    def __init__(self, chunk_size=READ_CHUNK_SIZE, mmap_threshold=MMAP_THRESHOLD):
+        if not MIN_CHUNK_SIZE <= chunk_size <= MAX_CHUNK_SIZE:
+            raise ValueError(f'chunk size must be between {MIN_CHUNK_SIZE >> 20} and {MAX_CHUNK_SIZE >> 20} MB')
+        self.chunk_size = chunk_size
+        self.mmap_threshold = mmap_threshold
+        self._view = memoryview(bytearray(chunk_size))
+
+    def chunks(self, path):
+        with open(path, 'rb', buffering=0) as f:
+            fd = f.fileno()
+            size = os.fstat(fd).st_size
+            if size > self.chunk_size:  # a single read needs no read-ahead
+                _advise_sequential(fd)
+            if size and size >= self.mmap_threshold:
+                yield from self._mapped(fd, size)
+                return
+            while True:
+                n = f.readinto(self._view)
+                if not n:
+                    break
+                with self._view[:n] as chunk:
+                    yield chunk
+
+    def _mapped(self, fd, size):
+        with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            with memoryview(mapped) as view:
+                for pos in range(0, size, self.chunk_size):
+                    with view[pos:pos + self.chunk_size] as chunk:
+                        yield chunk
+
+
+_thread_buffers = threading.local()
+
+
+def _read_at(path, offset, length):
+    """`length` bytes of `path` from `offset`, as a memoryview of this
+    thread's reused buffer (valid until the thread's next call)."""
+    view = getattr(_thread_buffers, 'view', None)
+    if view is None or len(view) < length:
+        view = _thread_buffers.view = memoryview(bytearray(length))
+    with open(path, 'rb', buffering=0) as f:
+        _advise_sequential(f.fileno(), offset, length)
+        f.seek(offset)
+        n = f.readinto(view[:length])
+    return view[:n]
+
+
+def _deflate_chunk(path, offset, length, level, last):
+    """Raw-deflate `length` bytes of `path` at `offset`, primed with the 32 KB
+    before it so the chunks concatenate into one deflate stream (as pigz does).
+    Returns (crc32, raw length, compressed bytes). zlib releases the GIL, so
+    chunks compress in parallel on threads."""
+    start = max(0, offset - ZIP_WINDOW)
+    view = _read_at(path, start, offset - start + length)
+    primer, data = view[:offset - start], view[offset - start:]
+    comp = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=primer) if len(primer) else \
+        zlib.compressobj(level, zlib.DEFLATED, -15)
+    out = comp.compress(data) + comp.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+    return zlib.crc32(data), len(data), out
+
+
+def _store_chunk(path, offset, length):
+    """Like _deflate_chunk for a ZIP_STORED entry: the bytes as they are
+    (a fresh bytes object, since it is written after the next read)."""
+    with open(path, 'rb', buffering=0) as f:
+        _advise_sequential(f.fileno(), offset, length)
+        f.seek(offset)
+        data = f.read(length)
+    return zlib.crc32(data), len(data), data
+
+
+def _timed(func, *args):
+    """(func(*args), CPU seconds the calling thread spent in it)."""
+    start = time.thread_time()
+    result = func(*args)
+    return result, time.thread_time() - start
+
+
+def write_zip_parallel(out_path, entries, jobs, level=9, chunk_size=ZIP_CHUNK_SIZE,
+                       on_entry=None, on_progress=None, methods=None, on_done=None, duplicates=None,
+                       cpu_times=None):
+    """Write `entries` [(path, arcname), ...] to a deflated ZIP at `out_path`
+    (a path, or a ZipFile opened for writing or appending), compressing on
+    `jobs` threads.
+
+    Entries are written in list order and each chunk goes where a serial
+    writer would put it, so the archive is identical for any `jobs`. At most
+    `jobs * 4` chunks are in flight to bound memory. `methods` optionally
+    gives (compress type, level) per entry, e.g. from choose_compression;
+    ZIP_STORED entries are copied as they are. `on_entry(index)` is called
+    when an entry starts, `on_progress(index, done, total)` after each chunk
+    is written and `on_done(index, zinfo)` when an entry is complete.
+    `duplicates` ({index: earlier index}, see find_duplicates) names entries
+    that reuse the compressed data of an earlier identical one; the CPU
+    seconds spent compressing those earlier entries are stored in the
+    `cpu_times` dict, if given.
+    """
+    sizes = [os.path.getsize(p) for p, _ in entries]
+    if methods is None:
+        methods = [(zipfile.ZIP_DEFLATED, level)] * len(entries)
+    duplicates = duplicates or {}
+    originals = set(duplicates.values())
+    written = {}  # index -> ZipInfo of entries that have duplicates
+
+    def chunks():
+        for index, ((path, _), size) in enumerate(zip(entries, sizes)):
+            if index in duplicates:
+                yield index, 0, size, True
+                continue
+            offsets = list(range(0, size, chunk_size)) or [0]
+            for offset in offsets:
+                yield index, offset, min(chunk_size, size - offset), offset == offsets[-1]
+
+    owned = not isinstance(out_path, zipfile.ZipFile)
+    zf = zipfile.ZipFile(out_path, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) if owned else out_path
+    with (zf if owned else nullcontext()), ThreadPoolExecutor(max_workers=jobs) as pool:
+        fp = zf.fp
+        pending = deque()
+        plan = chunks()
+        zinfo = zip64 = None
+        crc = done = 0
+        while True:
+            while len(pending) < jobs * 4:
+                task = next(plan, None)
+                if task is None:
+                    break
+                index, offset, length, last = task
+                compress_type, entry_level = methods[index]
+                if index in duplicates:
+                    future = None  # copied by the writer below
+                elif compress_type == zipfile.ZIP_STORED:
+                    future = pool.submit(_timed, _store_chunk, entries[index][0], offset, length)
+                else:
+                    future = pool.submit(_timed, _deflate_chunk, entries[index][0], offset, length, entry_level, last)
+                pending.append((task, future))
+            if not pending:
+                break
+            (index, offset, _, last), future = pending.popleft()
+            if future is None:
+                if on_entry:
+                    on_entry(index)
+                zinfo = zipfile.ZipInfo.from_file(*entries[index])
+                _copy_member(zf, written[duplicates[index]], zinfo)
+                if on_progress:
+                    on_progress(index, zinfo.file_size, sizes[index])
+                if on_done:
+                    on_done(index, zinfo)
+                continue
+            (chunk_crc, raw_len, data), cpu = future.result()
+            if index in originals and cpu_times is not None:
+                cpu_times[index] = cpu_times.get(index, 0.0) + cpu
+            if offset == 0:
+                if on_entry:
+                    on_entry(index)
+                zinfo = zipfile.ZipInfo.from_file(*entries[index])
+                zinfo.compress_type = methods[index][0]
+                zinfo.file_size = sizes[index]
+                zinfo.compress_size = zinfo.CRC = 0
+                zinfo.header_offset = fp.tell()
+                zip64 = zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT
+                fp.write(zinfo.FileHeader(zip64))  # rewritten once CRC and sizes are known
+                crc = done = 0
+            fp.write(data)
+            crc = crc32_combine(crc, chunk_crc, raw_len)
+            done += raw_len
+            zinfo.compress_size += len(data)
+            if on_progress:
+                on_progress(index, done, sizes[index])
+            if last:
+                zinfo.CRC = crc
+                zinfo.file_size = done
+                end = fp.tell()
+                fp.seek(zinfo.header_offset)
+                fp.write(zinfo.FileHeader(zip64))
+                fp.seek(end)
+                zf.filelist.append(zinfo)
+                zf.NameToInfo[zinfo.filename] = zinfo
+                zf.start_dir = end
+                zf._didModify = True
+                if index in originals:
+                    written[index] = zinfo
+                if on_done:
+                    on_done(index, zinfo)
+
+
+class StreamPipe:
+    """Bounded in-memory pipe from a writer thread to a reader, used to
+    stream an archive while it is produced (see open_archive_stream).
+
+    write() blocks while `capacity` bytes are buffered and read(size) until
+    data arrives, returning b'' once the writer has closed the pipe. An
+    error passed to close() is raised in the reader; after abort() (the
+    reader gave up) writes raise BrokenPipeError, which stops the writer.
+    tell() counts the bytes written; there is no seek(), so zipfile writes
+    data descriptors instead of rewriting headers."""
+
+    def __init__(self, capacity=PIPE_CAPACITY):
+        self.capacity = capacity
+        self._chunks = deque()
+        self._buffered = 0
+        self._written = 0
+        self._closed = self._aborted = False
+        self._error = None
+        self._cond = threading.Condition()
+
+    def __str__(self):
+        return '<stream>'
+
+    def write(self, data):
+        data = bytes(data)
+        with self._cond:
+            while self._buffered >= self.capacity and not self._aborted:
+                self._cond.wait()
+            if self._aborted:
+                raise BrokenPipeError('the reader of the archive stream stopped')
+            if data:
+                self._chunks.append(data)
+                self._buffered += len(data)
+                self._written += len(data)
+                self._cond.notify_all()
+        return len(data)
+
+    def read(self, size=-1):
+        with self._cond:
+            while not self._chunks and not self._closed:
+                self._cond.wait()
+            if self._error is not None:
+                raise self._error
+            if not self._chunks:
+                return b''
+            if size is None or size < 0:
+                data = b''.join(self._chunks)
+                self._chunks.clear()
+            else:
+                data = self._chunks.popleft()
+                if len(data) > size:
+                    self._chunks.appendleft(data[size:])
+                    data = data[:size]
+            self._buffered -= len(data)
+            self._cond.notify_all()
+            return data
+
+    def tell(self):
+        return self._written
+
+    def flush(self):
+        pass
+
+    def close(self, error=None):
+        """End of the stream for the reader; `error` is raised there instead."""
+        with self._cond:
+            self._closed = True
+            self._error = error
+            self._cond.notify_all()
+
+    def abort(self):
+        with self._cond:
+            self._aborted = True
+            self._chunks.clear()
+            self._buffered = 0
+            self._cond.notify_all()
+
+    def wait(self, timeout=None):
+        """Block until the writer has closed the pipe, i.e. it finished or
+        stopped after abort(); False if `timeout` seconds passed first."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._closed, timeout)
+
+
+def _is_path(out):
+    return isinstance(out, (str, os.PathLike))
+
+
+def _output_size(out):
+    return os.path.getsize(out) if _is_path(out) else out.tell()
+
+
+class CompressError(Exception):
+    """A compression job could not run (missing tool, failed command)."""
+
+
+class ItemStats(namedtuple('ItemStats', 'raw packed seconds files stored')):
+    """Result for one source: input bytes, output bytes (None inside a solid
+    7z archive), wall time, files archived and files stored uncompressed."""
+
+    def describe(self):
+        if self.packed is None:
+            rate = self.raw / self.seconds / 1e6 if self.seconds > 0 else float('inf')
+            return f'{self.raw / 1e6:.1f} MB, {rate:.1f} MB/s'
+        return f'{format_stats(self.raw, self.packed, self.seconds)}, {self.stored}/{self.files} files stored'
+
+
+def _noop(*args):
+    pass
+
+
+def has_py7zr():
+    return importlib.util.find_spec('py7zr') is not None
+
+
+def find_rar():
+    return shutil.which('rar') or shutil.which('winrar')
+
+
+def has_zstandard():
+    return importlib.util.find_spec('zstandard') is not None
+
+
+def has_zstd():
+    """True if tar.zst can be written (zstandard module or zstd binary)."""
+    return has_zstandard() or shutil.which('zstd') is not None
+
+
+def format_for(path):
+    """Archive format of `path` from its extension ('tar.zst' for x.tar.zst
+    or x.tzst), or None."""
+    name = path.lower()
+    for fmt in FORMATS:
+        if name.endswith('.' + fmt):
+            return fmt
+    return FORMAT_SUFFIXES.get(os.path.splitext(name)[1])
+
+
+def is_dir_source(path):
+    return path.endswith(os.sep) or os.path.isdir(path)
+
+
+def is_contents_source(path):
+    """True for 'dir/.': archive what is in dir, not dir itself."""
+    return path.endswith(os.sep + os.curdir)
+
+
+def source_name(path):
+    if is_contents_source(path):
+        path = os.path.dirname(path)
+    return os.path.basename(path.rstrip(os.sep)) or path
+
+
+def collect_files(sources, dirs=False):
+    """(source index, file, arcname) for every file to archive, in a stable
+    order: source order, then sorted directory walks. With `dirs`, each
+    directory walked gets an entry too, before its files.
+
+    Files of a directory source are stored under its name ('build/x'),
+    except for a source ending in os.sep + '.' ('build/.'), whose contents
+    go to the top of the archive ('x'), like `tar -C build .` (not
+    supported by compress_rar)."""
+    entries = []
+    with_dirs = dirs
+    for index, p in enumerate(sources):
+        if is_dir_source(p):
+            if is_contents_source(p):
+                root = top = os.path.dirname(p)
+            else:
+                root = p.rstrip(os.sep)
+                top = os.path.dirname(root)
+            for base, dirs, files in os.walk(root):
+                dirs.sort()
+                if with_dirs and base != top:
+                    entries.append((index, base, os.path.relpath(base, top)))
+                for fname in sorted(files):
+                    full = os.path.join(base, fname)
+                    entries.append((index, full, os.path.relpath(full, top)))
+        else:
+            entries.append((index, p, os.path.basename(p)))
+    return entries
+
+
+def method_note(compress_type, level, reason):
+    """' (stored: <reason>)' for a log line, or '' for a normally compressed file."""
+    if reason is None:
+        return ''
+    return f' (stored: {reason})' if compress_type == zipfile.ZIP_STORED else f' (level {level}: {reason})'
+
+
+def file_digest(path, reader=None):
+    """SHA-256 hex digest of the content of `path`."""
+    digest = hashlib.sha256()
+    for chunk in (reader or ChunkReader()).chunks(path):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def manifest_path_for(out_path):
+    return out_path + '.manifest.json'
+
+
+def load_manifest(path):
+    """{arcname: {'size', 'mtime_ns', 'sha256'}} from the manifest at
+    `path`; {} if it does not exist yet."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        raise CompressError(f'cannot read manifest {path}: {e}')
+    if not isinstance(data, dict) or data.get('version') != MANIFEST_VERSION or not isinstance(data.get('files'), dict):
+        raise CompressError(f'{path}: not a compress manifest (version {MANIFEST_VERSION})')
+    return data['files']
+
+
+def save_manifest(path, files):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'version': MANIFEST_VERSION, 'files': files}, f, separators=(',', ':'), sort_keys=True)
+    os.replace(tmp, path)
+
+
+def diff_manifest(entries, previous, present=None):
+    """Compare `entries` (from collect_files) with the `previous` manifest.
+
+    Returns (changed entries, deleted arcnames, manifest of the current
+    files). A file is unchanged if its size and mtime match its record, or
+    if only its mtime changed and its hash still matches; only files whose
+    size or mtime changed are read. Records from zip_manifest have no hash
+    and match on size and ZIP date instead. `present`, when given, is the
+    set of member names in the archive being updated; files missing from it
+    are treated as changed whatever the manifest says."""
+    reader = ChunkReader()
+    changed, files = [], {}
+    for entry in entries:
+        _, full, arc = entry
+        st = os.stat(full)
+        old = previous.get(arc)
+        record = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': None}
+        if old and old.get('size') == st.st_size and old.get('mtime_ns') == st.st_mtime_ns:
+            record['sha256'] = old.get('sha256')
+        else:
+            record['sha256'] = file_digest(full, reader)
+        files[arc] = record
+        if old and 'date_time' in old:
+            same = old.get('size') == st.st_size and old['date_time'] == zip_date_time(st.st_mtime)
+        else:
+            same = old and old.get('sha256') == record['sha256']
+        if not same or (present is not None and arc not in present):
+            changed.append(entry)
+    deleted = sorted(set(previous) - set(files))
+    return changed, deleted, files
+
+
+def zip_manifest(zf):
+    """Manifest records for the members of `zf`, for appending to a ZIP
+    that has no manifest: their size and date (what ZipInfo.from_file would
+    give the file), but no hash."""
+    return {info.filename: {'size': info.file_size, 'date_time': list(info.date_time)}
+            for info in zf.infolist() if not info.is_dir() and info.filename != DELETIONS_MEMBER}
+
+
+def zip_date_time(mtime):
+    """`mtime` as a ZIP member date: local time with 2-second resolution."""
+    t = time.localtime(mtime)
+    return [*t[:5], t[5] // 2 * 2]
+
+
+def _drop_members(zf, names):
+    """Remove `names` from the central directory of `zf` (opened with
+    mode 'a'); their data stays in the file. Returns (members dropped, bytes
+    left behind)."""
+    names = set(names) & set(zf.NameToInfo)
+    if not names:
+        return 0, 0
+    dropped = [info for info in zf.filelist if info.filename in names]
+    zf.filelist = [info for info in zf.filelist if info.filename not in names]
+    for name in names:
+        del zf.NameToInfo[name]
+    zf._didModify = True
+    return len(dropped), sum(info.compress_size + len(info.FileHeader()) for info in dropped)
+
+
+def find_duplicates(paths, reader=None):
+    """{index: index of the first path with identical content} for `paths`.
+    Only regular files are candidates: a symlink (which tar stores as a
+    link, and whose target may be in `paths` too) is never a duplicate or
+    an original. Only files sharing a size with another one are hashed
+    (SHA-256), so a tree without duplicates costs one stat per file."""
+    by_size = {}
+    for i, path in enumerate(paths):
+        st = os.lstat(path)
+        if stat.S_ISREG(st.st_mode) and st.st_size:
+            by_size.setdefault(st.st_size, []).append(i)
+    reader = reader or ChunkReader()
+    duplicates = {}
+    for group in by_size.values():
+        if len(group) < 2:
+            continue
+        first = {}
+        for i in group:
+            digest = file_digest(paths[i], reader)
+            if digest in first:
+                duplicates[i] = first[digest]
+            else:
+                first[digest] = i
+    return duplicates
+
+
+def cpu_time():
+    """CPU seconds used by this process and its finished children (zstd, xz...)."""
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def dedup_note(count, size, avoided, hash_seconds, action):
+    """Log line for `count` duplicate files (`size` bytes) that were `action`,
+    saving about `avoided` CPU seconds."""
+    return (f'Dedup: {count} duplicate file(s), {size / 1e6:.1f} MB {action}; '
+            f'~{avoided:.1f}s CPU avoided, {hash_seconds:.1f}s spent hashing')
+
+
+def _copy_member(zf, source, zinfo):
+    """Append `zinfo` to `zf` (open for writing) with the compressed data of
+    its earlier member `source`, which has the same content, instead of
+    compressing it again."""
+    fp = zf.fp
+    fp.seek(source.header_offset)
+    header = fp.read(zipfile.sizeFileHeader)
+    name_len, extra_len = struct.unpack('<HH', header[26:30])
+    offset = source.header_offset + zipfile.sizeFileHeader + name_len + extra_len
+    zinfo.compress_type = source.compress_type
+    zinfo.CRC, zinfo.file_size, zinfo.compress_size = source.CRC, source.file_size, source.compress_size
+    zinfo.header_offset = end = zf.start_dir
+    fp.seek(end)
+    fp.write(zinfo.FileHeader())
+    end = fp.tell()
+    left = source.compress_size
+    while left:
+        fp.seek(offset)
+        data = fp.read(min(left, READ_CHUNK_SIZE))
+        fp.seek(end)
+        fp.write(data)
+        offset += len(data)
+        end += len(data)
+        left -= len(data)
+    zf.filelist.append(zinfo)
+    zf.NameToInfo[zinfo.filename] = zinfo
+    zf.start_dir = end
+    zf._didModify = True
+
+
+def compress_zip(sources, out_path, jobs=1, preset=DEFAULT_PRESET, log=None, progress=None,
+                 item_done=None, item_failed=None, chunk_size=None, manifest=None, append=False, dedup=True):
+    """Archive `sources` into a ZIP at `out_path`; returns an ItemStats per
+    source. jobs > 1 uses write_zip_parallel, 1 the streaming zipfile writer.
+    `chunk_size` is the read size of the streaming writer (READ_CHUNK_SIZE)
+    or the deflate chunk size of the parallel one (ZIP_CHUNK_SIZE).
+
+    With `manifest` (a path) only files that changed since the run that
+    wrote it are archived, plus a DELETIONS_MEMBER list; with `append` they
+    are added to an existing `out_path` instead (manifest defaults to
+    manifest_path_for(out_path); if there is none yet, the members of
+    `out_path` stand in for it, see zip_manifest). The manifest is
+    rewritten on success. Appending writes over the central directory of
+    `out_path`: if it is interrupted the ZIP cannot be read any more.
+
+    With `dedup`, files with the same content as an earlier one (see
+    find_duplicates) reuse its compressed data instead of being compressed
+    again; the archive is the same as without it.
+
+    `out_path` may also be a writable stream such as a StreamPipe: the
+    archive is then written in one pass by the serial writer, since the
+    parallel writer and dedup seek in the output."""
+    log, progress, item_done = log or _noop, progress or _noop, item_done or _noop
+    start = time.time()
+    if not _is_path(out_path):
+        if manifest or append:
+            raise CompressError('incremental archives must be written to a file')
+        jobs, dedup = 1, False
+    entries = collect_files(sources)
+    mode, drop, deleted, records = 'w', (), [], None
+    if append:
+        manifest = manifest or manifest_path_for(out_path)
+    if manifest:
+        present, previous = None, load_manifest(manifest)
+        if append and os.path.exists(out_path):
+            mode = 'a'
+            with zipfile.ZipFile(out_path) as zf:
+                present = set(zf.NameToInfo)
+                if not os.path.exists(manifest):
+                    previous = zip_manifest(zf)
+                    log(f'No manifest {manifest}: comparing with the size and date of the '
+                        f'{len(previous)} file(s) in {out_path}')
+        elif append:
+            present = set()
+        total = len(entries)
+        entries, deleted, records = diff_manifest(entries, previous, present)
+        log(f'Incremental: {len(entries)} new or changed, {len(deleted)} deleted, '
+            f'{total - len(entries)} unchanged files ({time.time() - start:.1f}s to scan)')
+        if mode == 'a':
+            drop = [arc for _, _, arc in entries] + deleted
+    duplicates, hash_seconds = {}, 0.0
+    if dedup:
+        hash_start = time.time()
+        duplicates = find_duplicates([full for _, full, _ in entries])
+        hash_seconds = time.time() - hash_start
+    action = 'Updating' if mode == 'a' else 'Creating'
+    cpu_times = {}  # entry -> CPU seconds spent compressing it, for entries with duplicates
+    if jobs > 1:
+        log(f'{action} ZIP {out_path} ({jobs} threads, preset={preset})')
+        results = _zip_parallel(sources, entries, out_path, jobs, preset, log, progress, item_done,
+                                chunk_size or ZIP_CHUNK_SIZE, mode, drop, duplicates, cpu_times)
+    else:
+        log(f'{action} ZIP {out_path} (preset={preset})')
+        results = _zip_serial(sources, entries, out_path, preset, log, progress, item_done,
+                              chunk_size or READ_CHUNK_SIZE, mode, drop, duplicates, cpu_times)
+    if duplicates:
+        reused = sum(os.path.getsize(entries[i][1]) for i in duplicates)
+        log(dedup_note(len(duplicates), reused, sum(cpu_times[j] for j in duplicates.values()), hash_seconds,
+                       'reused the compressed data of their first copy'))
+    if deleted and not append:
+        with zipfile.ZipFile(out_path, 'a') as zf:
+            zf.writestr(DELETIONS_MEMBER, ''.join(f'{arc}\n' for arc in deleted))
+        log(f'Recorded {len(deleted)} deleted file(s) in {DELETIONS_MEMBER}')
+    if records is not None:
+        save_manifest(manifest, records)
+    log(f'ZIP completed: {out_path} (size {_output_size(out_path)} bytes, {time.time() - start:.1f}s)')
+    return results
+
+
+def _open_zip(out_path, mode, drop, log):
+    zf = zipfile.ZipFile(out_path, mode, compression=zipfile.ZIP_DEFLATED, compresslevel=9)
+    dropped, stale = _drop_members(zf, drop) if mode == 'a' else (0, 0)
+    if dropped:
+        log(f'Dropped {dropped} replaced or deleted member(s); {stale / 1e6:.1f} MB of old data '
+            f'stays in the archive until it is re-created')
+    return zf
+
+
+def _zip_serial(sources, entries, out_path, preset, log, progress, item_done, chunk_size, mode='w', drop=(),
+                duplicates=None, cpu_times=None):
+    reader = ChunkReader(chunk_size)
+    duplicates = duplicates or {}
+    originals = set(duplicates.values())
+    written = {}  # entry -> ZipInfo of entries that have duplicates
+    by_source = {}
+    for i, (index, full, arc) in enumerate(entries):
+        by_source.setdefault(index, []).append((i, full, arc))
+    results = []
+    with _open_zip(out_path, mode, drop, log) as zf:
+        for index, p in enumerate(sources):
+            files = by_source.get(index, [])
+            total = sum(os.path.getsize(full) for _, full, _ in files)
+            copied = packed = stored = 0
+            item_start = time.time()
+            for i, full, arc in files:
+                zinfo = zipfile.ZipInfo.from_file(full, arc)
+                if i in duplicates:
+                    log(f'Adding {full} as {arc} (duplicate of {entries[duplicates[i]][2]})')
+                    _copy_member(zf, written[duplicates[i]], zinfo)
+                    copied += zinfo.file_size
+                    progress(index, copied, total)
+                else:
+                    compress_type, level, reason = choose_compression(full, preset)
+                    log(f'Adding {full} as {arc}' + method_note(compress_type, level, reason))
+                    zinfo.compress_type = compress_type
+                    zinfo._compresslevel = level
+                    cpu_start = time.thread_time()
+                    # write chunk by chunk to report progress
+                    with zf.open(zinfo, 'w') as dest:
+                        for chunk in reader.chunks(full):
+                            dest.write(chunk)
+                            copied += len(chunk)
+                            progress(index, copied, total)
+                    if i in originals:
+                        written[i] = zinfo
+                        if cpu_times is not None:
+                            cpu_times[i] = time.thread_time() - cpu_start
+                packed += zinfo.compress_size
+                stored += zinfo.compress_type == zipfile.ZIP_STORED
+            stats = ItemStats(copied, packed, time.time() - item_start, len(files), stored)
+            log(f'{source_name(p)}: {stats.describe()}')
+            item_done(index, stats)
+            results.append(stats)
+    return results
+
+
+def _zip_parallel(sources, entries, out_path, jobs, preset, log, progress, item_done, chunk_size,
+                  mode='w', drop=(), duplicates=None, cpu_times=None):
+    duplicates = duplicates or {}
+    # Duplicates are copied, so their first 16 KB needn't be sampled
+    methods = [(zipfile.ZIP_STORED, None, None) if i in duplicates else choose_compression(full, preset)
+               for i, (_, full, _) in enumerate(entries)]
+    sizes = [os.path.getsize(full) for _, full, _ in entries]
+    # Per source: [total bytes, bytes in finished files, compressed bytes, stored files, files, files left]
+    state = [[0, 0, 0, 0, 0, 0] for _ in sources]
+    for (index, _, _), size in zip(entries, sizes):
+        state[index][0] += size
+        state[index][4] += 1
+        state[index][5] += 1
+    results = [None] * len(sources)
+    # Chunks are compressed ahead of the writer, so a source is timed from
+    # the end of the previous one rather than from its first write
+    last_done = [time.time()]
+
+    def finish(index):
+        total, _, packed, stored, files, _ = state[index]
+        now = time.time()
+        results[index] = ItemStats(total, packed, now - last_done[0], files, stored)
+        last_done[0] = now
+        log(f'{source_name(sources[index])}: {results[index].describe()}')
+        item_done(index, results[index])
+
+    def on_entry(i):
+        _, full, arc = entries[i]
+        if i in duplicates:
+            log(f'Adding {full} as {arc} (duplicate of {entries[duplicates[i]][2]})')
+        else:
+            log(f'Adding {full} as {arc}' + method_note(*methods[i]))
+
+    def on_progress(i, done, size):
+        index = entries[i][0]
+        progress(index, state[index][1] + done, state[index][0])
+
+    def on_done(i, zinfo):
+        index = entries[i][0]
+        item = state[index]
+        item[1] += zinfo.file_size
+        item[2] += zinfo.compress_size
+        item[3] += zinfo.compress_type == zipfile.ZIP_STORED
+        item[5] -= 1
+        if not item[5]:
+            finish(index)
+
+    with _open_zip(out_path, mode, drop, log) as zf:
+        write_zip_parallel(zf, [(full, arc) for _, full, arc in entries], jobs, chunk_size=chunk_size,
+                           on_entry=on_entry, on_progress=on_progress,
+                           methods=[m[:2] for m in methods], on_done=on_done, duplicates=duplicates,
+                           cpu_times=cpu_times)
+    for index in range(len(sources)):
+        if results[index] is None:  # no files, e.g. an empty directory
+            finish(index)
+    return results
+
+
+def seven_zip_filters(files, preset=DEFAULT_PRESET):
+    """(py7zr filters, description) for archiving `files` under `preset`.
+
+    py7zr applies one filter chain to the whole solid archive, so the
+    incompressible-file policy is applied per archive: copy (or LZMA2
+    preset 1 under 'max') when every file is incompressible, preset 1 when
+    90% of the bytes are, the preset's own level otherwise."""
+    import py7zr
+    settings = PRESETS[preset]
+    sizes = [os.path.getsize(full) for full in files]
+    flags = [incompressible_reason(full) is not None for full in files]
+    total = sum(sizes)
+    skipped = sum(size for size, flag in zip(sizes, flags) if flag)
+    note = f'{sum(flags)}/{len(files)} files incompressible'
+    if files and all(flags) and settings['incompressible_level'] is None:
+        return [{'id': py7zr.FILTER_COPY}], f'copy, {note}'
+    level = settings['lzma_preset']
+    if total and skipped >= 0.9 * total:
+        level = min(level, 1)
+    return [{'id': py7zr.FILTER_LZMA2, 'preset': level}], f'preset={level}, {note}'
+
+
+def compress_7z(sources, out_path, jobs=1, preset=DEFAULT_PRESET, log=None, progress=None,
+                item_done=None, item_failed=None, block_size=None, dict_size=None):
+    """Archive `sources` into a 7z at `out_path`; returns an ItemStats
+    (packed=None) per source, or None for sources that failed.
+
+    With `jobs` > 1, a `block_size` or `dict_size`, or without py7zr, the
+    archive is written by sevenzip.write_7z: solid blocks of `block_size`
+    bytes (default 16 MB) compressed with LZMA2 on `jobs` threads, with
+    per-file progress; a source with a file that cannot be opened is
+    skipped before writing starts. Otherwise py7zr writes it on one thread."""
+    log, progress = log or _noop, progress or _noop
+    item_done, item_failed = item_done or _noop, item_failed or _noop
+    if jobs > 1 or block_size or dict_size or not has_py7zr():
+        return _7z_blocks(sources, out_path, jobs, preset, log, progress, item_done, item_failed,
+                          block_size, dict_size)
+    import py7zr
+    start = time.time()
+    entries = collect_files(sources)
+    filters, desc = seven_zip_filters([full for _, full, _ in entries], preset)
+    log(f'Creating 7z {out_path} ({desc})')
+    totals = [0] * len(sources)
+    counts = [0] * len(sources)
+    for index, full, _ in entries:
+        totals[index] += os.path.getsize(full)
+        counts[index] += 1
+    results = []
+    # py7zr doesn't provide per-chunk callbacks easily; we add sources one by one and report per source
+    with py7zr.SevenZipFile(out_path, 'w', filters=filters) as archive:
+        for index, p in enumerate(sources):
+            try:
+                item_start = time.time()
+                progress(index, 0, totals[index])
+                if is_contents_source(p):
+                    root = os.path.dirname(p)
+                    log(f'Adding contents of directory {root}')
+                    for name in sorted(os.listdir(root)):
+                        archive.writeall(os.path.join(root, name), name)
+                elif is_dir_source(p):
+                    root = p.rstrip(os.sep)
+                    log(f'Adding directory {root} as {os.path.basename(root)}')
+                    archive.writeall(root, os.path.basename(root))
+                else:
+                    log(f'Adding file {p} as {os.path.basename(p)}')
+                    archive.write(p, os.path.basename(p))
+            except Exception as e:
+                item_failed(index, e)
+                results.append(None)
+                continue
+            # The archive is solid, so only the overall ratio is known (below)
+            stats = ItemStats(totals[index], None, time.time() - item_start, counts[index], 0)
+            log(f'{source_name(p)}: {stats.describe()}')
+            item_done(index, stats)
+            results.append(stats)
+    size = os.path.getsize(out_path)
+    log(f'7z completed: {out_path} (size {size} bytes; {format_stats(sum(totals), size, time.time() - start)})')
+    return results
+
+
+def _7z_blocks(sources, out_path, jobs, preset, log, progress, item_done, item_failed, block_size, dict_size):
+    import sevenzip
+    start = time.time()
+    settings = PRESETS[preset]
+    block_size = block_size or sevenzip.DEFAULT_BLOCK_SIZE
+    entries = collect_files(sources, dirs=True)
+    # write_7z cannot skip a file once the archive is being written, so
+    # sources with a missing or unreadable file are dropped now
+    failed = set()
+    for index, full, _ in entries:
+        if index in failed or os.path.isdir(full):
+            continue
+        try:
+            with open(full, 'rb'):
+                pass
+        except OSError as e:
+            failed.add(index)
+            item_failed(index, e)
+    entries = [entry for entry in entries if entry[0] not in failed]
+    is_dir = [os.path.isdir(full) for _, full, _ in entries]
+    # Incompressible files go to Copy blocks (or LZMA2 preset 1 under 'max')
+    reasons = [None if d else incompressible_reason(full) for d, (_, full, _) in zip(is_dir, entries)]
+    copy = 'copy' if settings['incompressible_level'] is None else 1
+    methods = [settings['lzma_preset'] if r is None else copy for r in reasons]
+    sizes = [0 if d else os.path.getsize(full) for d, (_, full, _) in zip(is_dir, entries)]
+    # Per source: [total bytes, bytes in finished entries, files, entries left, stored files]
+    state = [[0, 0, 0, 0, 0] for _ in sources]
+    for (index, _, _), size, d, m in zip(entries, sizes, is_dir, methods):
+        state[index][0] += size
+        state[index][2] += not d
+        state[index][3] += 1
+        state[index][4] += m == 'copy' and not d
+    note = f'{sum(r is not None for r in reasons)}/{len(is_dir) - sum(is_dir)} files incompressible'
+    log(f'Creating 7z {out_path} (LZMA2 preset={settings["lzma_preset"]}, '
+        f'{block_size / 1024 / 1024:g} MB blocks, {jobs} threads, {note})')
+    results = [None] * len(sources)
+    last_done = [time.time()]
+
+    def finish(index):
+        total, _, files, _, stored = state[index]
+        now = time.time()
+        # The archive is solid, so only the overall ratio is known (below)
+        results[index] = ItemStats(total, None, now - last_done[0], files, stored)
+        last_done[0] = now
+        log(f'{source_name(sources[index])}: {results[index].describe()}')
+        item_done(index, results[index])
+
+    def on_entry(i):
+        _, full, arc = entries[i]
+        note = f' ({"stored" if methods[i] == "copy" else "preset 1"}: {reasons[i]})' if reasons[i] else ''
+        log(f'Adding {full} as {arc}{note}')
+
+    def on_progress(i, done, size):
+        index = entries[i][0]
+        progress(index, state[index][1] + done, state[index][0])
+
+    def on_done(i):
+        index = entries[i][0]
+        state[index][1] += sizes[i]
+        state[index][3] -= 1
+        if not state[index][3]:
+            finish(index)
+
+    sevenzip.write_7z(out_path, [(full, arc) for _, full, arc in entries], jobs, block_size, dict_size,
+                      methods=methods, on_entry=on_entry, on_progress=on_progress, on_done=on_done)
+    for index in range(len(sources)):
+        if results[index] is None and index not in failed:
+            finish(index)
+    size = os.path.getsize(out_path)
+    log(f'7z completed: {out_path} (size {size} bytes; {format_stats(sum(sizes), size, time.time() - start)})')
+    return results
+
+
+class _ProgressReader:
+    """File wrapper for TarFile.addfile that reports bytes read."""
+
+    def __init__(self, f, on_read):
+        self._f = f
+        self._on_read = on_read
+
+    def read(self, size=-1):
+        data = self._f.read(size)
+        self._on_read(len(data))
+        return data
+
+
+@contextmanager
+def _compressed_stream(out_path, codec, level, jobs, long_distance):
+    """Yield (writable stream, description) compressing into `out_path`, a
+    path or a writable stream.
+
+    zst: the zstandard module if installed, else the zstd binary; both with
+    `jobs` worker threads and, with `long_distance`, a 128 MB match window.
+    gz / xz: pigz / `xz -T` when jobs > 1 and they are installed, else the
+    single-threaded gzip / lzma modules."""
+    command = None
+    if codec == 'zst' and not has_zstandard():
+        if not shutil.which('zstd'):
+            raise CompressError('tar.zst needs the zstandard module (pip install zstandard) or the zstd binary')
+        command = ['zstd', f'-{level}', f'-T{jobs}', '-q', '-c']
+        if long_distance:
+            command.append(f'--long={ZSTD_LONG_WINDOW_LOG}')
+    elif codec == 'gz' and jobs > 1 and shutil.which('pigz'):
+        command = ['pigz', f'-{level}', '-p', str(jobs), '-c']
+    elif codec == 'xz' and jobs > 1 and shutil.which('xz'):
+        command = ['xz', f'-{level}', f'-T{jobs}', '-q', '-c']
+
+    with open(out_path, 'wb') if _is_path(out_path) else nullcontext(out_path) as raw:
+        if command:
+            to_file = _is_path(out_path)
+            proc = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=raw if to_file else subprocess.PIPE,
+                                    stderr=subprocess.PIPE)
+            pump, pump_errors = None, []
+            if not to_file:
+                # Copy the compressor's output into the stream; if that fails
+                # (e.g. the reader aborted), stop the compressor so writes fail too
+                def copy_output():
+                    try:
+                        shutil.copyfileobj(proc.stdout, raw, READ_CHUNK_SIZE)
+                    except Exception as e:
+                        pump_errors.append(e)
+                        proc.kill()
+                pump = threading.Thread(target=copy_output, daemon=True)
+                pump.start()
+            try:
+                yield proc.stdin, ' '.join(command)
+            finally:
+                try:
+                    proc.stdin.close()
+                except OSError:
+                    pass
+                if pump:
+                    pump.join()
+                err = proc.stderr.read().decode(errors='replace').strip()
+                proc.wait()
+            if pump_errors:
+                raise pump_errors[0]
+            if proc.returncode:
+                raise CompressError(f'{command[0]} failed with code {proc.returncode}: {err}')
+        elif codec == 'zst':
+            import zstandard
+            params = zstandard.ZstdCompressionParameters.from_level(
+                level, threads=jobs if jobs > 1 else 0, enable_ldm=long_distance,
+                window_log=ZSTD_LONG_WINDOW_LOG if long_distance else 0)
+            with zstandard.ZstdCompressor(compression_params=params).stream_writer(raw, closefd=False) as stream:
+                yield stream, f'zstandard level {level}, {jobs} threads'
+        elif codec == 'gz':
+            with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=level) as stream:
+                yield stream, f'gzip level {level}'
+        elif codec == 'xz':
+            with lzma.LZMAFile(raw, 'w', preset=level) as stream:
+                yield stream, f'xz preset {level}'
+        else:
+            raise CompressError(f'unknown tar compression {codec!r}')
+
+
+def compress_tar(sources, out_path, codec='zst', jobs=1, preset=DEFAULT_PRESET, log=None, progress=None,
+                 item_done=None, long_distance=True, dedup=False):
+    """Stream `sources` into a tar compressed with `codec` ('zst', 'gz' or
+    'xz') at `out_path`; returns an ItemStats (packed=None) per source.
+
+    The tar is written in stream mode straight into the compressor, so
+    nothing is staged on disk. zstd runs on `jobs` threads with long-distance
+    matching unless `long_distance` is False; see _compressed_stream.
+
+    With `dedup`, files with the same content as an earlier one are stored
+    as hard links to it, so their data is neither compressed nor stored
+    again (they are extracted as hard links). `out_path` may also be a
+    writable stream such as a StreamPipe."""
+    log, progress, item_done = log or _noop, progress or _noop, item_done or _noop
+    settings = PRESETS[preset]
+    level = {'zst': settings['zstd_level'], 'gz': settings['zip_level'], 'xz': settings['lzma_preset']}.get(codec)
+    if level is None:
+        raise CompressError(f'unknown tar compression {codec!r}')
+    start = time.time()
+    entries = collect_files(sources, dirs=True)
+    totals = [0] * len(sources)
+    counts = [0] * len(sources)
+    for index, full, _ in entries:
+        if not os.path.isdir(full):
+            totals[index] += os.path.getsize(full)
+            counts[index] += 1
+    duplicates, hash_seconds = {}, 0.0
+    if dedup:
+        hash_start = time.time()
+        files = [n for n, (_, full, _) in enumerate(entries) if not os.path.isdir(full)]
+        duplicates = {files[i]: files[j] for i, j in find_duplicates([entries[n][1] for n in files]).items()}
+        hash_seconds = time.time() - hash_start
+    done = [0] * len(sources)
+    results = [None] * len(sources)
+    last_done = [time.time()]
+    cpu_start = cpu_time()
+
+    def finish(index):
+        now = time.time()
+        # One compressed stream, so only the overall ratio is known (below)
+        results[index] = ItemStats(totals[index], None, now - last_done[0], counts[index], 0)
+        last_done[0] = now
+        log(f'{source_name(sources[index])}: {results[index].describe()}')
+        item_done(index, results[index])
+
+    with _compressed_stream(out_path, codec, level, jobs, long_distance) as (stream, desc):
+        log(f'Creating tar.{codec} {out_path} ({desc})')
+        with tarfile.open(fileobj=stream, mode='w|', bufsize=READ_CHUNK_SIZE,
+                          copybufsize=READ_CHUNK_SIZE, format=tarfile.PAX_FORMAT) as tar:
+            for n, (index, full, arc) in enumerate(entries):
+                info = tar.gettarinfo(full, arc.replace(os.sep, '/'))
+                if n in duplicates:
+                    target = entries[duplicates[n]][2]
+                    log(f'Adding {full} as {arc} (hard link to {target})')
+                    info.type, info.linkname, info.size = tarfile.LNKTYPE, target.replace(os.sep, '/'), 0
+                    tar.addfile(info)
+                    done[index] += os.path.getsize(full)
+                    progress(index, done[index], totals[index])
+                elif not info.isreg():
+                    tar.addfile(info)
+                else:
+                    log(f'Adding {full} as {arc}')
+
+                    def on_read(count, index=index):
+                        done[index] += count
+                        progress(index, done[index], totals[index])
+
+                    with open(full, 'rb') as f:
+                        tar.addfile(info, _ProgressReader(f, on_read))
+                if n + 1 == len(entries) or entries[n + 1][0] != index:
+                    finish(index)
+    for index in range(len(sources)):
+        if results[index] is None:
+            finish(index)
+    if duplicates:
+        # One stream, so the CPU time avoided is estimated from the average per byte
+        linked = sum(os.path.getsize(entries[n][1]) for n in duplicates)
+        compressed = sum(totals) - linked
+        avoided = (cpu_time() - cpu_start) * linked / compressed if compressed else 0.0
+        log(dedup_note(len(duplicates), linked, avoided, hash_seconds, 'stored as hard links'))
+    size = _output_size(out_path)
+    log(f'tar.{codec} completed: {out_path} (size {size} bytes; '
+        f'{format_stats(sum(totals), size, time.time() - start)})')
+    return results
+
+
+def compress_rar(sources, out_path, rar_bin=None, log=None):
+    """Archive `sources` with the external rar binary (`rar a -ep1`)."""
+    log = log or _noop
+    rar_bin = rar_bin or find_rar()
+    if not rar_bin:
+        raise CompressError('RAR/WinRAR executable not found in PATH. Install WinRAR or provide rar.exe')
+    # rar wants paths without trailing sep
+    cmd = [rar_bin, 'a', '-ep1', out_path] + [p.rstrip(os.sep) for p in sources]
+    log(f'Executing: {" ".join(cmd)}')
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    for line in proc.stdout:
+        log(line.rstrip())
+    proc.wait()
+    if proc.returncode != 0:
+        raise CompressError(f'rar exited with code {proc.returncode}')
+    log(f'RAR completed: {out_path} (size {os.path.getsize(out_path)} bytes)')
+
+
+def compress(fmt, sources, out_path, jobs=1, preset=DEFAULT_PRESET, log=None, progress=None,
+             item_done=None, item_failed=None, chunk_size=None, manifest=None, append=False,
+             block_size=None, dict_size=None, long_distance=True, dedup=None):
+    """Archive `sources` into `out_path` in format `fmt` (one of FORMATS).
+    Incremental archives (`manifest`, `append`) are only supported for zip,
+    `block_size` and `dict_size` only for 7z, `long_distance` for tar.zst.
+    `dedup` (default: on for zip, off for tar) is supported for zip and tar."""
+    if fmt == 'zip':
+        return compress_zip(sources, out_path, jobs, preset, log, progress, item_done, item_failed, chunk_size,
+                            manifest, append, dedup is not False)
+    if manifest or append:
+        raise CompressError('incremental archives are only supported for zip')
+    if dedup and not fmt.startswith('tar.'):
+        raise CompressError('deduplication is only supported for zip and tar')
+    if fmt == '7z':
+        return compress_7z(sources, out_path, jobs, preset, log, progress, item_done, item_failed,
+                           block_size, dict_size)
+    if fmt == 'rar':
+        return compress_rar(sources, out_path, log=log)
+    if fmt.startswith('tar.'):
+        return compress_tar(sources, out_path, fmt[4:], jobs, preset, log, progress, item_done, long_distance,
+                            bool(dedup))
+    raise CompressError(f'unknown format {fmt!r} (expected one of {", ".join(FORMATS)})')
+
+
+def open_archive_stream(fmt, sources, jobs=1, preset=DEFAULT_PRESET, log=None, progress=None, item_done=None,
+                        capacity=PIPE_CAPACITY):
+    """Archive `sources` as `fmt` ('zip' or a tar format) on a background
+    thread and return a StreamPipe to read the archive from while it is
+    produced, e.g. by ftplib's storbinary or paramiko's putfo; nothing is
+    written to disk. At most `capacity` bytes wait for the reader, so the
+    archiver runs at the pace of the upload. Failures are raised by read();
+    call abort() on the pipe if the reader stops early, then wait() for the
+    archiver to stop. Pass 'dir/.' to put the contents of dir at the top of
+    the archive (see collect_files)."""
+    if fmt not in ('zip', 'tar.zst', 'tar.gz', 'tar.xz'):
+        raise CompressError(f'{fmt} archives cannot be streamed')
+    pipe = StreamPipe(capacity)
+
+    def run():
+        try:
+            compress(fmt, sources, pipe, jobs, preset, log=log, progress=progress, item_done=item_done)
+        except BaseException as e:
+            pipe.close(e)
+        else:
+            pipe.close()
+
+    threading.Thread(target=run, daemon=True).start()
+    return pipe
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='compress',
+                                     description='Compress files and folders to zip, 7z, rar or tar.zst/gz/xz.')
+    parser.add_argument('sources', nargs='+', metavar='src', help='files or folders to archive')
+    parser.add_argument('-o', '--output', required=True, help='archive to write')
+    parser.add_argument('--format', choices=FORMATS, help='archive format (default: from the -o extension)')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help='ZIP, 7z and tar.zst/gz/xz compression threads (default: CPU count)')
+    parser.add_argument('--level', choices=list(PRESETS), default=DEFAULT_PRESET,
+                        help=f'compression preset (default: {DEFAULT_PRESET})')
+    parser.add_argument('--chunk-mb', type=int, metavar='MB',
+                        help='ZIP read size (default 1) or, with --jobs > 1, deflate chunk size (default 4); 1-16')
+    parser.add_argument('--manifest', metavar='FILE',
+                        help='incremental: archive only files changed since the run that wrote FILE')
+    parser.add_argument('--append', action='store_true',
+                        help='incremental: update the existing -o ZIP in place (manifest: OUT.manifest.json); '
+                             'if interrupted, the ZIP is left unreadable')
+    parser.add_argument('--block-mb', type=int, metavar='MB',
+                        help='7z solid block size, the unit of work of each thread (default 16)')
+    parser.add_argument('--dict-mb', type=int, metavar='MB',
+                        help='7z LZMA2 dictionary size (default: the preset\'s, at most the block size)')
+    parser.add_argument('--no-long', dest='long_distance', action='store_false',
+                        help='tar.zst: disable long-distance matching (128 MB window)')
+    parser.add_argument('--dedup', action=argparse.BooleanOptionalAction,
+                        help='store files with identical content once: zip reuses the compressed data '
+                             '(default: on), tar stores hard links (default: off)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='only print errors')
+    args = parser.parse_args(argv)
+
+    fmt = args.format or format_for(args.output)
+    if fmt not in FORMATS:
+        parser.error(f'cannot infer the format from {args.output!r}; use --format')
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    chunk_size = args.chunk_mb * 1024 * 1024 if args.chunk_mb else None
+    if chunk_size and not MIN_CHUNK_SIZE <= chunk_size <= MAX_CHUNK_SIZE:
+        parser.error('--chunk-mb must be between 1 and 16')
+    for name in ('block_mb', 'dict_mb'):
+        if getattr(args, name) is not None and getattr(args, name) < 1:
+            parser.error(f'--{name.replace("_", "-")} must be at least 1')
+    block_size = args.block_mb * 1024 * 1024 if args.block_mb else None
+    dict_size = args.dict_mb * 1024 * 1024 if args.dict_mb else None
+    missing = [p for p in args.sources if not os.path.exists(p)]
+    if missing:
+        parser.error(f'no such file or directory: {", ".join(missing)}')
+
+    failed = []
+
+    def log(msg):
+        if not args.quiet:
+            print(msg, file=sys.stderr)
+
+    def item_failed(index, error):
+        failed.append(index)
+        print(f'{args.sources[index]}: {error}', file=sys.stderr)
+
+    try:
+        compress(fmt, args.sources, args.output, args.jobs, args.level, log=log, item_failed=item_failed,
+                 chunk_size=chunk_size, manifest=args.manifest, append=args.append,
+                 block_size=block_size, dict_size=dict_size, long_distance=args.long_distance, dedup=args.dedup)
+    except (CompressError, OSError) as e:
+        print(f'compress: {e}', file=sys.stderr)
+        return 1
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,28 +1,38 @@
 """
-Simple compressor GUI that lets you select files/folders and compress them to .7z, .zip or .rar.
-Uses py7zr for .7z (if installed), zipfile for .zip, and the external 'rar' binary for .rar (if available).
+Simple compressor GUI that lets you select files/folders and compress them to .7z, .zip, .rar or .tar.zst.
+The compression itself is done by compress.py (also usable from the command line):
+zipfile for .zip, sevenzip.py (or py7zr with Jobs = 1) for .7z, the external 'rar' binary for .rar (if available)
+and zstd (zstandard module or binary) for .tar.zst; .tar.gz / .tar.xz can be picked in the save dialog.
 
 Features:
 - Add files / Add folder
 - List of selected items
-- Buttons: Compress to 7z, zip, rar
+- Buttons: Compress to 7z, zip, rar, tar.zst
 - Log pane with trace of compression steps
+- Progress is recorded by the worker thread and redrawn at 10 Hz (progress.py)
+- Parallel ZIP: with Jobs > 1, files (and 4 MB chunks of large files) are
+  deflated on a thread pool and written in a fixed order into one ZIP
+- Parallel 7z: with Jobs > 1, files are packed into 16 MB solid blocks that
+  are LZMA2-compressed on a thread pool, with per-file progress
+- Presets (fast / balanced / max) pick the deflate level and LZMA2 preset.
+  Already-compressed files (by extension, or a high byte entropy in their
+  first 16 KB) are stored instead of recompressed; 'max' still deflates them
+  at level 1. The log shows ratio and throughput per item
+- tar.zst: a tar streamed into multithreaded zstd with long-distance matching
+- Incremental ZIP: updates an existing archive in place, adding only new or
+  changed files (tracked in OUT.zip.manifest.json next to it)
 
 """
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import threading
+import functools
 import os
 import time
-import zipfile
-import shutil
-import subprocess
 
-try:
-    import py7zr
-    HAS_PY7ZR = True
-except Exception:
-    HAS_PY7ZR = False
+import compress
+from compress import DEFAULT_PRESET, PRESETS
+from progress import ProgressTracker, poll
 
 
 class CompressorApp(tk.Tk):
@@ -61,10 +71,31 @@ class CompressorApp(tk.Tk):
         ttk.Button(act_frame, text='Compress -> .7z', command=self.compress_7z).pack(side='left')
         ttk.Button(act_frame, text='Compress -> .zip', command=self.compress_zip).pack(side='left', padx=6)
         ttk.Button(act_frame, text='Compress -> .rar', command=self.compress_rar).pack(side='left', padx=6)
+        ttk.Button(act_frame, text='Compress -> .tar.zst', command=self.compress_tar).pack(side='left', padx=6)
+        # Threads for ZIP, 7z and zstd compression; 1 keeps the original serial writers
+        self.zip_jobs = tk.IntVar(value=os.cpu_count() or 1)
+        ttk.Label(act_frame, text='Jobs').pack(side='left', padx=(12, 2))
+        ttk.Spinbox(act_frame, from_=1, to=64, width=4, textvariable=self.zip_jobs).pack(side='left')
+        # Level preset for ZIP and 7z; see PRESETS
+        self.preset = tk.StringVar(value=DEFAULT_PRESET)
+        ttk.Label(act_frame, text='Preset').pack(side='left', padx=(12, 2))
+        ttk.Combobox(act_frame, values=list(PRESETS), width=9, state='readonly',
+                     textvariable=self.preset).pack(side='left')
+        # Update an existing ZIP with only new/changed files (see compress.py)
+        self.incremental = tk.BooleanVar(value=False)
+        ttk.Checkbutton(act_frame, text='Incremental', variable=self.incremental).pack(side='left', padx=(12, 0))
 
         self.log_text = tk.Text(right, height=20)
         self.log_text.pack(fill='both', expand=True, padx=4, pady=4)
 
+        # Workers record per-item progress here; the item list is redrawn from it at 10 Hz
+        self.progress = ProgressTracker()
+        poll(self, self.progress, self._render_progress)
+
+    def _render_progress(self, task):
+        p, typ = self.items_tv.item(task.key, 'values')[:2]
+        self.items_tv.item(task.key, values=(p, typ, f'{task.percent()}%', task.status))
+
     def _log(self, msg):
         ts = time.strftime('%H:%M:%S')
         line = f'[{ts}] {msg}\n'
@@ -109,15 +140,15 @@ class CompressorApp(tk.Tk):
         if not items:
             messagebox.showwarning('No items', 'Select items to compress')
             return
-        out = filedialog.asksaveasfilename(defaultextension='.zip', filetypes=[('ZIP','*.zip')])
+        incremental = self.incremental.get()
+        # an incremental run usually targets an existing archive, so don't ask to replace it
+        out = filedialog.asksaveasfilename(defaultextension='.zip', filetypes=[('ZIP','*.zip')],
+                                           confirmoverwrite=not incremental)
         if not out:
             return
-        threading.Thread(target=self._do_compress_zip, args=(items, out), daemon=True).start()
+        self._start('ZIP', compress.compress_zip, out, jobs=self._jobs(), preset=self._preset(), append=incremental)
 
     def compress_7z(self):
-        if not HAS_PY7ZR:
-            messagebox.showerror('Missing dependency', 'py7zr is not installed. Install with: pip install py7zr')
-            return
         items = [p for _,p,t in self._gather_items_with_ids()]
         if not items:
             messagebox.showwarning('No items', 'Select items to compress')
@@ -125,7 +156,34 @@ class CompressorApp(tk.Tk):
         out = filedialog.asksaveasfilename(defaultextension='.7z', filetypes=[('7z','*.7z')])
         if not out:
             return
-        threading.Thread(target=self._do_compress_7z, args=(items, out), daemon=True).start()
+        self._start('7z', compress.compress_7z, out, jobs=self._jobs(), preset=self._preset())
+
+    def compress_tar(self):
+        items = [p for _,p,t in self._gather_items_with_ids()]
+        if not items:
+            messagebox.showwarning('No items', 'Select items to compress')
+            return
+        out = filedialog.asksaveasfilename(defaultextension='.tar.zst', filetypes=[
+            ('tar.zst', '*.tar.zst'), ('tar.gz', '*.tar.gz'), ('tar.xz', '*.tar.xz')])
+        if not out:
+            return
+        fmt = compress.format_for(out)
+        if not (fmt or '').startswith('tar.'):
+            fmt = 'tar.zst'
+        if fmt == 'tar.zst' and not compress.has_zstd():
+            messagebox.showerror('Missing dependency', 'zstd not found. Install with: pip install zstandard')
+            return
+        self._start(fmt, functools.partial(compress.compress, fmt), out, jobs=self._jobs(), preset=self._preset())
+
+    def _jobs(self):
+        try:
+            return max(1, int(self.zip_jobs.get()))
+        except (tk.TclError, ValueError):
+            return 1
+
+    def _preset(self):
+        preset = self.preset.get()
+        return preset if preset in PRESETS else DEFAULT_PRESET
 
     def compress_rar(self):
         items = [p for _,p,t in self._gather_items_with_ids()]
@@ -135,102 +193,37 @@ class CompressorApp(tk.Tk):
         out = filedialog.asksaveasfilename(defaultextension='.rar', filetypes=[('RAR','*.rar')])
         if not out:
             return
-        rar_bin = shutil.which('rar') or shutil.which('winrar')
+        rar_bin = compress.find_rar()
         if not rar_bin:
             messagebox.showerror('rar not found', 'RAR/WinRAR executable not found in PATH. Install WinRAR or provide rar.exe')
             return
         threading.Thread(target=self._do_compress_rar, args=(items, out, rar_bin), daemon=True).start()
 
-    def _do_compress_zip(self, items, out_path):
-        try:
-            self._log(f'Creating ZIP {out_path}')
-            with zipfile.ZipFile(out_path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=9) as zf:
-                # Add files with streaming copy to enable progress
-                for it, p, typ in self._gather_items_with_ids():
-                    if typ == 'dir' or p.endswith(os.sep):
-                        root = p.rstrip(os.sep)
-                        for base, dirs, files in os.walk(root):
-                            for fname in files:
-                                full = os.path.join(base, fname)
-                                rel = os.path.relpath(full, os.path.dirname(root))
-                                self._log(f'Adding {full} as {rel}')
-                                # write with chunked copy
-                                with open(full, 'rb') as src, zf.open(rel, 'w') as dest:
-                                    total = os.path.getsize(full)
-                                    copied = 0
-                                    while True:
-                                        chunk = src.read(8192)
-                                        if not chunk:
-                                            break
-                                        dest.write(chunk)
-                                        copied += len(chunk)
-                                        percent = int((copied/total)*100) if total else 100
-                                        try:
-                                            self.items_tv.item(it, values=(p, typ, f'{percent}%', 'compressing'))
-                                        except Exception:
-                                            pass
-                                self.items_tv.item(it, values=(p, typ, '100%', 'done'))
-                    else:
-                        arc = os.path.basename(p)
-                        self._log(f'Adding {p} as {arc}')
-                        with open(p, 'rb') as src, zf.open(arc, 'w') as dest:
-                            total = os.path.getsize(p)
-                            copied = 0
-                            while True:
-                                chunk = src.read(8192)
-                                if not chunk:
-                                    break
-                                dest.write(chunk)
-                                copied += len(chunk)
-                                percent = int((copied/total)*100) if total else 100
-                                try:
-                                    self.items_tv.item(it, values=(p, typ, f'{percent}%', 'compressing'))
-                                except Exception:
-                                    pass
-                        self.items_tv.item(it, values=(p, typ, '100%', 'done'))
-            self._log(f'ZIP completed: {out_path} (size {os.path.getsize(out_path)} bytes)')
-        except Exception as e:
-            self._log(f'ZIP failed: {e}')
+    def _start(self, label, engine, out_path, **options):
+        """Run `engine` (compress.compress_zip / compress_7z / compress) on the selected
+        items in a worker thread, recording its callbacks in self.progress."""
+        items = self._gather_items_with_ids()
+        tracker = self.progress
+        for it, _, _ in items:
+            tracker.start(key=it)
 
-    def _do_compress_7z(self, items, out_path):
-        try:
-            self._log(f'Creating 7z {out_path} (preset=9)')
-            # py7zr doesn't provide per-chunk callbacks easily; we'll add files one-by-one and update status per-file
-            with py7zr.SevenZipFile(out_path, 'w', filters=[{'id': 'LZMA2', 'preset': 9}]) as archive:
-                for it, p, typ in self._gather_items_with_ids():
-                    try:
-                        if typ == 'dir' or p.endswith(os.sep):
-                            root = p.rstrip(os.sep)
-                            self._log(f'Adding directory {root} as {os.path.basename(root)}')
-                            self.items_tv.item(it, values=(p, typ, '0%', 'queued'))
-                            archive.writeall(root, os.path.basename(root))
-                        else:
-                            self._log(f'Adding file {p} as {os.path.basename(p)}')
-                            self.items_tv.item(it, values=(p, typ, '0%', 'queued'))
-                            archive.write(p, os.path.basename(p))
-                        self.items_tv.item(it, values=(p, typ, '100%', 'done'))
-                    except Exception as e:
-                        self.items_tv.item(it, values=(p, typ, '0%', f'error: {e}'))
-            self._log(f'7z completed: {out_path} (size {os.path.getsize(out_path)} bytes)')
-        except Exception as e:
-            self._log(f'7z failed: {e}')
+        def progress(index, done, total):
+            tracker.update(items[index][0], done, total, 'compressing')
+
+        def run():
+            try:
+                engine([p for _, p, _ in items], out_path, log=self._log, progress=progress,
+                       item_done=lambda index, stats: tracker.finish(items[index][0], 'done'),
+                       item_failed=lambda index, e: tracker.finish(items[index][0], f'error: {e}'),
+                       **options)
+            except Exception as e:
+                self._log(f'{label} failed: {e}')
+
+        threading.Thread(target=run, daemon=True).start()
 
     def _do_compress_rar(self, items, out_path, rar_bin):
         try:
-            # Build rar command: rar a -ep1 output files...
-            cmd = [rar_bin, 'a', '-ep1', out_path]
-            # rar wants paths without trailing sep
-            for p in items:
-                cmd.append(p.rstrip(os.sep))
-            self._log(f'Executing: {" ".join(cmd)}')
-            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
-            for line in proc.stdout:
-                self._log(line.rstrip())
-            proc.wait()
-            if proc.returncode == 0:
-                self._log(f'RAR completed: {out_path} (size {os.path.getsize(out_path)} bytes)')
-            else:
-                self._log(f'RAR failed with exit code {proc.returncode}')
+            compress.compress_rar(items, out_path, rar_bin, log=self._log)
         except Exception as e:
             self._log(f'RAR failed: {e}')
 
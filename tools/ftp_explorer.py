@@ -1,6 +1,8 @@
 """
 Explorador FTP simple con GUI para seleccionar archivos locales y subir via FTP/FTPS.
 Usa Tkinter para la UI y reutiliza las funciones de `ftp_upload.py` para subir.
+Con "Stream folders" las carpetas se comprimen (ZIP o tar.zst, con `compress.py`)
+mientras se suben, sin archivo temporal.
 """
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, simpledialog
@@ -9,6 +11,9 @@ import ftplib
 import os
 import json
 from ftp_upload import connect_ftp, upload_file, ensure_remote_dirs
+from progress import ProgressTracker, poll
+import compress
+from unzip import unzip_file_with_progress
 try:
     from sftp_upload import connect_sftp, upload_file_sftp, upload_dir_sftp, sftp_mkdirs
 except Exception:
@@ -22,6 +27,9 @@ import shutil
 import tempfile
 import json as _json
 import platform
+import ssl
+
+STREAM_STOP_TIMEOUT = 30  # seconds to wait for the archiver of a failed streamed upload to stop
 
 
 def probe_protocols(host, ftp_port=21, timeout=2.0):
@@ -81,72 +89,6 @@ def _format_speed(bytes_count, seconds):
     return f"{_format_bytes(per_sec)}/s"
 
 
-def unzip_file_with_progress(zip_path, target_dir, overwrite=False, progress_callback=None, file_callback=None):
-    """Extract zip_path into target_dir streaming member files and calling callbacks.
-
-    progress_callback(done_bytes, total_bytes)
-    file_callback(action, path)  # action in {'extracted','skipped','error'}
-    """
-    import zipfile
-    CHUNK = 64 * 1024
-    total_bytes = 0
-    with zipfile.ZipFile(zip_path, 'r') as zf:
-        infos = [info for info in zf.infolist() if not info.is_dir()]
-        for info in infos:
-            total_bytes += info.file_size
-
-        done = 0
-        for info in infos:
-            member_path = info.filename
-            dest_path = os.path.join(target_dir, *member_path.split('/'))
-            # ensure directories
-            if info.is_dir():
-                os.makedirs(dest_path, exist_ok=True)
-                continue
-            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-
-            if os.path.exists(dest_path) and not overwrite:
-                done += info.file_size
-                if file_callback:
-                    try:
-                        file_callback('skipped', dest_path)
-                    except Exception:
-                        pass
-                if progress_callback:
-                    try:
-                        progress_callback(done, total_bytes)
-                    except Exception:
-                        pass
-                continue
-
-            try:
-                with zf.open(info, 'r') as src, open(dest_path, 'wb') as dst:
-                    while True:
-                        chunk = src.read(CHUNK)
-                        if not chunk:
-                            break
-                        dst.write(chunk)
-                        done += len(chunk)
-                        if progress_callback:
-                            try:
-                                progress_callback(done, total_bytes)
-                            except Exception:
-                                pass
-                if file_callback:
-                    try:
-                        file_callback('extracted', dest_path)
-                    except Exception:
-                        pass
-            except Exception as ex:
-                if file_callback:
-                    try:
-                        file_callback('error', dest_path)
-                    except Exception:
-                        pass
-                # continue with next file
-                continue
-
-
 class FTPExplorer(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -182,6 +124,14 @@ class FTPExplorer(tk.Tk):
         self.auto_delete_var = tk.BooleanVar(value=False)
         ttk.Checkbutton(conn_frame, text='Auto-delete originals after compression', variable=self.auto_delete_var).grid(row=1, column=2, columnspan=3, sticky='w')
 
+        # Option: archive folders straight into the upload (no temporary zip)
+        self.stream_upload_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(conn_frame, text='Stream folders (no temp archive)', variable=self.stream_upload_var).grid(row=2, column=0, columnspan=2, sticky='w')
+        ttk.Label(conn_frame, text='Folder format:').grid(row=2, column=2)
+        self.stream_format_var = tk.StringVar(value='zip')
+        ttk.Combobox(conn_frame, values=('zip', 'tar.zst'), width=8, state='readonly',
+                     textvariable=self.stream_format_var).grid(row=2, column=3, sticky='w')
+
         # Local files frame
         local_frame = ttk.LabelFrame(self, text='Local files')
         local_frame.pack(fill='both', expand=True, side='left', padx=10, pady=5)
@@ -268,12 +218,30 @@ class FTPExplorer(tk.Tk):
         self.cwd = '.'
 
         self.ftp = None
-        # track last logged percent per transfer node to avoid log flooding
+        # Transfers record their progress in self.transfers from worker threads;
+        # the status tree is redrawn from it at 10 Hz on the Tk thread
+        self.transfers = ProgressTracker()
+        self._transfer_rows = {}  # transfer key -> status tree node
+        # last logged 10% step per transfer, to avoid log flooding
         self._node_progress = {}
-        # per-node byte counters and start times
-        self._node_bytes_done = {}
-        self._node_total_bytes = {}
-        self._node_start_time = {}
+        poll(self, self.transfers, self._render_transfer)
+
+    def _render_transfer(self, task):
+        node = self._transfer_rows.get(task.key)
+        if node is None:
+            node = self._transfer_rows[task.key] = self.status_tree.insert('', 'end')
+        speed = _format_speed(task.done, task.elapsed()) if task.done else ''
+        self.status_tree.item(node, values=(task.status, task.total, f'{task.elapsed():.1f}s',
+                                            f'{task.percent()}%', speed))
+        if task.finished:
+            del self._transfer_rows[task.key]
+            self._node_progress.pop(task.key, None)
+        elif task.label and task.total:
+            # log progress in 10% steps
+            step = task.percent() // 10 * 10
+            if step > self._node_progress.get(task.key, -1):
+                self._node_progress[task.key] = step
+                self._log(f'{task.label} progress: {step}%')
 
     def add_files(self):
         files = filedialog.askopenfilenames()
@@ -446,44 +414,28 @@ class FTPExplorer(tk.Tk):
         threading.Thread(target=self._unzip_thread, args=(files, target), daemon=True).start()
 
     def _unzip_thread(self, files, target):
-        # Use the module-level helper to perform byte-level extraction and callbacks
+        # unzip.py does the byte-level extraction and callbacks
         for f in files:
             try:
-                node = self.status_tree.insert('', 'end', values=('queued', os.path.getsize(f) if os.path.exists(f) else 0, '0s', '0%', ''))
+                node = self.transfers.start(total=os.path.getsize(f) if os.path.exists(f) else 0)
                 start = time.time()
                 self._log(f'Extracting {f} -> {target}')
 
                 events = []
                 def _progress_cb(done, total):
-                    try:
-                        percent = int((done/total)*100) if total else 100
-                        speed = ''
-                        try:
-                            done = self._node_bytes_done.get(node, 0)
-                            st = self._node_start_time.get(node, start)
-                            speed = _format_speed(done, time.time()-st)
-                        except Exception:
-                            speed = ''
-                        self.status_tree.item(node, values=('extracting', os.path.getsize(f) if os.path.exists(f) else total, f'{time.time()-start:.1f}s', f'{percent}%', speed))
-                    except Exception:
-                        pass
+                    self.transfers.update(node, done, total, 'extracting')
 
                 def _file_cb(action, path):
                     # action: 'extracted' | 'skipped' | 'error'
                     events.append((action, path))
                     self._log(f'{action.upper()}: {path}')
 
-                from ftp_explorer import unzip_file_with_progress as _unzip_helper
-                _unzip_helper(f, target, overwrite=self.unzip_overwrite_var.get(), progress_callback=_progress_cb, file_callback=_file_cb)
+                unzip_file_with_progress(f, target, overwrite=self.unzip_overwrite_var.get(),
+                                         progress_callback=_progress_cb, file_callback=_file_cb,
+                                         jobs=os.cpu_count() or 1)
 
                 elapsed = time.time() - start
-                speed = ''
-                try:
-                    done = self._node_bytes_done.get(node, 0)
-                    speed = _format_speed(done, elapsed)
-                except Exception:
-                    speed = ''
-                self.status_tree.item(node, values=('success', os.path.getsize(f) if os.path.exists(f) else 0, f'{elapsed:.1f}s', '100%', speed))
+                self.transfers.finish(node, 'success')
                 self._log(f'Finished extracting {f} -> {target} ({elapsed:.1f}s)')
 
                 # open folder if requested
@@ -572,13 +524,16 @@ class FTPExplorer(tk.Tk):
             try:
                 # If the entry is a directory (we stored it ending with os.sep), compress it first
                 is_dir_entry = f.endswith(os.sep)
+                if is_dir_entry and self.stream_upload_var.get():
+                    self._upload_stream(f.rstrip(os.sep), remote_target)
+                    continue
                 if is_dir_entry:
                     folder_path = f.rstrip(os.sep)
                     base_name = os.path.basename(folder_path)
                     # Create temporary zip
                     tmp_dir = tempfile.mkdtemp()
                     zip_base = os.path.join(tmp_dir, base_name)
-                    self._log(f'Compressing folder {folder_path} -> {zip_base}.zip')
+                    self._log(f'Compressing folder {folder_path} -> {zip_base}.zip (temporary archive)')
                     archive_path = shutil.make_archive(zip_base, 'zip', folder_path)
                     upload_path = archive_path
                     remote_name = os.path.basename(archive_path)
@@ -589,12 +544,8 @@ class FTPExplorer(tk.Tk):
                     size = os.path.getsize(f)
 
                 # Add entry to status tree
-                node = self.status_tree.insert('', 'end', values=('queued', size, '0s', '', ''))
+                node = self.transfers.start(f'Upload {remote_name}', size)
                 start = time.time()
-                # initialize node byte counters
-                self._node_bytes_done[node] = 0
-                self._node_total_bytes[node] = size or 0
-                self._node_start_time[node] = start
                 self._log(f'START UPLOAD {remote_name}: {size} bytes')
                 # ensure remote target exists and change into it
                 try:
@@ -610,28 +561,7 @@ class FTPExplorer(tk.Tk):
                 self._log(f'Starting upload {upload_path} -> {remote_name} (to {remote_target})')
 
                 def progress_cb(sent, total):
-                    # update progress in treeview
-                    percent = int((sent/total)*100) if total and total > 0 else 0
-                    try:
-                        try:
-                            done = self._node_bytes_done.get(node, 0)
-                            st = self._node_start_time.get(node, start)
-                            speed = _format_speed(done, time.time()-st)
-                        except Exception:
-                            speed = ''
-                        self.status_tree.item(node, values=(self.status_tree.item(node)['values'][0], size, f'{time.time()-start:.1f}s', f'{percent}%', speed))
-                        # update bytes done for calculations
-                        try:
-                            self._node_bytes_done[node] = sent
-                        except Exception:
-                            pass
-                        # log progress changes (only when percent changes)
-                        last = self._node_progress.get(node)
-                        if last is None or percent != last:
-                            self._node_progress[node] = percent
-                            self._log(f'Upload progress {remote_name}: {percent}%')
-                    except Exception:
-                        pass
+                    self.transfers.update(node, sent, total or None, 'uploading')
 
                 # Choose protocol-specific upload
                 success = False
@@ -650,23 +580,9 @@ class FTPExplorer(tk.Tk):
                 except Exception as e:
                     self._log(f'Upload exception: {e}', error=True)
                 elapsed = time.time() - start
-                # compute average speed
-                done = self._node_bytes_done.get(node, size)
-                avg_speed = _format_speed(done, elapsed)
-                try:
-                    done = self._node_bytes_done.get(node, size)
-                    speed = _format_speed(done, elapsed)
-                except Exception:
-                    speed = ''
-                self.status_tree.item(node, values=('success' if success else 'failed', size, f'{elapsed:.1f}s', '100%', speed))
+                self.transfers.finish(node, 'success' if success else 'failed', done=size if success else None)
+                avg_speed = _format_speed(size if success else 0, elapsed)
                 self._log(f'END UPLOAD {remote_name}: {"OK" if success else "FAILED"} elapsed={elapsed:.1f}s avg={avg_speed}')
-                # cleanup node tracking
-                try:
-                    del self._node_bytes_done[node]
-                    del self._node_total_bytes[node]
-                    del self._node_start_time[node]
-                except Exception:
-                    pass
                 if not success:
                     # keep going but notify
                     self._log(f'Upload failed for {upload_path}', error=True)
@@ -682,106 +598,158 @@ class FTPExplorer(tk.Tk):
 
                     # If requested, remove the original folder after successful compression+upload
                     if is_dir_entry and success and self.auto_delete_var.get():
-                        try:
-                            shutil.rmtree(folder_path)
-                            # remove from the local listbox if present
-                            try:
-                                # entries for folders were stored with a trailing sep
-                                stored = folder_path + os.sep
-                                items = list(self.file_listbox.get(0, tk.END))
-                                if stored in items:
-                                    idx = items.index(stored)
-                                    self.file_listbox.delete(idx)
-                            except Exception:
-                                pass
-                            self._log(f'Auto-deleted original folder {folder_path} after successful upload')
-                        except Exception as ex:
-                            self._log(f'Failed to auto-delete {folder_path}: {ex}', error=True)
+                        self._auto_delete_folder(folder_path)
             except Exception as e:
                 self._log(f'Error during upload {f}: {e}', error=True)
+
+    def _auto_delete_folder(self, folder_path):
+        try:
+            shutil.rmtree(folder_path)
+            # remove from the local listbox if present
+            try:
+                # entries for folders were stored with a trailing sep
+                stored = folder_path + os.sep
+                items = list(self.file_listbox.get(0, tk.END))
+                if stored in items:
+                    idx = items.index(stored)
+                    self.file_listbox.delete(idx)
+            except Exception:
+                pass
+            self._log(f'Auto-deleted original folder {folder_path} after successful upload')
+        except Exception as ex:
+            self._log(f'Failed to auto-delete {folder_path}: {ex}', error=True)
+
+    def _upload_stream(self, folder_path, remote_target):
+        """Upload a folder as an archive that is compressed while it is sent:
+        compress.open_archive_stream writes it into a bounded in-memory pipe
+        that STOR (or the SFTP write) reads from, so compression and the
+        transfer overlap and nothing is written to disk. A stream cannot be
+        rewound, so a failed upload is not retried.
+
+        As with the temporary zip, the folder's contents are at the top of
+        the archive, not under the folder's name."""
+        fmt = self.stream_format_var.get()
+        if fmt == 'tar.zst' and not compress.has_zstd():
+            self._log('zstd not found (pip install zstandard); streaming the folder as zip')
+            fmt = 'zip'
+        remote_name = f'{os.path.basename(folder_path)}.{fmt}'
+        # progress is the folder's bytes archived; the pipe keeps it in step with the upload
+        node = self.transfers.start(f'Upload {remote_name}', 0)
+        start = time.time()
+        sent = [0]
+        self._log(f'START UPLOAD {remote_name}: streaming {folder_path} as {fmt}, no temporary archive '
+                  f'(to {remote_target})')
+
+        def log(msg):
+            if not msg.startswith('Adding '):
+                self._log(msg)
+
+        def progress(index, done, total):
+            self.transfers.update(node, done, total, 'uploading')
+
+        def count(data):  # FTP: _stor_stream callback per block
+            sent[0] += len(data)
+
+        def sftp_sent(done, total):  # SFTP: putfo callback with the running total
+            sent[0] = done
+
+        success = False
+        # 'folder/.': contents at the archive root, like shutil.make_archive(base, 'zip', folder_path)
+        pipe = compress.open_archive_stream(fmt, [os.path.join(folder_path, os.curdir)], jobs=os.cpu_count() or 1,
+                                            preset='balanced', log=log, progress=progress)
+        try:
+            if getattr(self, 'protocol', None) == 'sftp':
+                try:
+                    if remote_target and remote_target != '/' and sftp_mkdirs:
+                        sftp_mkdirs(self.sftp, remote_target)
+                except Exception:
+                    pass
+                remote_path = os.path.join(remote_target, remote_name).replace('\\', '/')
+                self.sftp.putfo(pipe, remote_path, callback=sftp_sent)
+            else:
+                try:
+                    if remote_target and remote_target != '/':
+                        ensure_remote_dirs(self.ftp, remote_target)
+                        self.ftp.cwd(remote_target)
+                except Exception as e:
+                    self._log(f'Could not ensure remote target {remote_target}: {e}', error=True)
+                self._stor_stream(remote_name, pipe, count)
+            success = True
+        except Exception as e:
+            self._log(f'Upload exception: {e}', error=True)
+        finally:
+            pipe.abort()  # stops the archiver if the upload ended early
+            if not pipe.wait(STREAM_STOP_TIMEOUT):
+                self._log(f'Archiver for {folder_path} still running after the upload ended', error=True)
+        elapsed = time.time() - start
+        self.transfers.finish(node, 'success' if success else 'failed')
+        self._log(f'END UPLOAD {remote_name}: {"OK" if success else "FAILED"} {sent[0]} bytes '
+                  f'elapsed={elapsed:.1f}s avg={_format_speed(sent[0] if success else 0, elapsed)}')
+        if success and self.auto_delete_var.get():
+            self._auto_delete_folder(folder_path)
+
+    def _stor_stream(self, remote_name, pipe, callback, blocksize=64 * 1024):
+        """storbinary() for a stream that can fail partway (`pipe` raises the
+        archiver's error): the data connection is closed and the server's
+        final reply to STOR is read either way, so it is not taken as the
+        reply to the next command on self.ftp."""
+        self.ftp.voidcmd('TYPE I')
+        conn = self.ftp.transfercmd(f'STOR {remote_name}')
+        try:
+            with conn:
+                while True:
+                    block = pipe.read(blocksize)
+                    if not block:
+                        break
+                    conn.sendall(block)
+                    callback(block)
+                if isinstance(conn, ssl.SSLSocket):  # FTPS: close the TLS layer as storbinary does
+                    conn.unwrap()
+        except Exception:
+            try:
+                self.ftp.voidresp()  # usually 426 for the cut-off transfer
+            except ftplib.all_errors:
+                pass
+            raise
+        self.ftp.voidresp()
+
     def _download_thread(self, items, local_target):
         for item in items:
             try:
                 is_dir = item.endswith('/')
                 name = item.rstrip('/') if is_dir else item
-                node = self.status_tree.insert('', 'end', values=('queued', '0', '0s', '0%', ''))
+                node = self.transfers.start(f'Download {name}')
                 start = time.time()
                 # Download file
                 if not is_dir:
                     local_path = os.path.join(local_target, name)
                     # ensure directory exists
                     os.makedirs(os.path.dirname(local_path) or local_target, exist_ok=True)
-                    sent = 0
                     total = None
                     try:
                         total = self.ftp.size(name)
                     except Exception:
                         total = None
 
-                    def cb(data):
-                        nonlocal sent
-                        try:
-                            with open(local_path, 'ab') as lf:
-                                lf.write(data)
-                        except Exception:
-                            pass
-                        sent += len(data)
-                        try:
-                            self._node_bytes_done[node] = sent
-                        except Exception:
-                            pass
-                        if total:
-                            percent = int((sent/total)*100) if total and total > 0 else 0
-                            try:
-                                try:
-                                    done = self._node_bytes_done.get(node, 0)
-                                    st = self._node_start_time.get(node, start)
-                                    speed = _format_speed(done, time.time()-st)
-                                except Exception:
-                                    speed = ''
-                                self.status_tree.item(node, values=('downloading', total, f'{time.time()-start:.1f}s', f'{percent}%', speed))
-                                # log percent changes
-                                last = self._node_progress.get(node)
-                                if last is None or percent != last:
-                                    self._node_progress[node] = percent
-                                    self._log(f'Download progress {name}: {percent}%')
-                            except Exception:
-                                pass
-
-                    # remove existing partial file
-                    try:
-                        if os.path.exists(local_path):
-                            os.remove(local_path)
-                    except Exception:
-                        pass
+                    if total:
+                        self.transfers.update(node, total=total)
 
                     try:
-                        self.ftp.retrbinary(f'RETR {name}', cb)
+                        # the local file is opened once (truncating any partial
+                        # file) rather than reopened for every block
+                        with open(local_path, 'wb') as lf:
+                            def cb(data):
+                                lf.write(data)
+                                self.transfers.advance(node, len(data), 'downloading')
+                            self.ftp.retrbinary(f'RETR {name}', cb)
                         elapsed = time.time() - start
                         size = os.path.getsize(local_path) if os.path.exists(local_path) else 0
-                        try:
-                            done = self._node_bytes_done.get(node, size)
-                            speed = _format_speed(done, elapsed)
-                        except Exception:
-                            speed = ''
-                        self.status_tree.item(node, values=('success', size, f'{elapsed:.1f}s', '100%', speed))
+                        self.transfers.finish(node, 'success', done=size)
                         avg_speed = _format_speed(size, elapsed)
                         self._log(f'END DOWNLOAD {name}: OK elapsed={elapsed:.1f}s avg={avg_speed} -> {local_path}')
-                        try:
-                            del self._node_bytes_done[node]
-                            del self._node_total_bytes[node]
-                            del self._node_start_time[node]
-                        except Exception:
-                            pass
                     except Exception as e:
-                        self.status_tree.item(node, values=('failed', 0, '0s', '0%', ''))
+                        self.transfers.finish(node, 'failed')
                         self._log(f'END DOWNLOAD {name}: FAILED {e}', error=True)
-                        try:
-                            del self._node_bytes_done[node]
-                            del self._node_total_bytes[node]
-                            del self._node_start_time[node]
-                        except Exception:
-                            pass
                 else:
                     # Recursive download for directories
                     local_dir = os.path.join(local_target, name)
@@ -789,10 +757,10 @@ class FTPExplorer(tk.Tk):
                         os.makedirs(local_dir, exist_ok=True)
                         self._download_remote_recursive(name, local_dir, node, start)
                         elapsed = time.time() - start
-                        self.status_tree.item(node, values=('success', 0, f'{elapsed:.1f}s', '100%', ''))
+                        self.transfers.finish(node, 'success')
                         self._log(f'Downloaded directory {name} -> {local_dir} ({elapsed:.1f}s)')
                     except Exception as e:
-                        self.status_tree.item(node, values=('failed', 0, '0s', '0%', ''))
+                        self.transfers.finish(node, 'failed')
                         self._log(f'Failed to download directory {name}: {e}', error=True)
             except Exception as e:
                 self._log(f'Error during download {item}: {e}', error=True)
@@ -854,23 +822,14 @@ class FTPExplorer(tk.Tk):
                     total = None
 
                 try:
+                    # the directory's status row shows the progress of the current file
+                    self.transfers.update(node, 0, total or 0, 'downloading')
                     with open(local_path, 'wb') as lf:
                         def cb(data):
                             nonlocal sent
                             lf.write(data)
                             sent += len(data)
-                            if total:
-                                percent = int((sent/total)*100) if total and total > 0 else 0
-                                try:
-                                    try:
-                                        done = self._node_bytes_done.get(node, 0)
-                                        st = self._node_start_time.get(node, start)
-                                        speed = _format_speed(done, time.time()-st)
-                                    except Exception:
-                                        speed = ''
-                                    self.status_tree.item(node, values=('downloading', total, f'{time.time()-start:.1f}s', f'{percent}%', speed))
-                                except Exception:
-                                    pass
+                            self.transfers.update(node, sent)
                         self.ftp.retrbinary(f'RETR {e}', cb)
                 except Exception as ex:
                     self._log(f'Failed to download remote file {e}: {ex}', error=True)
@@ -0,0 +1,141 @@
+"""
+Throttled progress reporting shared by compressor.py and ftp_explorer.py.
+
+Worker threads record progress in a ProgressTracker: each call updates a
+few fields under a lock and marks the task as changed, so it is cheap
+enough to call for every 8 KB chunk or FTP block. The Tk thread polls the
+tracker at a fixed rate (10 Hz by default, see poll()) and redraws only the
+tasks that changed since the previous poll. Widgets are therefore only
+touched from the Tk thread, and their cost no longer grows with the number
+of chunks transferred.
+"""
+import itertools
+import threading
+import time
+
+POLL_INTERVAL_MS = 100
+
+
+class Task:
+    """Progress of one transfer or archive item, as handed to the UI."""
+    __slots__ = ('key', 'label', 'done', 'total', 'status', 'start', 'end')
+
+    def __init__(self, key, label='', total=0, status='queued'):
+        self.key = key
+        self.label = label
+        self.done = 0
+        self.total = total or 0
+        self.status = status
+        self.start = time.time()
+        self.end = None
+
+    @property
+    def finished(self):
+        return self.end is not None
+
+    def elapsed(self):
+        return (self.end or time.time()) - self.start
+
+    def percent(self):
+        if self.total:
+            return min(100, int(self.done * 100 / self.total))
+        return 100 if self.finished else 0
+
+    def rate(self):
+        """Bytes per second so far."""
+        elapsed = self.elapsed()
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def copy(self):
+        task = Task.__new__(Task)
+        for name in Task.__slots__:
+            setattr(task, name, getattr(self, name))
+        return task
+
+
+class ProgressTracker:
+    """Thread-safe progress counters, drained by the UI thread (see poll())."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tasks = {}
+        self._changed = {}  # keys changed since the last drain, in order
+        self._ids = itertools.count(1)
+
+    def start(self, label='', total=0, status='queued', key=None):
+        """Register a task and return its key (a new int unless `key` is given)."""
+        if key is None:
+            key = next(self._ids)
+        with self._lock:
+            self._tasks[key] = Task(key, label, total, status)
+            self._changed[key] = None
+        return key
+
+    def update(self, key, done=None, total=None, status=None):
+        """Set the bytes done (and optionally total and status) of task `key`;
+        unknown keys start a new task."""
+        with self._lock:
+            task = self._tasks.get(key)
+            if task is None:
+                task = self._tasks[key] = Task(key)
+            if done is not None:
+                task.done = done
+            if total is not None:
+                task.total = total
+            if status is not None:
+                task.status = status
+            self._changed[key] = None
+
+    def advance(self, key, count, status=None):
+        """Add `count` bytes to task `key`, e.g. from a retrbinary callback."""
+        with self._lock:
+            task = self._tasks.get(key)
+            if task is None:
+                task = self._tasks[key] = Task(key)
+            task.done += count
+            if status is not None:
+                task.status = status
+            self._changed[key] = None
+
+    def finish(self, key, status='done', done=None):
+        """Mark task `key` finished. Passing `done` (the final byte count)
+        also makes it the total when none was known."""
+        with self._lock:
+            task = self._tasks.get(key)
+            if task is None:
+                task = self._tasks[key] = Task(key)
+            if done is not None:
+                task.done = done
+                task.total = task.total or done
+            task.status = status
+            task.end = time.time()
+            self._changed[key] = None
+
+    def drain(self):
+        """Copies of the tasks changed since the last call. Finished tasks
+        are forgotten once they have been returned."""
+        with self._lock:
+            changed = []
+            for key in self._changed:
+                task = self._tasks[key]
+                changed.append(task.copy())
+                if task.finished:
+                    del self._tasks[key]
+            self._changed.clear()
+        return changed
+
+
+def poll(widget, tracker, render, interval_ms=POLL_INTERVAL_MS):
+    """Every `interval_ms`, call render(task) on the Tk thread for each task
+    of `tracker` that changed, until `widget` is destroyed."""
+    def tick():
+        for task in tracker.drain():
+            try:
+                render(task)
+            except Exception:
+                pass
+        try:
+            widget.after(interval_ms, tick)
+        except Exception:
+            pass  # widget destroyed
+    widget.after(interval_ms, tick)
@@ -0,0 +1,227 @@
+"""
+Multithreaded 7z writer used by compress.py (no py7zr needed).
+
+Files are grouped in order into solid blocks (7z "folders") of up to
+`block_size` bytes. Each block is compressed as a raw LZMA2 stream on a
+thread pool (lzma releases the GIL), so a tree of many files keeps every
+core busy. A file larger than a block gets a folder of its own, split into
+`block_size` pieces that are compressed independently and concatenated
+into one LZMA2 stream, as 7-Zip's multithreaded LZMA2 does: every fresh
+encoder starts with a dictionary reset, so only the end markers between
+pieces are dropped. Files passed with method 'copy' (already compressed)
+go into Copy-coder folders instead.
+
+Blocks are written in order as they complete, at most `threads * 2` in
+flight, so the archive is the same for any thread count. The header is
+written uncompressed after the packed streams.
+"""
+import lzma
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from compress import crc32_combine
+
+SIGNATURE = b'7z\xbc\xaf\x27\x1c\x00\x04'
+DEFAULT_BLOCK_SIZE = 16 * 1024 * 1024
+PRESET_DICT_SIZES = [256 << 10, 1 << 20, 2 << 20, 4 << 20, 4 << 20, 8 << 20, 8 << 20, 16 << 20, 32 << 20, 64 << 20]
+LZMA2_ID, COPY_ID = b'\x21', b'\x00'
+
+# Property ids from 7zFormat.txt
+K_END, K_HEADER, K_MAIN_STREAMS_INFO, K_FILES_INFO = 0x00, 0x01, 0x04, 0x05
+K_PACK_INFO, K_UNPACK_INFO, K_SUBSTREAMS_INFO = 0x06, 0x07, 0x08
+K_SIZE, K_CRC, K_FOLDER, K_CODERS_UNPACK_SIZE, K_NUM_UNPACK_STREAM = 0x09, 0x0A, 0x0B, 0x0C, 0x0D
+K_EMPTY_STREAM, K_EMPTY_FILE, K_NAME, K_MTIME, K_ATTRIBUTES = 0x0E, 0x0F, 0x11, 0x14, 0x15
+
+FILE_ATTRIBUTE_DIRECTORY, FILE_ATTRIBUTE_ARCHIVE, FILE_ATTRIBUTE_UNIX_EXTENSION = 0x10, 0x20, 0x8000
+FILETIME_EPOCH = 116444736000000000  # 1601-01-01 to 1970-01-01 in 100 ns units
+
+
+def _number(n):
+    """7z variable-length UINT64: leading 1 bits in the first byte count the
+    little-endian bytes that follow it."""
+    first, mask = 0, 0x80
+    for i in range(8):
+        if n < 1 << (7 * (i + 1)):
+            first |= n >> (8 * i)
+            break
+        first |= mask
+        mask >>= 1
+    else:
+        i = 8
+    return bytes([first]) + (n & ((1 << (8 * i)) - 1)).to_bytes(i, 'little')
+
+
+def _bits(flags):
+    """Bit vector, most significant bit first."""
+    out = bytearray((len(flags) + 7) // 8)
+    for i, flag in enumerate(flags):
+        if flag:
+            out[i // 8] |= 0x80 >> (i % 8)
+    return bytes(out)
+
+
+def _property(pid, data):
+    return bytes([pid]) + _number(len(data)) + data
+
+
+def dict_size_prop(size):
+    """LZMA2 property byte for a dictionary of at least `size` bytes."""
+    for p in range(40):
+        if (2 | (p & 1)) << (p // 2 + 11) >= size:
+            return p
+    return 40
+
+
+def _plan(sizes, methods, block_size):
+    """Folders as (method, units); a unit is [(entry, offset, length), ...]
+    compressed on its own. Small files are packed into shared units, large
+    ones split; each method gets its own folders."""
+    folders = []
+    open_units = {}  # method -> (unit, size) being filled
+    for i, (size, method) in enumerate(zip(sizes, methods)):
+        if not size:
+            continue
+        if size >= block_size:
+            folders.append((method, [[(i, offset, min(block_size, size - offset))]
+                                     for offset in range(0, size, block_size)]))
+            continue
+        unit, filled = open_units.get(method, (None, 0))
+        if unit is None or filled + size > block_size:
+            unit, filled = [], 0
+            folders.append((method, [unit]))
+        unit.append((i, 0, size))
+        open_units[method] = (unit, filled + size)
+    return folders
+
+
+def _compress_unit(paths, unit, filters):
+    data = bytearray()
+    crcs = []
+    for i, offset, length in unit:
+        with open(paths[i], 'rb') as f:
+            f.seek(offset)
+            chunk = f.read(length)
+        if len(chunk) != length:
+            raise OSError(f'{paths[i]} changed while it was being archived')
+        crcs.append(zlib.crc32(chunk))
+        data += chunk
+    if filters is None:
+        return bytes(data), crcs
+    return lzma.compress(data, format=lzma.FORMAT_RAW, filters=filters), crcs
+
+
+def write_7z(out_path, entries, threads=1, block_size=DEFAULT_BLOCK_SIZE, dict_size=None, preset=9,
+             methods=None, on_entry=None, on_progress=None, on_done=None):
+    """Write `entries` [(path, arcname), ...] (files or directories) to a 7z
+    archive at `out_path`, compressing on `threads` threads.
+
+    `methods` optionally gives 'copy' or an LZMA2 preset per entry (default
+    `preset`). The dictionary defaults to the preset's, capped at
+    `block_size` since no block is larger. `on_entry(index)` is called when
+    a file's data starts being written, `on_progress(index, done, total)`
+    after each block and `on_done(index)` when the file is complete.
+    """
+    paths = [p for p, _ in entries]
+    stats = [os.stat(p) for p in paths]
+    is_dir = [os.path.isdir(p) for p in paths]
+    sizes = [0 if d else st.st_size for d, st in zip(is_dir, stats)]
+    methods = methods or [preset] * len(entries)
+    folders = _plan(sizes, methods, block_size)
+
+    filters = {}
+    for method, _ in folders:
+        if method != 'copy' and method not in filters:
+            size = dict_size or min(PRESET_DICT_SIZES[method], max(block_size, 1 << 20))
+            filters[method] = [{'id': lzma.FILTER_LZMA2, 'preset': method, 'dict_size': size}]
+
+    pack_sizes = [0] * len(folders)
+    unpack_sizes = [0] * len(folders)
+    crcs = [0] * len(entries)
+    done = [0] * len(entries)
+    tasks = ((f, u, unit, u == len(units) - 1)
+             for f, (method, units) in enumerate(folders) for u, unit in enumerate(units))
+
+    with open(out_path, 'wb') as out, ThreadPoolExecutor(max_workers=max(1, threads)) as pool:
+        out.write(b'\0' * 32)  # signature header, written last
+        pending = deque()
+        while True:
+            while len(pending) < max(1, threads) * 2:
+                task = next(tasks, None)
+                if task is None:
+                    break
+                f = task[0]
+                pending.append((task, pool.submit(_compress_unit, paths, task[2], filters.get(folders[f][0]))))
+            if not pending:
+                break
+            (f, _, unit, last), future = pending.popleft()
+            data, unit_crcs = future.result()
+            if folders[f][0] != 'copy' and not last:
+                data = data[:-1]  # drop the LZMA2 end marker between pieces of one stream
+            out.write(data)
+            pack_sizes[f] += len(data)
+            for (i, offset, length), crc in zip(unit, unit_crcs):
+                if offset == 0 and on_entry:
+                    on_entry(i)
+                crcs[i] = crc32_combine(crcs[i], crc, length) if offset else crc
+                done[i] += length
+                unpack_sizes[f] += length
+                if on_progress:
+                    on_progress(i, done[i], sizes[i])
+                if done[i] == sizes[i] and on_done:
+                    on_done(i)
+        for i, size in enumerate(sizes):
+            if not size and on_done:
+                on_done(i)
+
+        header = _header(entries, stats, is_dir, sizes, folders, filters, pack_sizes, unpack_sizes, crcs)
+        header_offset = out.tell() - 32
+        out.write(header)
+        start = struct.pack('<QQI', header_offset, len(header), zlib.crc32(header))
+        out.seek(0)
+        out.write(SIGNATURE + struct.pack('<I', zlib.crc32(start)) + start)
+
+
+def _header(entries, stats, is_dir, sizes, folders, filters, pack_sizes, unpack_sizes, crcs):
+    h = bytearray([K_HEADER])
+    if folders:
+        h += bytes([K_MAIN_STREAMS_INFO, K_PACK_INFO]) + _number(0) + _number(len(folders))
+        h += bytes([K_SIZE]) + b''.join(_number(s) for s in pack_sizes) + bytes([K_END])
+
+        h += bytes([K_UNPACK_INFO, K_FOLDER]) + _number(len(folders)) + b'\0'
+        for method, _ in folders:
+            if method == 'copy':
+                h += _number(1) + b'\x01' + COPY_ID
+            else:
+                prop = dict_size_prop(filters[method][0]['dict_size'])
+                h += _number(1) + b'\x21' + LZMA2_ID + _number(1) + bytes([prop])
+        h += bytes([K_CODERS_UNPACK_SIZE]) + b''.join(_number(s) for s in unpack_sizes) + bytes([K_END])
+
+        # Substreams: the files of each folder, in order
+        files = [[i for unit in units for i, offset, _ in unit if offset == 0] for _, units in folders]
+        h += bytes([K_SUBSTREAMS_INFO, K_NUM_UNPACK_STREAM]) + b''.join(_number(len(f)) for f in files)
+        h += bytes([K_SIZE]) + b''.join(_number(sizes[i]) for f in files for i in f[:-1])
+        h += bytes([K_CRC, 1]) + b''.join(struct.pack('<I', crcs[i]) for f in files for i in f)
+        h += bytes([K_END, K_END])
+        order = [i for f in files for i in f]
+    else:
+        order = []
+    # Files with data first, in stream order, then directories and empty files
+    order += [i for i, size in enumerate(sizes) if not size]
+
+    h += bytes([K_FILES_INFO]) + _number(len(order))
+    empty = [not sizes[i] for i in order]
+    if any(empty):
+        h += _property(K_EMPTY_STREAM, _bits(empty))
+        h += _property(K_EMPTY_FILE, _bits([not is_dir[i] for i in order if not sizes[i]]))
+    names = b''.join(entries[i][1].replace(os.sep, '/').encode('utf-16-le') + b'\0\0' for i in order)
+    h += _property(K_NAME, b'\0' + names)
+    h += _property(K_MTIME, b'\x01\0' + b''.join(
+        struct.pack('<Q', stats[i].st_mtime_ns // 100 + FILETIME_EPOCH) for i in order))
+    h += _property(K_ATTRIBUTES, b'\x01\0' + b''.join(struct.pack('<I', (
+        (FILE_ATTRIBUTE_DIRECTORY if is_dir[i] else FILE_ATTRIBUTE_ARCHIVE)
+        | FILE_ATTRIBUTE_UNIX_EXTENSION | (stats[i].st_mode & 0xFFFF) << 16)) for i in order))
+    h += bytes([K_END, K_END])
+    return bytes(h)
@@ -0,0 +1,181 @@
+"""
+ZIP extraction with progress callbacks, used by ftp_explorer.py.
+
+unzip_file_with_progress() extracts member by member, reporting bytes and
+per-file outcomes; with jobs > 1 a thread pool extracts batches of members
+(see _unzip_parallel) with the same result as the serial loop.
+"""
+import os
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+
+def unzip_file_with_progress(zip_path, target_dir, overwrite=False, progress_callback=None, file_callback=None,
+                             jobs=1):
+    """Extract zip_path into target_dir streaming member files and calling callbacks.
+
+    progress_callback(done_bytes, total_bytes)
+    file_callback(action, path)  # action in {'extracted','skipped','error'}
+
+    With jobs > 1 members are extracted by a thread pool (see _unzip_parallel);
+    callbacks are then called from the worker threads.
+    """
+    if jobs > 1:
+        return _unzip_parallel(zip_path, target_dir, overwrite, progress_callback, file_callback, jobs)
+    CHUNK = 64 * 1024
+    total_bytes = 0
+    with zipfile.ZipFile(zip_path, 'r') as zf:
+        infos = [info for info in zf.infolist() if not info.is_dir()]
+        for info in infos:
+            total_bytes += info.file_size
+
+        done = 0
+        for info in infos:
+            member_path = info.filename
+            dest_path = os.path.join(target_dir, *member_path.split('/'))
+            # ensure directories
+            if info.is_dir():
+                os.makedirs(dest_path, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+
+            if os.path.exists(dest_path) and not overwrite:
+                done += info.file_size
+                if file_callback:
+                    try:
+                        file_callback('skipped', dest_path)
+                    except Exception:
+                        pass
+                if progress_callback:
+                    try:
+                        progress_callback(done, total_bytes)
+                    except Exception:
+                        pass
+                continue
+
+            try:
+                with zf.open(info, 'r') as src, open(dest_path, 'wb') as dst:
+                    while True:
+                        chunk = src.read(CHUNK)
+                        if not chunk:
+                            break
+                        dst.write(chunk)
+                        done += len(chunk)
+                        if progress_callback:
+                            try:
+                                progress_callback(done, total_bytes)
+                            except Exception:
+                                pass
+                if file_callback:
+                    try:
+                        file_callback('extracted', dest_path)
+                    except Exception:
+                        pass
+            except Exception as ex:
+                if file_callback:
+                    try:
+                        file_callback('error', dest_path)
+                    except Exception:
+                        pass
+                # continue with next file
+                continue
+
+
+UNZIP_BATCH_BYTES = 64 * 1024 * 1024  # a worker task extracts members until it has this many bytes...
+UNZIP_BATCH_FILES = 256  # ...or this many files
+
+
+def _unzip_parallel(zip_path, target_dir, overwrite, progress_callback, file_callback, jobs):
+    """Parallel unzip_file_with_progress.
+
+    The parent directories of all members are created once up front, so
+    there is no makedirs call per member; directory entries themselves are
+    skipped, as in the serial loop. Members are then split, in archive
+    order, into batches of up to UNZIP_BATCH_FILES files or
+    UNZIP_BATCH_BYTES bytes that `jobs` threads extract, each thread with
+    its own ZipFile handle (zlib and file I/O release the GIL). Members
+    stored more than once under the same name (ignoring case) stay in one
+    batch, in archive order, and each is checked for an existing file just
+    before it is written, so they are handled exactly as the serial loop
+    would.
+    Bytes done are summed across workers under a lock.
+    """
+    CHUNK = 1024 * 1024
+
+    def notify(callback, *args):
+        if callback:
+            try:
+                callback(*args)
+            except Exception:
+                pass
+
+    with zipfile.ZipFile(zip_path, 'r') as zf:
+        infos = zf.infolist()
+    members = sorted((info for info in infos if not info.is_dir()), key=lambda info: info.header_offset)
+    total_bytes = sum(info.file_size for info in members)
+
+    # lowercased dest -> [(info, dest), ...] in archive order; names that only differ in case are the
+    # same file on Windows and macOS, so they go to the same worker too
+    groups = {}
+    for info in members:
+        dest = os.path.join(target_dir, *info.filename.split('/'))
+        groups.setdefault(dest.lower(), []).append((info, dest))
+    for d in sorted({os.path.dirname(group[0][1]) for group in groups.values()}):
+        os.makedirs(d, exist_ok=True)
+
+    lock = threading.Lock()
+    done = [0]
+
+    def advance(count):
+        with lock:
+            done[0] += count
+            notify(progress_callback, done[0], total_bytes)
+
+    local = threading.local()
+    handles = []
+
+    def archive():
+        zf = getattr(local, 'zf', None)
+        if zf is None:
+            zf = local.zf = zipfile.ZipFile(zip_path, 'r')
+            with lock:
+                handles.append(zf)
+        return zf
+
+    def extract(batch):
+        zf = archive()
+        for info, dest in batch:
+            if os.path.exists(dest) and not overwrite:
+                advance(info.file_size)
+                notify(file_callback, 'skipped', dest)
+                continue
+            try:
+                with zf.open(info, 'r') as src, open(dest, 'wb') as dst:
+                    while True:
+                        chunk = src.read(CHUNK)
+                        if not chunk:
+                            break
+                        dst.write(chunk)
+                        advance(len(chunk))
+                notify(file_callback, 'extracted', dest)
+            except Exception:
+                notify(file_callback, 'error', dest)
+
+    batches, batch, batch_bytes = [], [], 0
+    for group in groups.values():
+        size = sum(info.file_size for info, _ in group)
+        if batch and (len(batch) >= UNZIP_BATCH_FILES or batch_bytes + size > UNZIP_BATCH_BYTES):
+            batches.append(batch)
+            batch, batch_bytes = [], 0
+        batch.extend(group)
+        batch_bytes += size
+    if batch:
+        batches.append(batch)
+    try:
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            for _ in pool.map(extract, batches):
+                pass
+    finally:
+        for zf in handles:
+            zf.close()